@@ -10,9 +10,24 @@ from tqdm import tqdm
 import json
 import urllib.parse
 import random
-import cv2
-import numpy as np
 import argparse
+import itertools
+import threading
+from concurrent.futures import wait
+from debug_capture import save_error_page, flush_debug_captures
+from resilience import fetch
+import proxy_pool
+import drivers
+import url_index
+from profiler import set_stage, start_profiling, stop_profiling
+from manifest import record_candidate, record_candidates, content_hash, flush_manifest
+from governor import yield_browser, submit_download
+from incremental import ResultTracker, DEFAULT_STOP_AFTER_KNOWN
+from quality import image_info, score_image_data, check_image, ledger_fields
+from prefilter import parse_baidu_detail_link, filter_candidates, save_skipped_candidates, log_skip_summary
+
+# 接收规则（quality.check_image的参数）：下载和复用全局URL索引中的文件都按此检查，实际宽高小于min_size的保存到invalid目录
+ACCEPT_RULES = {'min_size': (512, 512)}
 
 # 创建必要的目录
 def create_directories():
@@ -59,6 +74,9 @@ session.headers.update({
     'Connection': 'keep-alive'
 })
 
+# 下载记录文件的读改写锁
+_records_lock = threading.Lock()
+
 def load_downloaded_urls(keyword):
     """加载已下载的URL记录"""
     record_file = f"records/baidu_{keyword}_downloads.json"
@@ -71,50 +89,35 @@ def load_downloaded_urls(keyword):
             return {}
     return {}
 
-def save_downloaded_url(keyword, url, filename):
-    """保存已下载的URL记录"""
+def save_downloaded_url(keyword, url, filename, source_url=None):
+    """保存已下载的URL记录，以详情页的图片地址为键；source_url为搜索结果中的原图地址，
+    预过滤按它判断是否已下载。常驻服务中同一关键词的任务可能并发写入，读改写需要加锁"""
     record_file = f"records/baidu_{keyword}_downloads.json"
-    records = load_downloaded_urls(keyword)
-    
-    records[url] = {
-        'filename': filename,
-        'download_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    
-    try:
-        with open(record_file, 'w', encoding='utf-8') as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logging.error(f"保存下载记录失败: {e}")
+    with _records_lock:
+        records = load_downloaded_urls(keyword)
 
-def save_error_page(driver, url, error_type):
-    """保存错误页面的HTML内容"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # 保存HTML
-    html_filename = f"debug_html/error_{error_type}_{timestamp}.html"
-    with open(html_filename, 'w', encoding='utf-8') as f:
-        f.write(driver.page_source)
-    
-    # 保存截图
-    screenshot_filename = f"debug_html/error_{error_type}_{timestamp}.png"
-    driver.save_screenshot(screenshot_filename)
-    
-    logging.error(f"页面保存成功 - HTML: {html_filename}, 截图: {screenshot_filename}")
-    logging.error(f"问题URL: {url}")
+        records[url] = {
+            'filename': filename,
+            'source_url': source_url,
+            'download_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+        try:
+            with open(record_file, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logging.error(f"保存下载记录失败: {e}")
 
-def download_image(url, timeout=10):
-    """下载图片并返回内容和大小"""
+def download_image(url, timeout=10, alternates=None):
+    """下载图片并返回内容和大小，主机过慢时对备用URL发起对冲请求"""
     start_time = time.time()
     try:
-        response = session.get(url, timeout=timeout, stream=True)
-        response.raise_for_status()
+        content, used_url = fetch(url, alternates, session=session, timeout=timeout)
+        if used_url != url:
+            logging.info(f"使用备用URL下载成功: {used_url}")
         
         # 获取文件大小
-        total_size = int(response.headers.get('content-length', 0))
-        
-        # 读取内容
-        content = response.content
+        total_size = len(content)
         
         # 计算下载速度
         download_time = time.time() - start_time
@@ -125,12 +128,123 @@ def download_image(url, timeout=10):
         logging.error(f"下载图片失败: {url}, 错误: {e}")
         raise
 
-def download_images_from_baidu(keyword, num_images):
+def upcoming_detail_urls(candidates, index):
+    """当前及接下来要打开的详情页，用于预取；URL索引会复用的候选不打开详情页，不预取"""
+    upcoming = (c['detail_url'] for c in candidates[index + 1:] if url_index.lookup(c['source_url']) is None)
+    return [candidates[index]['detail_url']] + list(itertools.islice(upcoming, drivers.MAX_PREFETCH_TABS - 1))
+
+def reuse_indexed_image(keyword, url, candidate, base_dir):
+    """全局URL索引命中时直接链接已存储的图片，返回文件名；未命中返回None"""
+    if url_index.lookup(url) is None:
+        return None
+    filename = f"{int(time.time())}_{random.randint(1000, 9999)}.jpg"
+    entry = url_index.materialize(url, 'baidu', keyword, os.path.join(base_dir, filename), ACCEPT_RULES)
+    if entry is None:
+        return None
+    save_downloaded_url(keyword, url, filename, candidate['source_url'])
+    record_candidate('baidu', keyword, candidate, source_url=url, content_hash=entry['content_hash'],
+                     width=entry['width'], height=entry['height'], format=entry['format'],
+                     byte_size=entry['byte_size'], filename=filename, **ledger_fields(entry['score']))
+    return filename
+
+def download_and_save(keyword, img_url, candidate, base_dir, invalid_dir, tracker):
+    """下载、校验并保存一张图片，在下载线程池中执行；返回 {'size': 字节数}，下载失败时返回None"""
+    try:
+        set_stage('download')
+        img_data, size, speed, download_time = download_image(img_url, alternates=[candidate['source_url']])
+
+        set_stage('validate')
+        # 尺寸从文件头读取，质量指标在低分辨率解码的缩略图上计算，不做完整解码
+        width, height, fmt = image_info(img_data)
+        score = score_image_data(img_data)
+        if width is None or score is None:
+            raise Exception("无法解码图片")
+
+        # 生成文件名：unix时间戳 + 随机数
+        timestamp = int(time.time())
+        random_num = random.randint(1000, 9999)
+        filename = f"{timestamp}_{random_num}.jpg"
+
+        # 根据尺寸和质量决定保存位置
+        rejection_reason = check_image(score, width, height, **ACCEPT_RULES)
+        if rejection_reason is None:
+            filepath = os.path.join(base_dir, filename)
+        else:
+            filepath = os.path.join(invalid_dir, filename)
+            logging.info(f"图片不符合要求 ({rejection_reason})，保存到invalid目录")
+
+        set_stage('write')
+        with open(filepath, "wb") as f:
+            f.write(img_data)
+
+        set_stage('record')
+        # 保存下载记录
+        save_downloaded_url(keyword, img_url, filename, candidate['source_url'])
+        img_hash = content_hash(img_data)
+        record_candidate('baidu', keyword, candidate, source_url=img_url,
+                         content_hash=img_hash, width=width, height=height, format=fmt,
+                         byte_size=size, rejection_reason=rejection_reason, filename=filename,
+                         **ledger_fields(score))
+        tracker.mark_evaluated(candidate)
+        if rejection_reason is None:
+            url_index.register([img_url, candidate['source_url']], filepath, img_hash, size,
+                               'baidu', keyword, filename, width, height)
+
+        logging.info(f"图片 {filename} 下载成功 - 大小: {size/1024:.1f}KB, 速度: {speed:.2f}MB/s, 耗时: {download_time:.2f}秒")
+        return {'size': size}
+    except Exception as e:
+        # 下载在后台线程进行，浏览器已经在处理其他详情页，不再保存页面
+        logging.error(f"下载图片失败: {img_url}, 错误: {e}")
+        record_candidate('baidu', keyword, candidate, source_url=img_url, rejection_reason='download_failed')
+        return None
+
+def setup_driver(proxy=None):
+    """设置并返回WebDriver，指定代理出口时通过该出口访问"""
+    chrome_options = Options()
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--no-sandbox')
+    if proxy is not None:
+        chrome_options.add_argument(proxy_pool.chrome_argument(proxy))
+
+    if drivers.get_backend() == 'cdp':
+        return drivers.CDPDriver(chrome_options.arguments)
+    return webdriver.Chrome(options=chrome_options)
+
+def _detail_hrefs(driver):
+    """一次脚本调用取回页面中所有图片详情链接，不逐个元素往返"""
+    return driver.execute_script(
+        "return Array.from(document.querySelectorAll('a[href]'), a => a.href).filter(h => h.startsWith(arguments[0]));",
+        "https://image.baidu.com/search/detail",
+    ) or []
+
+def count_detail_links(driver):
+    return len(set(_detail_hrefs(driver)))
+
+def extract_detail_links(driver):
+    """提取页面中的图片详情链接，按页面顺序去重"""
+    detail_links = _detail_hrefs(driver)
+    logging.debug(f"共找到 {len(detail_links)} 个详情链接")
+
+    # 去重
+    seen = set()
+    unique_links = []
+    for link in detail_links:
+        if link not in seen:
+            unique_links.append(link)
+            seen.add(link)
+    return unique_links
+
+def download_images_from_baidu(keyword, num_images, driver=None, progress=None, session_key=None, configure_logging=True,
+                               incremental=False, stop_after_known=DEFAULT_STOP_AFTER_KNOWN):
+    """driver为预热好的浏览器时直接复用且结束后不关闭；progress为进度回调，接收事件字典；
+    incremental为True时连续遇到stop_after_known个上次已处理的结果就停止滚动，并跳过这些结果"""
     # 创建必要的目录
     create_directories()
     
     # 设置日志
-    setup_logging(keyword)
+    if configure_logging:
+        setup_logging(keyword)
     
     start_time = time.time()
     logging.info(f"开始下载关键词 '{keyword}' 的图片，目标数量: {num_images}")
@@ -139,12 +253,6 @@ def download_images_from_baidu(keyword, num_images):
     downloaded_urls = load_downloaded_urls(keyword)
     logging.info(f"已下载图片数量: {len(downloaded_urls)}")
     
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--disable-gpu')
-    chrome_options.add_argument('--no-sandbox')
-
-    driver = webdriver.Chrome(options=chrome_options)
     base_dir = f"downloads/baidu_{keyword}"
     invalid_dir = os.path.join(base_dir, "invalid")
     os.makedirs(base_dir, exist_ok=True)
@@ -153,51 +261,111 @@ def download_images_from_baidu(keyword, num_images):
 
     search_url = f"https://image.baidu.com/search/index?tn=baiduimage&word={urllib.parse.quote(keyword)}"
     logging.debug(f"访问搜索页面: {search_url}")
-    driver.get(search_url)
-    time.sleep(2)
+    session_key = session_key or f"baidu-{keyword}"
+    set_stage('navigate')
+    warm_driver = driver
+    if warm_driver is None:
+        driver = proxy_pool.open_with_rotation(setup_driver, session_key, search_url)
+    else:
+        proxy_pool.throttle(proxy_pool.session_exit(session_key))
+        driver.get(search_url)
+        if proxy_pool.is_ban_page(driver):
+            driver = proxy_pool.handle_ban(driver, setup_driver, session_key, search_url)
+    # 第一批结果出现就继续，不固定等待
+    drivers.wait_for_results(driver, count_detail_links, 0, 2)
 
-    # 模拟滚动加载内容
+    tracker = ResultTracker('baidu', keyword, incremental, stop_after_known)
+    set_stage('extract')
+    unique_links = extract_detail_links(driver)
+    set_stage('scroll')
+    # 模拟滚动加载内容，已加载的候选够用时不再滚动
     logging.info("开始滚动页面加载更多图片...")
     scroll_start = time.time()
     for i in range(10):
+        candidates = [parse_baidu_detail_link(link) for link in unique_links]
+        if incremental and tracker.add(candidates):
+            # 增量模式每次滚动前对比结果流，连续遇到足够多已知结果时不再向下翻页
+            logging.info(f"连续遇到 {tracker.consecutive_known} 个上次已处理的结果，停止滚动")
+            break
+        usable, _ = filter_candidates(tracker.select(candidates), downloaded_urls)
+        if len(usable) >= num_images:
+            logging.info(f"已加载 {len(usable)} 个可用候选，满足目标数量，停止滚动")
+            break
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(1.5)
+        drivers.wait_for_results(driver, count_detail_links, len(unique_links), 1.5)
+        set_stage('extract')
+        unique_links = extract_detail_links(driver)
+        set_stage('scroll')
+        tracker.scrolls = i + 1
         logging.debug(f"完成第 {i+1}/10 次滚动")
     logging.info(f"页面滚动完成，耗时: {time.time() - scroll_start:.2f}秒")
 
-    # 获取所有 a 标签
-    logging.debug("开始提取图片详情链接...")
-    links = driver.find_elements(By.TAG_NAME, "a")
-    detail_links = []
-    for a in links:
-        href = a.get_attribute("href")
-        if href and href.startswith("https://image.baidu.com/search/detail"):
-            detail_links.append(href)
+    set_stage('extract')
+    logging.info(f"去重后剩余 {len(unique_links)} 个链接")
 
-    logging.info(f"共找到 {len(detail_links)} 个详情链接")
+    # 根据详情链接中的元数据预过滤，已知会被拒绝的候选不访问详情页
+    candidates = [parse_baidu_detail_link(link) for link in unique_links]
+    tracker.add(candidates)
+    candidates = tracker.select(candidates)
+    candidates, skipped = filter_candidates(candidates, downloaded_urls)
+    for candidate in skipped:
+        tracker.mark_evaluated(candidate)
+    log_skip_summary(skipped)
+    save_skipped_candidates('baidu', keyword, skipped)
+    record_candidates('baidu', keyword, skipped)
+    selected = candidates[:num_images]
 
-    # 去重并限制数量
-    seen = set()
-    filtered_links = []
-    for link in detail_links:
-        if link not in seen:
-            filtered_links.append(link)
-            seen.add(link)
-        if len(filtered_links) >= num_images:
-            break
-
-    logging.info(f"去重后剩余 {len(filtered_links)} 个链接")
+    logging.info(f"预过滤后剩余 {len(selected)} 个链接")
+    if progress:
+        progress({'event': 'candidates', 'keyword': keyword, 'total': len(selected), 'skipped': len(skipped)})
 
     image_count = 0
     total_download_size = 0
-    with tqdm(total=len(filtered_links), desc="下载进度") as pbar:
-        for url in filtered_links:
+    pending = set()
+    submitted_urls = set()
+
+    def collect(finished):
+        """在爬取线程中汇总已完成的下载，更新计数和进度"""
+        nonlocal image_count, total_download_size, pending
+        done, pending = finished
+        for future in done:
+            pbar.update(1)
+            result = future.result()
+            if result is None:
+                continue
+            total_download_size += result['size']
+            image_count += 1
+            if progress:
+                progress({'event': 'image', 'keyword': keyword, 'count': image_count})
+            # 更新进度条描述，显示预计剩余时间
+            avg_time = (time.time() - start_time) / image_count
+            remaining = avg_time * (len(selected) - image_count)
+            pbar.set_description(f"下载进度 (预计剩余: {remaining:.1f}秒)")
+
+    with tqdm(total=len(selected), desc="下载进度") as pbar:
+        for index, candidate in enumerate(selected):
+            # 资源调度降低了浏览器上限时，在两个条目之间关闭浏览器并暂停
+            driver = yield_browser(driver, lambda: proxy_pool.launch(setup_driver, session_key))
+            url = candidate['detail_url']
+            # 全局URL索引命中时不访问详情页也不下载
+            if reuse_indexed_image(keyword, candidate['source_url'], candidate, base_dir):
+                tracker.mark_evaluated(candidate)
+                image_count += 1
+                if progress:
+                    progress({'event': 'image', 'keyword': keyword, 'count': image_count})
+                pbar.update(1)
+                continue
             try:
                 download_start = time.time()
+                set_stage('navigate')
+                # CDP后端在后台标签中并行加载接下来的详情页，每个页面导航前都按出口的速率预算等待
+                drivers.prefetch(driver, upcoming_detail_urls(selected, index),
+                                 lambda: proxy_pool.throttle(proxy_pool.session_exit(session_key)))
                 driver.get(url)
-                time.sleep(2)
+                drivers.wait_for_element(driver, By.CSS_SELECTOR, "img[title='点击查看图片来源']", 2)
 
                 try:
+                    set_stage('extract')
                     # 使用title属性定位图片元素
                     img_element = driver.find_element(By.CSS_SELECTOR, "img[title='点击查看图片来源']")
                     
@@ -223,70 +391,76 @@ def download_images_from_baidu(keyword, num_images):
                 except Exception as e:
                     logging.error(f"无法找到图片元素: {e}")
                     save_error_page(driver, url, "no_image_element")
+                    record_candidate('baidu', keyword, candidate, rejection_reason='no_image_element')
+                    if proxy_pool.is_ban_page(driver):
+                        driver = proxy_pool.handle_ban(driver, setup_driver, session_key, search_url)
                     pbar.update(1)
                     continue
 
                 if img_url and img_url.startswith("http"):
                     # 检查是否已下载
-                    if img_url in downloaded_urls:
+                    if img_url in downloaded_urls or img_url in submitted_urls:
                         logging.debug(f"跳过已下载的图片: {img_url}")
+                        tracker.mark_evaluated(candidate)
                         pbar.update(1)
                         continue
 
-                    try:
-                        img_data, size, speed, download_time = download_image(img_url)
-                        
-                        # 使用OpenCV检查图片尺寸
-                        nparr = np.frombuffer(img_data, np.uint8)
-                        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                        if img is None:
-                            raise Exception("无法解码图片")
-                        height, width = img.shape[:2]
-                        
-                        # 生成文件名：unix时间戳 + 随机数
-                        timestamp = int(time.time())
-                        random_num = random.randint(1000, 9999)
-                        filename = f"{timestamp}_{random_num}.jpg"
-                        
-                        # 根据尺寸决定保存位置
-                        if width >= 512 and height >= 512:
-                            filepath = os.path.join(base_dir, filename)
-                        else:
-                            filepath = os.path.join(invalid_dir, filename)
-                            logging.info(f"图片尺寸不符合要求 ({width}x{height})，保存到invalid目录")
-                        
-                        with open(filepath, "wb") as f:
-                            f.write(img_data)
-                        
-                        # 保存下载记录
-                        save_downloaded_url(keyword, img_url, filename)
-                        
-                        total_download_size += size
-                        logging.info(f"图片 {filename} 下载成功 - 大小: {size/1024:.1f}KB, 速度: {speed:.2f}MB/s, 耗时: {download_time:.2f}秒")
+                    if reuse_indexed_image(keyword, img_url, candidate, base_dir):
+                        tracker.mark_evaluated(candidate)
                         image_count += 1
-                        pbar.update(1)
-                        # 更新进度条描述，显示预计剩余时间
-                        avg_time = (time.time() - start_time) / image_count
-                        remaining = avg_time * (len(filtered_links) - image_count)
-                        pbar.set_description(f"下载进度 (预计剩余: {remaining:.1f}秒)")
-                    except Exception as e:
-                        logging.error(f"下载图片失败: {e}")
-                        save_error_page(driver, url, "download_failed")
+                        if progress:
+                            progress({'event': 'image', 'keyword': keyword, 'count': image_count})
                         pbar.update(1)
                         continue
 
+                    # 下载、校验和保存交给下载线程池，浏览器继续处理下一个详情页
+                    submitted_urls.add(img_url)
+                    pending.add(submit_download(download_and_save, keyword, img_url, candidate, base_dir, invalid_dir, tracker))
+                    collect(wait(pending, timeout=0))
+
             except Exception as e:
                 logging.error(f"处理页面失败：{url}，原因：{e}")
                 save_error_page(driver, url, "page_error")
+                record_candidate('baidu', keyword, candidate, rejection_reason='page_error')
                 pbar.update(1)
                 continue
 
-    driver.quit()
+        # 等待还在进行的下载
+        collect(wait(pending))
+
+    drivers.close_prefetched(driver)
+    # 预热的浏览器交还给调用方；遇到封禁时换出的新浏览器由这里关闭
+    if driver is not warm_driver:
+        driver.quit()
+    if warm_driver is None:
+        proxy_pool.release(session_key)
+    flush_debug_captures()
+    flush_manifest()
     total_time = time.time() - start_time
+    tracker.save(image_count, total_time)
     avg_speed = total_download_size / (1024 * 1024 * total_time) if total_time > 0 else 0
     logging.info(f"下载完成！共下载 {image_count} 张图片，总大小: {total_download_size/1024/1024:.1f}MB")
     logging.info(f"总耗时: {total_time:.2f}秒，平均下载速度: {avg_speed:.2f}MB/s")
     logging.info(f"图片保存在目录：{base_dir}/")
+    if progress:
+        progress({'event': 'done', 'keyword': keyword, 'downloaded': image_count, 'seconds': round(total_time, 2)})
+    return {'keyword': keyword, 'downloaded': image_count, 'total_size': total_download_size, 'seconds': total_time}
 
 if __name__ == "__main__":
-    download_images_from_baidu("soil", 1000) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='百度图片爬虫')
+    parser.add_argument('--keyword', default='soil', help='要搜索的关键词')
+    parser.add_argument('--num_images', type=int, default=1000, help='要下载的图片数量')
+    parser.add_argument('--profile', action='store_true', help='开启采样性能分析，结束时输出火焰图和热点报告')
+    parser.add_argument('--driver', choices=drivers.BACKENDS, default='selenium', help='浏览器驱动后端')
+    parser.add_argument('--incremental', action='store_true', help='增量爬取，遇到上次已处理的结果后停止翻页')
+    parser.add_argument('--stop_after_known', type=int, default=DEFAULT_STOP_AFTER_KNOWN, help='增量爬取时连续遇到多少个已知结果后停止')
+    args = parser.parse_args()
+
+    drivers.set_backend(args.driver)
+    if args.profile:
+        start_profiling('baidu_crawler')
+    try:
+        download_images_from_baidu(args.keyword, args.num_images, incremental=args.incremental, stop_after_known=args.stop_after_known)
+    finally:
+        if args.profile:
+            stop_profiling()
@@ -12,9 +12,28 @@ from selenium.webdriver.chrome.options import Options
 from tqdm import tqdm
 import json
 import io
+import argparse
 import re
+import itertools
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from debug_capture import save_error_page, flush_debug_captures
+from resilience import fetch
+import proxy_pool
+import drivers
+import url_index
+from profiler import set_stage, start_profiling, stop_profiling
+from manifest import record_candidate, record_candidates, content_hash, flush_manifest
+from governor import yield_browser, submit_download
+from incremental import ResultTracker, DEFAULT_STOP_AFTER_KNOWN
+from quality import image_info, score_image_data, check_image, ledger_fields
+from prefilter import BROKEN_URL_PATTERNS, parse_bing_detail_link, filter_candidates, save_skipped_candidates, log_skip_summary
+
+# 接收规则（quality.check_image的参数）：下载和复用全局URL索引中的文件都按此检查；
+# 尺寸由预过滤按搜索结果的元数据检查，下载后只检查质量
+ACCEPT_RULES = {'min_size': None}
 
 # 创建必要的目录
 def create_directories():
@@ -51,6 +70,14 @@ def setup_logging(keyword):
     )
     print(f"日志文件: {log_filename}")
 
+# 创建全局session对象，复用连接池
+session = requests.Session()
+
+# 下载记录文件的读改写锁
+_records_lock = threading.Lock()
+# 序号文件名的选取和创建锁
+_files_lock = threading.Lock()
+
 def load_downloaded_urls(keyword):
     """加载已下载的URL记录"""
     record_file = f"records/bing_{keyword}_downloads.json"
@@ -63,37 +90,24 @@ def load_downloaded_urls(keyword):
             return {}
     return {}
 
-def save_downloaded_url(keyword, url, filename):
-    """保存已下载的URL记录"""
+def save_downloaded_url(keyword, url, filename, source_url=None):
+    """保存已下载的URL记录，以详情页的图片地址为键；source_url为搜索结果中的原图地址，
+    预过滤按它判断是否已下载。常驻服务中同一关键词的任务可能并发写入，读改写需要加锁"""
     record_file = f"records/bing_{keyword}_downloads.json"
-    records = load_downloaded_urls(keyword)
-    
-    records[url] = {
-        'filename': filename,
-        'download_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    
-    try:
-        with open(record_file, 'w', encoding='utf-8') as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logging.error(f"保存下载记录失败: {e}")
+    with _records_lock:
+        records = load_downloaded_urls(keyword)
 
-def save_error_page(driver, url, error_type):
-    """保存错误页面的HTML内容"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # 保存HTML
-    html_filename = f"debug_html/error_{error_type}_{timestamp}.html"
-    with open(html_filename, 'w', encoding='utf-8') as f:
-        f.write(driver.page_source)
-    
-    # 保存截图
-    screenshot_filename = f"debug_html/error_{error_type}_{timestamp}.png"
-    driver.save_screenshot(screenshot_filename)
-    
-    logging.error(f"页面保存成功 - HTML: {html_filename}, 截图: {screenshot_filename}")
-    logging.error(f"问题URL: {url}")
+        records[url] = {
+            'filename': filename,
+            'source_url': source_url,
+            'download_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+        try:
+            with open(record_file, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logging.error(f"保存下载记录失败: {e}")
 
 def get_image_size_from_headers(url, timeout=10):
     """从图片URL的headers中获取图片尺寸"""
@@ -144,53 +158,122 @@ def is_valid_image(url, min_size=(512, 512), timeout=10):
 
 def is_broken_image(url):
     """检查是否是裂图URL"""
-    broken_patterns = [
-        r'https://th\.bing\.com/th/id/.*\?cb=iwp2',
-        r'https://th\.bing\.com/th/id/.*\?rs=1',
-        r'https://th\.bing\.com/th/id/.*\?pid=ImgDetMain'
-    ]
-    return any(re.search(pattern, url) for pattern in broken_patterns)
-
-def download_image(url, timeout=10, max_retries=3):
-    """下载图片并返回内容和大小"""
+    return any(re.search(pattern, url) for pattern in BROKEN_URL_PATTERNS)
+
+def download_image(url, timeout=10, max_retries=3, alternates=None):
+    """下载图片并返回内容和大小，主机过慢时对备用URL发起对冲请求，失败时退避重试"""
     start_time = time.time()
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            logging.info(f"开始下载图片: {url} (尝试 {retry_count + 1}/{max_retries})")
-            response = requests.get(url, timeout=timeout, stream=True)
-            response.raise_for_status()
-            
-            # 获取文件大小
-            total_size = int(response.headers.get('content-length', 0))
-            
-            # 读取内容
-            content = response.content
-            
-            # 计算下载速度
-            download_time = time.time() - start_time
-            speed = total_size / (1024 * 1024 * download_time) if download_time > 0 else 0  # MB/s
-            
-            logging.info(f"图片下载成功: {url}, 大小: {total_size/1024:.1f}KB, 速度: {speed:.2f}MB/s")
-            return content, total_size, speed, download_time
-        except Exception as e:
-            retry_count += 1
-            if retry_count < max_retries:
-                logging.warning(f"下载失败，准备重试 ({retry_count}/{max_retries}): {url}, 错误: {e}")
-                time.sleep(1)  # 等待1秒后重试
-            else:
-                logging.error(f"下载图片失败，已达到最大重试次数: {url}, 错误: {e}")
-                raise
-
-def setup_driver():
-    """设置并返回WebDriver"""
+    try:
+        logging.info(f"开始下载图片: {url}")
+        content, used_url = fetch(url, alternates, session=session, timeout=timeout, max_attempts=max_retries)
+        
+        # 获取文件大小
+        total_size = len(content)
+        
+        # 计算下载速度
+        download_time = time.time() - start_time
+        speed = total_size / (1024 * 1024 * download_time) if download_time > 0 else 0  # MB/s
+        
+        logging.info(f"图片下载成功: {used_url}, 大小: {total_size/1024:.1f}KB, 速度: {speed:.2f}MB/s")
+        return content, total_size, speed, download_time
+    except Exception as e:
+        logging.error(f"下载图片失败，已达到最大重试次数: {url}, 错误: {e}")
+        raise
+
+def next_free_filename(base_dir, start):
+    """从start开始找第一个未被占用的序号文件名，避免覆盖之前运行保存的图片；
+    并发的下载需要在_files_lock内选名并创建文件"""
+    index = start
+    while os.path.exists(os.path.join(base_dir, f"{index}.jpg")):
+        index += 1
+    return f"{index}.jpg"
+
+def upcoming_detail_urls(candidates, index):
+    """当前及接下来要打开的详情页，用于预取；URL索引会复用的候选不打开详情页，不预取"""
+    upcoming = (c['detail_url'] for c in candidates[index + 1:] if url_index.lookup(c['source_url']) is None)
+    return [candidates[index]['detail_url']] + list(itertools.islice(upcoming, drivers.MAX_PREFETCH_TABS - 1))
+
+def reuse_indexed_image(keyword, url, candidate, base_dir, start):
+    """全局URL索引命中时直接链接已存储的图片，返回文件名；未命中返回None"""
+    if url_index.lookup(url) is None:
+        return None
+    with _files_lock:
+        filename = next_free_filename(base_dir, start)
+        entry = url_index.materialize(url, 'bing', keyword, os.path.join(base_dir, filename), ACCEPT_RULES)
+    if entry is None:
+        return None
+    save_downloaded_url(keyword, url, filename, candidate['source_url'])
+    record_candidate('bing', keyword, candidate, source_url=url, content_hash=entry['content_hash'],
+                     width=entry['width'], height=entry['height'], format=entry['format'],
+                     byte_size=entry['byte_size'], filename=filename, **ledger_fields(entry['score']))
+    return filename
+
+def write_numbered(directory, start, data):
+    """在_files_lock内选取序号文件名并写入，返回文件名"""
+    with _files_lock:
+        filename = next_free_filename(directory, start)
+        with open(os.path.join(directory, filename), "wb") as f:
+            f.write(data)
+    return filename
+
+def download_and_save(keyword, img_url, candidate, base_dir, invalid_dir, tracker, start):
+    """下载、校验并保存一张图片，在下载线程池中执行，start为序号文件名的查找起点；合格时返回 {'size': 字节数}，不合格或下载失败时返回None"""
+    try:
+        set_stage('download')
+        img_data, size, speed, download_time = download_image(img_url, alternates=[candidate['source_url'], candidate['thumb_url']])
+
+        set_stage('validate')
+        # 结果页的expw/exph经常缺失，格式只是按URL扩展名猜测，清单中记录从下载内容读取的实际值
+        width, height, fmt = image_info(img_data)
+        measured = {'width': width, 'height': height, 'format': fmt}
+        score = score_image_data(img_data)
+        rejection_reason = check_image(score, width, height, **ACCEPT_RULES)
+        if rejection_reason is not None:
+            # 不合格的图片保存到invalid目录，不计入下载数量
+            filename = write_numbered(invalid_dir, start, img_data)
+            save_downloaded_url(keyword, img_url, filename, candidate['source_url'])
+            record_candidate('bing', keyword, candidate, source_url=img_url,
+                             content_hash=content_hash(img_data), byte_size=size, filename=filename,
+                             rejection_reason=rejection_reason, **measured, **ledger_fields(score))
+            tracker.mark_evaluated(candidate)
+            logging.info(f"图片质量不符合要求 ({rejection_reason})，保存到invalid目录")
+            return None
+
+        set_stage('write')
+        filename = write_numbered(base_dir, start, img_data)
+        filepath = os.path.join(base_dir, filename)
+
+        set_stage('record')
+        # 保存下载记录
+        save_downloaded_url(keyword, img_url, filename, candidate['source_url'])
+        img_hash = content_hash(img_data)
+        record_candidate('bing', keyword, candidate, source_url=img_url,
+                         content_hash=img_hash, byte_size=size, filename=filename,
+                         **measured, **ledger_fields(score))
+        tracker.mark_evaluated(candidate)
+        url_index.register([img_url, candidate['source_url'], candidate['thumb_url']], filepath, img_hash, size,
+                           'bing', keyword, filename, width, height)
+
+        logging.info(f"图片 {filename} 下载成功 - 大小: {size/1024:.1f}KB, 速度: {speed:.2f}MB/s, 耗时: {download_time:.2f}秒")
+        return {'size': size}
+    except Exception as e:
+        # 下载在后台线程进行，浏览器已经在处理其他详情页，不再保存页面
+        logging.error(f"下载图片失败: {img_url}, 错误: {e}")
+        record_candidate('bing', keyword, candidate, source_url=img_url, rejection_reason='download_failed')
+        return None
+
+def setup_driver(proxy=None):
+    """设置并返回WebDriver，指定代理出口时通过该出口访问"""
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
     options.add_argument("--window-size=1920,1080")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
+    if proxy is not None:
+        options.add_argument(proxy_pool.chrome_argument(proxy))
+    if drivers.get_backend() == 'cdp':
+        return drivers.CDPDriver(options.arguments)
     
     try:
         # 首先尝试使用 ChromeDriverManager
@@ -206,12 +289,30 @@ def setup_driver():
     
     return driver
 
-def crawl_bing_images(keyword, limit=10):
+def _detail_hrefs(driver, keyword):
+    """找到所有 aria-label 匹配的 a 标签；一次脚本调用取回所有链接，不逐个元素往返"""
+    return driver.execute_script(
+        "return Array.from(document.querySelectorAll('a[aria-label]'))"
+        ".filter(a => a.getAttribute('aria-label').includes(arguments[0])).map(a => a.href);",
+        f"{keyword} 的图像结果",
+    ) or []
+
+def extract_detail_candidates(driver, keyword):
+    """提取页面中的图片详情链接并解析元数据"""
+    hrefs = _detail_hrefs(driver, keyword)
+    logging.debug(f"找到 {len(hrefs)} 个图像详情链接")
+    return [parse_bing_detail_link(href) for href in hrefs if href]
+
+def crawl_bing_images(keyword, limit=10, driver=None, progress=None, session_key=None, configure_logging=True,
+                      incremental=False, stop_after_known=DEFAULT_STOP_AFTER_KNOWN):
+    """driver为预热好的浏览器时直接复用且结束后不关闭；progress为进度回调，接收事件字典；
+    incremental为True时连续遇到stop_after_known个上次已处理的结果就停止滚动，并跳过这些结果"""
     # 创建必要的目录
     create_directories()
     
     # 设置日志
-    setup_logging(keyword)
+    if configure_logging:
+        setup_logging(keyword)
     
     start_time = time.time()
     logging.info(f"开始下载关键词 '{keyword}' 的图片，目标数量: {limit}")
@@ -220,49 +321,124 @@ def crawl_bing_images(keyword, limit=10):
     downloaded_urls = load_downloaded_urls(keyword)
     logging.info(f"已下载图片数量: {len(downloaded_urls)}")
     
-    driver = setup_driver()
     base_url = "https://www.bing.com/images/search?q=" + keyword
     logging.debug(f"访问搜索页面: {base_url}")
-    driver.get(base_url)
+    session_key = session_key or f"bing-{keyword}"
+    set_stage('navigate')
+    warm_driver = driver
+    if warm_driver is None:
+        driver = proxy_pool.open_with_rotation(setup_driver, session_key, base_url)
+    else:
+        proxy_pool.throttle(proxy_pool.session_exit(session_key))
+        driver.get(base_url)
+        if proxy_pool.is_ban_page(driver):
+            driver = proxy_pool.handle_ban(driver, setup_driver, session_key, base_url)
 
-    time.sleep(3)  # 等待页面加载
+    # 第一批结果出现就继续，不固定等待
+    count_results = lambda d: len(set(filter(None, _detail_hrefs(d, keyword))))
+    drivers.wait_for_results(driver, count_results, 0, 3)
 
-    # 滚动几次加载更多结果
+    tracker = ResultTracker('bing', keyword, incremental, stop_after_known)
+    set_stage('extract')
+    candidates = extract_detail_candidates(driver, keyword)
+    set_stage('scroll')
+    # 滚动几次加载更多结果，已加载的候选够用时不再滚动
     logging.info("开始滚动页面加载更多图片...")
     scroll_start = time.time()
     for i in range(3):
+        if incremental and tracker.add(candidates):
+            # 增量模式每次滚动前对比已加载的结果流，连续遇到足够多已知结果时不再向下翻页
+            logging.info(f"连续遇到 {tracker.consecutive_known} 个上次已处理的结果，停止滚动")
+            break
+        usable, _ = filter_candidates(tracker.select(candidates), downloaded_urls)
+        if len(usable) >= limit:
+            logging.info(f"已加载 {len(usable)} 个可用候选，满足目标数量，停止滚动")
+            break
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
+        drivers.wait_for_results(driver, count_results, len({c['detail_url'] for c in candidates}), 2)
+        set_stage('extract')
+        candidates = extract_detail_candidates(driver, keyword)
+        set_stage('scroll')
+        tracker.scrolls = i + 1
         logging.debug(f"完成第 {i+1}/3 次滚动")
     logging.info(f"页面滚动完成，耗时: {time.time() - scroll_start:.2f}秒")
 
-    # 找到所有 a 标签，aria-label 匹配的
-    a_tags = driver.find_elements(By.XPATH, f"//a[contains(@aria-label, '{keyword} 的图像结果')]")
-    logging.info(f"找到 {len(a_tags)} 个图像详情链接")
+    set_stage('extract')
+    logging.info(f"找到 {len(candidates)} 个图像详情链接")
+    # 根据详情链接中的元数据预过滤，已知会被拒绝的候选不打开详情页
+    tracker.add(candidates)
+    candidates = tracker.select(candidates)
+    candidates, skipped = filter_candidates(candidates, downloaded_urls)
+    for candidate in skipped:
+        tracker.mark_evaluated(candidate)
+    log_skip_summary(skipped)
+    save_skipped_candidates('bing', keyword, skipped)
+    record_candidates('bing', keyword, skipped)
+    logging.info(f"预过滤后剩余 {len(candidates)} 个候选")
+    if progress:
+        progress({'event': 'candidates', 'keyword': keyword, 'total': min(len(candidates), limit), 'skipped': len(skipped)})
 
     base_dir = f"downloads/bing_{keyword}"
+    invalid_dir = os.path.join(base_dir, "invalid")
     os.makedirs(base_dir, exist_ok=True)
-    logging.info(f"创建保存目录: {base_dir}")
+    os.makedirs(invalid_dir, exist_ok=True)
+    logging.info(f"创建保存目录: {base_dir} 和 {invalid_dir}")
 
     downloaded = 0
     total_download_size = 0
-    with tqdm(total=min(len(a_tags), limit), desc="下载进度") as pbar:
-        for a in a_tags:
+    pending = set()
+    submitted_urls = set()
+
+    def collect(finished):
+        """在爬取线程中汇总已完成的下载，更新计数和进度"""
+        nonlocal downloaded, total_download_size, pending
+        done, pending = finished
+        for future in done:
+            pbar.update(1)
+            result = future.result()
+            if result is None:
+                continue
+            total_download_size += result['size']
+            downloaded += 1
+            if progress:
+                progress({'event': 'image', 'keyword': keyword, 'count': downloaded})
+            # 更新进度条描述，显示预计剩余时间
+            avg_time = (time.time() - start_time) / downloaded
+            remaining = avg_time * (limit - downloaded)
+            pbar.set_description(f"下载进度 (预计剩余: {remaining:.1f}秒)")
+
+    with tqdm(total=min(len(candidates), limit), desc="下载进度") as pbar:
+        for index, candidate in enumerate(candidates):
+            # 进行中的下载可能被质量检查拒绝，加上已完成的数量达到目标时先等待结果，再决定是否继续
+            while pending and downloaded + len(pending) >= limit:
+                collect(wait(pending, return_when=FIRST_COMPLETED))
             if downloaded >= limit:
                 break
+            # 资源调度降低了浏览器上限时，在两个条目之间关闭浏览器并暂停
+            driver = yield_browser(driver, lambda: proxy_pool.launch(setup_driver, session_key))
 
-            href = a.get_attribute("href")
-            if not href:
+            detail_url = candidate['detail_url']
+            # 全局URL索引命中时不打开详情页也不下载
+            if reuse_indexed_image(keyword, candidate['source_url'], candidate, base_dir, downloaded + 1):
+                tracker.mark_evaluated(candidate)
+                downloaded += 1
+                if progress:
+                    progress({'event': 'image', 'keyword': keyword, 'count': downloaded})
+                pbar.update(1)
                 continue
 
-            detail_url = urljoin("https://www.bing.com", href)
             logging.debug(f"处理详情页: {detail_url}")
+            banned = False
             try:
-                driver.execute_script("window.open(arguments[0]);", detail_url)
-                driver.switch_to.window(driver.window_handles[-1])
-                # 增加页面加载等待时间
-                time.sleep(5)  # 从2秒增加到5秒
+                set_stage('navigate')
+                # CDP后端在后台标签中并行加载接下来的详情页，每个页面导航前都按出口的速率预算等待
+                drivers.prefetch(driver, upcoming_detail_urls(candidates, index),
+                                 lambda: proxy_pool.throttle(proxy_pool.session_exit(session_key)))
+                drivers.open_tab(driver, detail_url)
+                # 大图容器出现就继续，最多等待5秒
+                drivers.wait_for_element(driver, By.CLASS_NAME, "mainContainer", 5)
 
+                set_stage('extract')
                 # 找到 .mainContainer 下的第一个 img
                 try:
                     # 等待容器加载
@@ -283,7 +459,7 @@ def crawl_bing_images(keyword, limit=10):
                             logging.warning(f"检测到裂图URL: {img_url}")
                             # 刷新页面重试
                             driver.refresh()
-                            time.sleep(5)  # 从2秒增加到5秒
+                            drivers.wait_for_page(driver, 5)  # 从2秒增加到5秒
                             # 重新等待图片加载
                             container = WebDriverWait(driver, 10).until(
                                 EC.presence_of_element_located((By.CLASS_NAME, "mainContainer"))
@@ -294,61 +470,88 @@ def crawl_bing_images(keyword, limit=10):
                             img_url = img.get_attribute("src")
                             if is_broken_image(img_url):
                                 logging.error(f"刷新后仍然是裂图: {img_url}")
+                                record_candidate('bing', keyword, candidate, rejection_reason='broken_image')
+                                tracker.mark_evaluated(candidate)
                                 pbar.update(1)
                                 continue
                             else:
                                 logging.info(f"刷新后获取到新图片链接: {img_url}")
                         
                         # 检查是否已下载
-                        if img_url in downloaded_urls:
+                        if img_url in downloaded_urls or img_url in submitted_urls:
                             logging.debug(f"跳过已下载的图片: {img_url}")
+                            tracker.mark_evaluated(candidate)
                             pbar.update(1)
                             continue
 
-                        try:
-                            img_data, size, speed, download_time = download_image(img_url)
-                            filename = f"{downloaded + 1}.jpg"
-                            filepath = os.path.join(base_dir, filename)
-                            with open(filepath, "wb") as f:
-                                f.write(img_data)
-                            
-                            # 保存下载记录
-                            save_downloaded_url(keyword, img_url, filename)
-                            
-                            total_download_size += size
-                            logging.info(f"图片 {downloaded + 1} 下载成功 - 大小: {size/1024:.1f}KB, 速度: {speed:.2f}MB/s, 耗时: {download_time:.2f}秒")
+                        if reuse_indexed_image(keyword, img_url, candidate, base_dir, downloaded + 1):
+                            tracker.mark_evaluated(candidate)
                             downloaded += 1
-                            pbar.update(1)
-                            # 更新进度条描述，显示预计剩余时间
-                            avg_time = (time.time() - start_time) / downloaded
-                            remaining = avg_time * (limit - downloaded)
-                            pbar.set_description(f"下载进度 (预计剩余: {remaining:.1f}秒)")
-                        except Exception as e:
-                            logging.error(f"下载图片失败: {e}")
-                            save_error_page(driver, detail_url, "download_failed")
+                            if progress:
+                                progress({'event': 'image', 'keyword': keyword, 'count': downloaded})
                             pbar.update(1)
                             continue
+
+                        # 下载、校验和保存交给下载线程池，浏览器继续处理下一个详情页
+                        submitted_urls.add(img_url)
+                        pending.add(submit_download(download_and_save, keyword, img_url, candidate, base_dir, invalid_dir, tracker,
+                                                    downloaded + 1))
+                        collect(wait(pending, timeout=0))
                     else:
                         logging.warning(f"无效的图片链接: {img_url}")
                 except Exception as e:
                     logging.error(f"等待页面元素超时: {e}")
                     save_error_page(driver, detail_url, "timeout_error")
+                    record_candidate('bing', keyword, candidate, rejection_reason='timeout_error')
+                    banned = proxy_pool.is_ban_page(driver)
                     pbar.update(1)
                     continue
             except Exception as e:
                 logging.error(f"处理页面失败：{detail_url}，原因：{e}")
                 save_error_page(driver, detail_url, "page_error")
+                record_candidate('bing', keyword, candidate, rejection_reason='page_error')
                 pbar.update(1)
             finally:
-                driver.close()
-                driver.switch_to.window(driver.window_handles[0])
+                drivers.close_tab(driver)
+                if banned:
+                    driver = proxy_pool.handle_ban(driver, setup_driver, session_key, base_url)
 
-    driver.quit()
+        # 等待还在进行的下载
+        collect(wait(pending))
+
+    drivers.close_prefetched(driver)
+    # 预热的浏览器交还给调用方；遇到封禁时换出的新浏览器由这里关闭
+    if driver is not warm_driver:
+        driver.quit()
+    if warm_driver is None:
+        proxy_pool.release(session_key)
+    flush_debug_captures()
+    flush_manifest()
     total_time = time.time() - start_time
+    tracker.save(downloaded, total_time)
     avg_speed = total_download_size / (1024 * 1024 * total_time) if total_time > 0 else 0
     logging.info(f"下载完成！共下载 {downloaded} 张图片，总大小: {total_download_size/1024/1024:.1f}MB")
     logging.info(f"总耗时: {total_time:.2f}秒，平均下载速度: {avg_speed:.2f}MB/s")
     logging.info(f"图片保存在目录：{base_dir}/")
+    if progress:
+        progress({'event': 'done', 'keyword': keyword, 'downloaded': downloaded, 'seconds': round(total_time, 2)})
+    return {'keyword': keyword, 'downloaded': downloaded, 'total_size': total_download_size, 'seconds': total_time}
 
 if __name__ == "__main__":
-    crawl_bing_images("泥土", limit=5)
+    parser = argparse.ArgumentParser(description='必应图片爬虫')
+    parser.add_argument('--keyword', default='泥土', help='要搜索的关键词')
+    parser.add_argument('--limit', type=int, default=5, help='要下载的图片数量')
+    parser.add_argument('--profile', action='store_true', help='开启采样性能分析，结束时输出火焰图和热点报告')
+    parser.add_argument('--driver', choices=drivers.BACKENDS, default='selenium', help='浏览器驱动后端')
+    parser.add_argument('--incremental', action='store_true', help='增量爬取，遇到上次已处理的结果后停止翻页')
+    parser.add_argument('--stop_after_known', type=int, default=DEFAULT_STOP_AFTER_KNOWN, help='增量爬取时连续遇到多少个已知结果后停止')
+    args = parser.parse_args()
+
+    drivers.set_backend(args.driver)
+    if args.profile:
+        start_profiling('bing_crawler')
+    try:
+        crawl_bing_images(args.keyword, limit=args.limit, incremental=args.incremental, stop_after_known=args.stop_after_known)
+    finally:
+        if args.profile:
+            stop_profiling()
@@ -0,0 +1,191 @@
+import os
+import re
+import gzip
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from queue import Queue, Full
+from datetime import datetime
+from collections import OrderedDict
+from profiler import set_stage
+
+# 调试文件采集配置
+DEBUG_DIR = 'debug_html'                 # 调试文件目录
+SAMPLE_WINDOW = 60                       # 采样窗口（秒）
+SAMPLES_PER_WINDOW = 3                   # 每种错误类型每个窗口最多保存的页面数
+MAX_TOTAL_BYTES = 200 * 1024 * 1024      # 调试目录磁盘配额
+RETENTION_SECONDS = 7 * 24 * 3600        # 调试文件保留时间
+MAX_PENDING = 32                         # 后台写入队列长度，队列满时直接丢弃
+MAX_SEEN_HASHES = 1024                   # 记住的页面结构哈希数量
+ENFORCE_EVERY = 20                       # 每写入多少个文件检查一次配额
+
+_lock = threading.Lock()
+_windows = {}               # error_type -> (窗口开始时间, 已保存数量)
+_suppressed = {}            # error_type -> 被采样或去重丢弃的数量
+_seen_hashes = OrderedDict()
+_queue = Queue(maxsize=MAX_PENDING)
+_writer = None
+_written = 0
+
+_TAG_PATTERN = re.compile(r'<([a-zA-Z][a-zA-Z0-9-]*)([^>]*)>')
+_CLASS_PATTERN = re.compile(r'\sclass="([^"]*)"')
+
+def page_structure_hash(html, max_chars=200000):
+    """计算页面结构哈希：只看标签名和class，忽略文本和其他属性"""
+    digest = hashlib.sha1()
+    for match in _TAG_PATTERN.finditer(html[:max_chars]):
+        digest.update(match.group(1).lower().encode())
+        class_match = _CLASS_PATTERN.search(match.group(2))
+        if class_match:
+            digest.update(class_match.group(1).encode())
+    return digest.hexdigest()
+
+def _should_sample(error_type):
+    """按错误类型限流，窗口内超过配额的错误不保存"""
+    now = time.time()
+    with _lock:
+        window_start, count = _windows.get(error_type, (now, 0))
+        if now - window_start >= SAMPLE_WINDOW:
+            window_start, count = now, 0
+        if count >= SAMPLES_PER_WINDOW:
+            _suppressed[error_type] = _suppressed.get(error_type, 0) + 1
+            return False
+        _windows[error_type] = (window_start, count + 1)
+        return True
+
+def _is_duplicate(error_type, structure_hash):
+    """同一错误类型下页面结构相同则视为重复"""
+    key = (error_type, structure_hash)
+    with _lock:
+        if key in _seen_hashes:
+            _seen_hashes.move_to_end(key)
+            _suppressed[error_type] = _suppressed.get(error_type, 0) + 1
+            return True
+        _seen_hashes[key] = True
+        if len(_seen_hashes) > MAX_SEEN_HASHES:
+            _seen_hashes.popitem(last=False)
+        return False
+
+def _ensure_writer():
+    global _writer
+    with _lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name='debug-capture', daemon=True)
+            _writer.start()
+
+def _writer_loop():
+    set_stage('write')
+    while True:
+        item = _queue.get()
+        try:
+            _write_artifacts(*item)
+        except Exception as e:
+            logging.error(f"写入调试文件失败: {e}")
+        finally:
+            _queue.task_done()
+
+def _write_artifacts(error_type, url, html, screenshot, structure_hash, timestamp):
+    global _written
+    os.makedirs(DEBUG_DIR, exist_ok=True)
+    base = f"{DEBUG_DIR}/error_{error_type}_{timestamp}_{structure_hash[:8]}"
+
+    # 保存压缩后的HTML，文件头记录问题URL
+    html_filename = f"{base}.html.gz"
+    with gzip.open(html_filename, 'wt', encoding='utf-8', compresslevel=6) as f:
+        f.write(f"<!-- url: {url} -->\n")
+        f.write(html)
+
+    # 保存截图（PNG本身已压缩）
+    screenshot_filename = None
+    if screenshot:
+        screenshot_filename = f"{base}.png"
+        with open(screenshot_filename, 'wb') as f:
+            f.write(screenshot)
+
+    logging.error(f"页面保存成功 - HTML: {html_filename}, 截图: {screenshot_filename}")
+
+    _written += 1
+    if _written % ENFORCE_EVERY == 1:
+        enforce_quota()
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def enforce_quota():
+    """删除过期的调试文件，并在超出磁盘配额时从最旧的文件开始删除"""
+    if not os.path.isdir(DEBUG_DIR):
+        return
+    now = time.time()
+    files = []
+    for name in os.listdir(DEBUG_DIR):
+        path = os.path.join(DEBUG_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if not os.path.isfile(path):
+            continue
+        if now - stat.st_mtime > RETENTION_SECONDS:
+            _remove_quietly(path)
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= MAX_TOTAL_BYTES:
+            break
+        _remove_quietly(path)
+        total -= size
+        removed += 1
+    if removed:
+        logging.warning(f"调试目录超出配额，已删除 {removed} 个最旧的文件")
+
+def save_error_page(driver, url, error_type):
+    """采样保存错误页面的HTML和截图，实际写盘在后台线程完成"""
+    logging.error(f"问题URL: {url}")
+    if not _should_sample(error_type):
+        return
+
+    try:
+        html = driver.page_source
+    except Exception as e:
+        logging.error(f"获取页面源码失败: {e}")
+        return
+
+    structure_hash = page_structure_hash(html)
+    if _is_duplicate(error_type, structure_hash):
+        logging.debug(f"页面结构与已保存的 {error_type} 页面相同，跳过保存")
+        return
+
+    try:
+        screenshot = driver.get_screenshot_as_png()
+    except Exception as e:
+        logging.error(f"获取页面截图失败: {e}")
+        screenshot = None
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    _ensure_writer()
+    try:
+        _queue.put_nowait((error_type, url, html, screenshot, structure_hash, timestamp))
+    except Full:
+        with _lock:
+            _suppressed[error_type] = _suppressed.get(error_type, 0) + 1
+        logging.warning("调试文件写入队列已满，丢弃本次页面")
+
+def flush_debug_captures():
+    """等待后台写入完成，并汇总输出被丢弃的调试页面数量"""
+    if _writer is not None and _writer.is_alive():
+        _queue.join()
+    with _lock:
+        suppressed = dict(_suppressed)
+        _suppressed.clear()
+    for error_type, count in suppressed.items():
+        logging.info(f"错误类型 {error_type} 有 {count} 个页面因采样或去重未保存")
+
+atexit.register(flush_debug_captures)
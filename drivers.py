@@ -0,0 +1,580 @@
+import os
+import json
+import time
+import base64
+import shutil
+import logging
+import tempfile
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import websocket
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import (
+    NoSuchElementException, TimeoutException, JavascriptException, WebDriverException
+)
+
+# 浏览器驱动后端配置
+BACKENDS = ('selenium', 'cdp')
+COMMAND_TIMEOUT = 30             # 单条CDP命令的超时时间（秒）
+PAGE_LOAD_TIMEOUT = 30           # 等待页面load事件的超时时间（秒）
+LAUNCH_TIMEOUT = 30              # 等待Chrome开放调试端口的超时时间（秒）
+NETWORK_IDLE_TIME = 0.5          # 网络安静多久视为空闲（秒）
+NETWORK_IDLE_INFLIGHT = 2        # 允许仍在进行的请求数（长连接、统计请求等）
+MAX_PREFETCH_TABS = 3            # 每个浏览器最多同时预取的标签数（含当前要访问的页面）
+POLL_INTERVAL = 0.1              # Selenium后端轮询页面状态的间隔（秒）
+CHROME_BINARIES = ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome']
+
+_backend = 'selenium'
+
+def set_backend(name):
+    """选择本次运行使用的浏览器驱动后端"""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的驱动后端: {name}")
+    _backend = name
+    logging.info(f"浏览器驱动后端: {name}")
+
+def get_backend():
+    return _backend
+
+class CDPError(WebDriverException):
+    """CDP命令返回错误或连接已断开"""
+
+class CDPConnection:
+    """到浏览器的websocket连接；命令异步发送并返回Future，事件分发给监听者"""
+
+    def __init__(self, ws_url):
+        self.ws = websocket.create_connection(ws_url, enable_multithread=True, suppress_origin=True)
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.reader = threading.Thread(target=self._read, name='cdp-reader', daemon=True)
+        self.reader.start()
+
+    def send(self, method, params=None, session_id=None):
+        """发送命令，不等待结果"""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise CDPError("CDP连接已关闭")
+            msg_id = next(self.ids)
+            self.pending[msg_id] = future
+        message = {'id': msg_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        self.ws.send(json.dumps(message))
+        return future
+
+    def call(self, method, params=None, session_id=None, timeout=COMMAND_TIMEOUT):
+        """发送命令并等待结果"""
+        try:
+            return self.send(method, params, session_id).result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutException(f"CDP命令超时: {method}")
+
+    def _read(self):
+        while True:
+            try:
+                message = json.loads(self.ws.recv())
+            except Exception:
+                break
+            if 'id' in message:
+                with self.lock:
+                    future = self.pending.pop(message['id'], None)
+                if future is None:
+                    continue
+                if 'error' in message:
+                    future.set_exception(CDPError(message['error'].get('message', str(message['error']))))
+                else:
+                    future.set_result(message.get('result', {}))
+                continue
+            for listener in list(self.listeners):
+                try:
+                    listener(message.get('method'), message.get('params', {}), message.get('sessionId'))
+                except Exception as e:
+                    logging.error(f"处理CDP事件失败: {e}")
+
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(CDPError("CDP连接已关闭"))
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+# 与Selenium一致：ID、类名、标签名、name都转换为CSS选择器
+_CSS_LOCATORS = {
+    By.ID: lambda v: f'[id="{v}"]',
+    By.CLASS_NAME: lambda v: f'.{v}',
+    By.TAG_NAME: lambda v: v,
+    By.NAME: lambda v: f'[name="{v}"]',
+    By.CSS_SELECTOR: lambda v: v,
+}
+
+_FIND_JS = """function(by, value, multiple) {
+    const root = this;
+    let nodes = [];
+    if (by === 'xpath') {
+        const snapshot = document.evaluate(value, root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (let i = 0; i < snapshot.snapshotLength; i++) nodes.push(snapshot.snapshotItem(i));
+    } else {
+        nodes = Array.from(root.querySelectorAll(value));
+    }
+    return multiple ? nodes : (nodes[0] || null);
+}"""
+
+# 与Selenium的get_attribute一致：优先返回属性值（如解析后的绝对href），没有时返回HTML属性
+_GET_ATTRIBUTE_JS = """function(name) {
+    const value = this[name];
+    if (value !== undefined && value !== null && typeof value !== 'object' && typeof value !== 'function') {
+        return String(value);
+    }
+    return this.getAttribute(name);
+}"""
+
+_IS_DISPLAYED_JS = """function() {
+    const rect = this.getBoundingClientRect();
+    const style = window.getComputedStyle(this);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+}"""
+
+def _locator(by, value):
+    if by == By.XPATH:
+        return 'xpath', value
+    if by not in _CSS_LOCATORS:
+        raise ValueError(f"CDP后端不支持的定位方式: {by}")
+    return 'css', _CSS_LOCATORS[by](value)
+
+class CDPElement:
+    """页面元素的远程对象引用"""
+
+    def __init__(self, tab, object_id):
+        self.tab = tab
+        self.object_id = object_id
+
+    def _call(self, declaration, *args):
+        return self.tab._call_function(self.object_id, declaration, args)
+
+    def get_attribute(self, name):
+        return self._call(_GET_ATTRIBUTE_JS, name)
+
+    def find_element(self, by=By.ID, value=None):
+        return self.tab._find(by, value, self.object_id, multiple=False)
+
+    def find_elements(self, by=By.ID, value=None):
+        return self.tab._find(by, value, self.object_id, multiple=True)
+
+    def is_displayed(self):
+        return bool(self._call(_IS_DISPLAYED_JS))
+
+    def is_enabled(self):
+        return not self._call("function() { return !!this.disabled; }")
+
+    def click(self):
+        self._call("function() { this.scrollIntoView({block: 'center'}); this.click(); }")
+
+    @property
+    def text(self):
+        return self._call("function() { return this.innerText; }")
+
+class CDPTab:
+    """一个页面标签；实现爬虫用到的Selenium WebDriver页面接口，并按网络请求跟踪空闲状态"""
+
+    def __init__(self, conn, target_id):
+        self.conn = conn
+        self.target_id = target_id
+        self.session_id = conn.call('Target.attachToTarget', {'targetId': target_id, 'flatten': True})['sessionId']
+        self.inflight = set()
+        self.last_activity = time.time()
+        self.loaded = threading.Event()
+        self.cond = threading.Condition()
+        self.navigation = None
+        conn.listeners.append(self._on_event)
+        # 并行发出启用命令，只等待一次往返
+        futures = [self._send('Page.enable'), self._send('Network.enable'),
+                   self._send('Runtime.evaluate', {'expression': 'document.readyState', 'returnByValue': True})]
+        results = [future.result(COMMAND_TIMEOUT) for future in futures]
+        if results[-1].get('result', {}).get('value') == 'complete':
+            self.loaded.set()
+
+    def _send(self, method, params=None):
+        return self.conn.send(method, params, self.session_id)
+
+    def _call(self, method, params=None, timeout=COMMAND_TIMEOUT):
+        return self.conn.call(method, params, self.session_id, timeout)
+
+    def _on_event(self, method, params, session_id):
+        if session_id != self.session_id:
+            return
+        with self.cond:
+            if method == 'Network.requestWillBeSent':
+                self.inflight.add(params['requestId'])
+            elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+                self.inflight.discard(params['requestId'])
+            elif method == 'Page.loadEventFired':
+                self.loaded.set()
+            else:
+                return
+            self.last_activity = time.time()
+            self.cond.notify_all()
+
+    def _reset_network(self):
+        self.loaded.clear()
+        with self.cond:
+            self.inflight.clear()
+            self.last_activity = time.time()
+
+    def navigate_async(self, url):
+        """开始导航但不等待，用于后台标签并行加载"""
+        self._reset_network()
+        self.navigation = self._send('Page.navigate', {'url': url})
+
+    def get(self, url):
+        self._reset_network()
+        result = self._call('Page.navigate', {'url': url})
+        if result.get('errorText'):
+            raise CDPError(f"打开页面失败: {url}, {result['errorText']}")
+        self.wait_for_load()
+
+    def wait_for_load(self, timeout=PAGE_LOAD_TIMEOUT):
+        if self.navigation is not None:
+            navigation, self.navigation = self.navigation, None
+            result = navigation.result(timeout)
+            if result.get('errorText'):
+                raise CDPError(f"打开页面失败: {result['errorText']}")
+        if not self.loaded.wait(timeout):
+            raise TimeoutException(f"页面加载超时: {timeout}秒")
+
+    def refresh(self):
+        self._reset_network()
+        self._call('Page.reload')
+        self.wait_for_load()
+
+    def wait_for_network_idle(self, timeout=10, idle_time=NETWORK_IDLE_TIME):
+        """等待页面加载完成且网络安静idle_time秒，最多等待timeout秒，返回是否达到空闲。
+        安静时间从调用时开始计算：滚动等操作触发的懒加载请求要过一会儿才发出，之前的安静不算数"""
+        started = time.time()
+        deadline = started + timeout
+        if not self.loaded.wait(timeout):
+            return False
+        with self.cond:
+            while True:
+                now = time.time()
+                quiet = now - max(self.last_activity, started)
+                if len(self.inflight) <= NETWORK_IDLE_INFLIGHT and quiet >= idle_time:
+                    return True
+                if now >= deadline:
+                    return False
+                wait = deadline - now
+                if len(self.inflight) <= NETWORK_IDLE_INFLIGHT:
+                    wait = min(wait, idle_time - quiet)
+                self.cond.wait(wait)
+
+    def _evaluate(self, expression, by_value=True):
+        result = self._call('Runtime.evaluate', {
+            'expression': expression, 'returnByValue': by_value, 'userGesture': True,
+        })
+        if 'exceptionDetails' in result:
+            raise JavascriptException(result['exceptionDetails'].get('exception', {}).get('description', expression))
+        return result['result']
+
+    def _call_function(self, object_id, declaration, args=(), by_value=True):
+        result = self._call('Runtime.callFunctionOn', {
+            'objectId': object_id, 'functionDeclaration': declaration,
+            'arguments': [{'value': arg} for arg in args], 'returnByValue': by_value, 'userGesture': True,
+        })
+        if 'exceptionDetails' in result:
+            raise JavascriptException(result['exceptionDetails'].get('exception', {}).get('description', declaration))
+        return result['result'].get('value') if by_value else result['result']
+
+    def _find(self, by, value, root_id=None, multiple=False):
+        kind, selector = _locator(by, value)
+        if root_id is None:
+            result = self._evaluate(f"({_FIND_JS}).call(document, {json.dumps(kind)}, {json.dumps(selector)}, {json.dumps(multiple)})", by_value=False)
+        else:
+            result = self._call_function(root_id, _FIND_JS, (kind, selector, multiple), by_value=False)
+        if not multiple:
+            if result.get('subtype') == 'null' or 'objectId' not in result:
+                raise NoSuchElementException(f"找不到元素: {by}={value}")
+            return CDPElement(self, result['objectId'])
+        properties = self._call('Runtime.getProperties', {'objectId': result['objectId'], 'ownProperties': True})['result']
+        items = [(int(p['name']), p['value']['objectId']) for p in properties
+                 if p['name'].isdigit() and 'objectId' in p.get('value', {})]
+        return [CDPElement(self, object_id) for _, object_id in sorted(items)]
+
+    def find_element(self, by=By.ID, value=None):
+        return self._find(by, value, multiple=False)
+
+    def find_elements(self, by=By.ID, value=None):
+        return self._find(by, value, multiple=True)
+
+    def execute_script(self, script, *args):
+        """与Selenium一致，script为函数体，参数通过arguments访问"""
+        return self._evaluate(f"(function() {{\n{script}\n}}).apply(null, {json.dumps(list(args))})").get('value')
+
+    @property
+    def title(self):
+        return self._evaluate('document.title').get('value')
+
+    @property
+    def current_url(self):
+        return self._evaluate('location.href').get('value')
+
+    @property
+    def page_source(self):
+        return self._evaluate('document.documentElement.outerHTML').get('value')
+
+    def get_screenshot_as_png(self):
+        return base64.b64decode(self._call('Page.captureScreenshot', {'format': 'png'})['data'])
+
+    def close(self):
+        if self._on_event in self.conn.listeners:
+            self.conn.listeners.remove(self._on_event)
+        self.conn.call('Target.closeTarget', {'targetId': self.target_id})
+
+def find_chrome():
+    """查找Chrome可执行文件，可用环境变量CHROME_BINARY指定"""
+    binary = os.environ.get('CHROME_BINARY')
+    if binary:
+        return binary
+    for name in CHROME_BINARIES:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise WebDriverException("未找到Chrome浏览器，请安装Chrome或设置环境变量 CHROME_BINARY")
+
+class _SwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current = self.driver._tab(handle)
+
+class CDPDriver:
+    """直接通过CDP控制的Chrome；页面操作作用于当前标签，接口与爬虫用到的Selenium WebDriver一致"""
+
+    def __init__(self, arguments=()):
+        self.user_data_dir = tempfile.mkdtemp(prefix='cdp-chrome-')
+        args = [find_chrome(), *arguments, '--remote-debugging-port=0', '--remote-allow-origins=*',
+                f'--user-data-dir={self.user_data_dir}', '--disable-popup-blocking',
+                '--no-first-run', '--no-default-browser-check', 'about:blank']
+        start_time = time.time()
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.conn = CDPConnection(self._wait_for_endpoint())
+            self.tabs = {}
+            self.prefetched = {}
+            self.lock = threading.Lock()
+            targets = self.conn.call('Target.getTargets')['targetInfos']
+            self.handles = [t['targetId'] for t in targets if t['type'] == 'page']
+            self.current = self._tab(self.handles[0])
+        except Exception:
+            self.quit()
+            raise
+        self.switch_to = _SwitchTo(self)
+        logging.debug(f"CDP浏览器启动完成，耗时 {time.time() - start_time:.2f}秒")
+
+    def _wait_for_endpoint(self):
+        port_file = os.path.join(self.user_data_dir, 'DevToolsActivePort')
+        deadline = time.time() + LAUNCH_TIMEOUT
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise WebDriverException(f"Chrome启动后立即退出，退出码 {self.process.returncode}")
+            if os.path.exists(port_file):
+                with open(port_file, 'r', encoding='utf-8') as f:
+                    lines = f.read().split()
+                if len(lines) >= 2:
+                    return f"ws://127.0.0.1:{lines[0]}{lines[1]}"
+            time.sleep(0.05)
+        raise WebDriverException(f"等待Chrome调试端口超时: {LAUNCH_TIMEOUT}秒")
+
+    def _tab(self, target_id):
+        with self.lock:
+            tab = self.tabs.get(target_id)
+            if tab is None:
+                tab = self.tabs[target_id] = CDPTab(self.conn, target_id)
+                if target_id not in self.handles:
+                    self.handles.append(target_id)
+            return tab
+
+    def _new_tab(self):
+        target_id = self.conn.call('Target.createTarget', {'url': 'about:blank', 'background': True})['targetId']
+        return self._tab(target_id)
+
+    @property
+    def window_handles(self):
+        """按打开顺序返回标签；与浏览器当前的标签列表对齐，包括页面脚本用window.open打开的标签"""
+        targets = [t['targetId'] for t in self.conn.call('Target.getTargets')['targetInfos'] if t['type'] == 'page']
+        with self.lock:
+            self.handles = [h for h in self.handles if h in targets] + [t for t in targets if t not in self.handles]
+            return list(self.handles)
+
+    def prefetch(self, urls, throttle=None):
+        """在后台标签中提前并行打开页面；urls为当前及接下来要访问的页面，不在其中的预取标签会被关闭。
+        每个标签发起导航前调用throttle，预取的页面同样计入出口的速率预算"""
+        urls = list(urls)
+        for url in [u for u in self.prefetched if u not in urls]:
+            self._close_tab(self.prefetched.pop(url))
+        for url in urls:
+            if len(self.prefetched) >= MAX_PREFETCH_TABS:
+                break
+            if url in self.prefetched:
+                continue
+            if throttle is not None:
+                throttle()
+            tab = self._new_tab()
+            tab.navigate_async(url)
+            self.prefetched[url] = tab
+
+    def _close_tab(self, tab):
+        with self.lock:
+            self.tabs.pop(tab.target_id, None)
+            if tab.target_id in self.handles:
+                self.handles.remove(tab.target_id)
+        try:
+            tab.close()
+        except Exception as e:
+            logging.debug(f"关闭标签失败: {e}")
+
+    def close_prefetched(self):
+        """关闭没有用到的预取标签"""
+        for tab in self.prefetched.values():
+            self._close_tab(tab)
+        self.prefetched = {}
+
+    def open_tab(self, url):
+        """切换到打开url的新标签，预取过的直接使用"""
+        tab = self.prefetched.pop(url, None)
+        if tab is None:
+            tab = self._new_tab()
+            tab.navigate_async(url)
+        self.current = tab
+        tab.wait_for_load()
+        return tab
+
+    def get(self, url):
+        tab = self.prefetched.pop(url, None)
+        if tab is None:
+            self.current.get(url)
+            return
+        # 预取过的页面：用预取标签替换当前标签
+        previous, self.current = self.current, tab
+        self._close_tab(previous)
+        tab.wait_for_load()
+
+    def refresh(self):
+        self.current.refresh()
+
+    def wait_for_network_idle(self, timeout=10, idle_time=NETWORK_IDLE_TIME):
+        return self.current.wait_for_network_idle(timeout, idle_time)
+
+    def find_element(self, by=By.ID, value=None):
+        return self.current.find_element(by, value)
+
+    def find_elements(self, by=By.ID, value=None):
+        return self.current.find_elements(by, value)
+
+    def execute_script(self, script, *args):
+        return self.current.execute_script(script, *args)
+
+    @property
+    def title(self):
+        return self.current.title
+
+    @property
+    def current_url(self):
+        return self.current.current_url
+
+    @property
+    def page_source(self):
+        return self.current.page_source
+
+    def get_screenshot_as_png(self):
+        return self.current.get_screenshot_as_png()
+
+    def close(self):
+        """关闭当前标签，之后需要用switch_to.window切换"""
+        self._close_tab(self.current)
+
+    def quit(self):
+        if getattr(self, 'conn', None) is not None:
+            try:
+                self.conn.call('Browser.close', timeout=5)
+            except Exception:
+                pass
+            self.conn.close()
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+def is_cdp(driver):
+    return isinstance(driver, CDPDriver)
+
+def wait_for_page(driver, max_wait):
+    """CDP后端等待网络空闲（最多max_wait秒），Selenium后端保持固定等待"""
+    if is_cdp(driver):
+        driver.wait_for_network_idle(max_wait)
+    else:
+        time.sleep(max_wait)
+
+def wait_for_results(driver, count, previous, max_wait):
+    """等待页面上的结果数超过previous。CDP后端等待网络空闲；Selenium后端轮询count(driver)，
+    结果一增加就返回，不再固定等满max_wait秒。返回是否出现了新结果（CDP后端总是返回True）"""
+    if is_cdp(driver):
+        driver.wait_for_network_idle(max_wait)
+        return True
+    deadline = time.time() + max_wait
+    while True:
+        if count(driver) > previous:
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+
+def wait_for_element(driver, by, value, max_wait):
+    """等待元素出现（最多max_wait秒）。CDP后端等待网络空闲；Selenium后端元素出现后立即返回"""
+    if is_cdp(driver):
+        driver.wait_for_network_idle(max_wait)
+        return
+    deadline = time.time() + max_wait
+    while time.time() < deadline:
+        if driver.find_elements(by, value):
+            return
+        time.sleep(POLL_INTERVAL)
+
+def open_tab(driver, url):
+    """在新标签中打开url并切换过去"""
+    if is_cdp(driver):
+        driver.open_tab(url)
+        return
+    driver.execute_script("window.open(arguments[0]);", url)
+    driver.switch_to.window(driver.window_handles[-1])
+
+def close_tab(driver):
+    """关闭当前标签并回到第一个标签"""
+    driver.close()
+    driver.switch_to.window(driver.window_handles[0])
+
+def prefetch(driver, urls, throttle=None):
+    """在打开当前页面urls[0]之前调用，保证每次导航前都调用一次throttle。
+    CDP后端在后台标签中提前打开urls中还没有预取的页面，每个导航前调用throttle；
+    Selenium后端不预取，只为当前页面调用throttle"""
+    if is_cdp(driver):
+        driver.prefetch(urls, throttle)
+    elif throttle is not None:
+        throttle()
+
+def close_prefetched(driver):
+    if is_cdp(driver):
+        driver.close_prefetched()
@@ -13,6 +13,12 @@ from tqdm import tqdm
 from urllib.parse import urlparse
 import hashlib
 from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException
+from debug_capture import save_error_page, flush_debug_captures
+from profiler import set_stage, start_profiling, stop_profiling
+import argparse
+import url_index
+from quality import image_info
+import drivers
 
 def load_config():
     print("Loading configuration...")
@@ -29,26 +35,41 @@ def setup_driver():
     chrome_options.add_argument('--disable-dev-shm-usage')
     chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
     
+    if drivers.get_backend() == 'cdp':
+        driver = drivers.CDPDriver(chrome_options.arguments)
+        print("Chrome CDP driver setup completed")
+        return driver
+
     service = Service(ChromeDriverManager().install())
     driver = webdriver.Chrome(service=service, options=chrome_options)
     print("Chrome driver setup completed")
     return driver
 
-def download_image(url, save_path):
+def download_image(url, save_path, keyword=None):
     print(f"Attempting to download image from: {url}")
     try:
+        # Generate a unique filename based on URL
+        file_hash = hashlib.md5(url.encode()).hexdigest()
+        file_extension = os.path.splitext(urlparse(url).path)[1]
+        if not file_extension:
+            file_extension = '.jpg'
+        filename = f"{file_hash}{file_extension}"
+        filepath = os.path.join(save_path, filename)
+
+        # 全局URL索引命中时直接链接已存储的图片，不发起网络请求
+        if url_index.materialize(url, 'google', keyword, filepath):
+            return True
+
+        set_stage('download')
         response = requests.get(url, timeout=10)
         if response.status_code == 200:
-            # Generate a unique filename based on URL
-            file_hash = hashlib.md5(url.encode()).hexdigest()
-            file_extension = os.path.splitext(urlparse(url).path)[1]
-            if not file_extension:
-                file_extension = '.jpg'
-            filename = f"{file_hash}{file_extension}"
-            filepath = os.path.join(save_path, filename)
-            
+            set_stage('write')
             with open(filepath, 'wb') as f:
                 f.write(response.content)
+            # 登记实际尺寸，其他引擎复用该文件前按各自的尺寸规则检查
+            width, height, _ = image_info(response.content)
+            url_index.register([url], filepath, hashlib.sha1(response.content).hexdigest(), len(response.content),
+                               'google', keyword, filename, width, height)
             print(f"Successfully downloaded image to: {filepath}")
             return True
     except Exception as e:
@@ -60,7 +81,7 @@ def get_full_size_image(driver, img_element):
         print("Clicking on image to get full size version...")
         # 点击图片打开大图
         img_element.click()
-        time.sleep(2)  # 等待大图加载
+        drivers.wait_for_page(driver, 2)  # 等待大图加载
         
         print("Waiting for full size image to load...")
         # 等待大图加载完成，使用更可靠的选择器
@@ -79,16 +100,13 @@ def get_full_size_image(driver, img_element):
             EC.element_to_be_clickable((By.CSS_SELECTOR, "button[aria-label='Close']"))
         )
         close_button.click()
-        time.sleep(1)
+        drivers.wait_for_page(driver, 1)
         
         return img_url
     except Exception as e:
         print(f"Error getting full size image: {str(e)}")
         # 保存当前页面截图和源码以便调试
-        driver.save_screenshot("error_screenshot.png")
-        with open("error_page.html", "w", encoding="utf-8") as f:
-            f.write(driver.page_source)
-        print("Saved error screenshot and page source for debugging")
+        save_error_page(driver, driver.current_url, "full_size_image")
         return None
 
 def main():
@@ -110,6 +128,7 @@ def main():
         search_term = google_config['keyword']
         url = f"https://www.google.com/search?q={search_term}&tbm=isch"
         print(f"Navigating to search URL: {url}")
+        set_stage('navigate')
         driver.get(url)
         
         try:
@@ -120,17 +139,9 @@ def main():
             )
             print("Search results loaded successfully")
             
-            # 保存初始页面截图和源码以便调试
-            driver.save_screenshot("initial_page.png")
-            with open("initial_page.html", "w", encoding="utf-8") as f:
-                f.write(driver.page_source)
-            print("Saved initial page screenshot and source for debugging")
-            
         except TimeoutException:
             print("Timeout: Search results not found, saving screenshot and HTML for debug.")
-            driver.save_screenshot("google_debug.png")
-            with open("google_debug.html", "w", encoding="utf-8") as f:
-                f.write(driver.page_source)
+            save_error_page(driver, url, "search_timeout")
             driver.quit()
             return
         
@@ -143,11 +154,13 @@ def main():
         with tqdm(total=google_config['limit'], desc="Downloading images") as pbar:
             while images_downloaded < google_config['limit']:
                 # Scroll down
+                set_stage('scroll')
                 print("Scrolling down to load more images...")
                 driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
+                drivers.wait_for_page(driver, 2)
                 
                 # 获取所有搜索结果图片，使用多个选择器尝试
+                set_stage('extract')
                 print("Finding image elements...")
                 img_elements = []
                 
@@ -168,9 +181,7 @@ def main():
                 
                 if not img_elements:
                     print("No images found with any selector, saving current page state...")
-                    driver.save_screenshot("no_images_found.png")
-                    with open("no_images_found.html", "w", encoding="utf-8") as f:
-                        f.write(driver.page_source)
+                    save_error_page(driver, url, "no_images_found")
                     break
                 
                 # 处理每个搜索结果
@@ -187,10 +198,11 @@ def main():
                         
                         print(f"Processing image {images_processed + 1}")
                         # 获取大图URL
+                        set_stage('navigate')
                         full_img_url = get_full_size_image(driver, img)
                         
                         if full_img_url and full_img_url.startswith('http'):
-                            if download_image(full_img_url, save_dir):
+                            if download_image(full_img_url, save_dir, search_term):
                                 images_downloaded += 1
                                 pbar.update(1)
                                 print(f"Successfully downloaded image {images_downloaded} of {google_config['limit']}")
@@ -210,7 +222,20 @@ def main():
     finally:
         print("Cleaning up and closing driver...")
         driver.quit()
+        flush_debug_captures()
         print("Crawler finished")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Google图片爬虫')
+    parser.add_argument('--profile', action='store_true', help='开启采样性能分析，结束时输出火焰图和热点报告')
+    parser.add_argument('--driver', choices=drivers.BACKENDS, default='selenium', help='浏览器驱动后端')
+    args = parser.parse_args()
+
+    drivers.set_backend(args.driver)
+    if args.profile:
+        start_profiling('google_crawler')
+    try:
+        main()
+    finally:
+        if args.profile:
+            stop_profiling() 
\ No newline at end of file
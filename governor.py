@@ -0,0 +1,258 @@
+import os
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+import psutil
+from profiler import clear_stage
+
+# 资源调度配置
+SAMPLE_INTERVAL = 5              # 资源采样间隔（秒）
+MEMORY_RESERVE = 0.15            # 可用内存低于总内存的该比例时开始减少并发
+MEMORY_CRITICAL = 0.08           # 可用内存低于该比例时立即降到下限
+DEFAULT_BROWSER_RSS = 400 * 1024 * 1024   # 尚无实测数据时每个浏览器的内存估计
+CPU_HIGH = 85                    # CPU使用率高于该值时不再增加并发
+THROUGHPUT_GAIN = 0.05           # 增加下载并发后吞吐至少提升该比例才继续增加
+SATURATED_HOLD = 6               # 带宽饱和回退后，多少个采样周期内不再增加下载并发
+DOWNLOADS_PER_CPU = 4            # 下载是IO密集型，每个CPU核心对应的下载并发上限
+MAX_DOWNLOADS = 64
+DEFAULT_WORKERS = 3              # 不开启资源调度时的默认线程数
+
+class AdjustableLimiter:
+    """上限可在运行时调整的并发槽；上限降低后，占用者在检查点通过yield_browser让出超出的槽"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            self.waiting += 1
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.waiting -= 1
+            self.active += 1
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+    def release_if_over(self):
+        """占用数超过上限时归还一个槽并返回True；多个占用者同时检查时只有超出的部分会归还"""
+        with self.cond:
+            if self.active <= self.limit:
+                return False
+            self.active -= 1
+            self.cond.notify()
+            return True
+
+    def set_limit(self, limit):
+        with self.cond:
+            self.limit = limit
+            self.cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def _chrome_rss(process):
+    """本进程启动的浏览器及驱动进程占用的内存"""
+    total = 0
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return total
+
+def host_limits():
+    """按本机资源推算并发上限，返回 (浏览器数, 下载并发数)：浏览器受CPU核数和扣除预留后能容纳的浏览器内存限制"""
+    cpus = os.cpu_count() or 1
+    usable_memory = psutil.virtual_memory().total * (1 - MEMORY_RESERVE)
+    browsers = max(1, min(cpus, int(usable_memory // DEFAULT_BROWSER_RSS)))
+    downloads = max(2, min(cpus * DOWNLOADS_PER_CPU, MAX_DOWNLOADS))
+    return browsers, downloads
+
+class Governor:
+    """根据可用内存、CPU和网络吞吐，在上下限之间调整浏览器会话数和下载并发数；
+    上限未指定时按本机资源推算，指定时作为额外的封顶"""
+
+    def __init__(self, min_browsers=1, max_browsers=None, min_downloads=2, max_downloads=None, interval=SAMPLE_INTERVAL):
+        host_browsers, host_downloads = host_limits()
+        max_browsers = min(max_browsers, host_browsers) if max_browsers else host_browsers
+        max_downloads = min(max_downloads, host_downloads) if max_downloads else host_downloads
+        self.min_browsers = min(min_browsers, max_browsers)
+        self.max_browsers = max_browsers
+        self.min_downloads = min(min_downloads, max_downloads)
+        self.max_downloads = max_downloads
+        self.interval = interval
+        self.browsers = AdjustableLimiter('browsers', self.min_browsers)
+        self.downloads = AdjustableLimiter('downloads', self.min_downloads)
+        # 线程数按上限创建，实际同时下载的数量由downloads槽控制
+        self.download_executor = ThreadPoolExecutor(max_workers=self.max_downloads, thread_name_prefix='download')
+        self.process = psutil.Process(os.getpid())
+        self.last_sample = {}
+        self._last_bytes = None
+        self._last_throughput = 0
+        self._download_grown = False
+        self._hold = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        psutil.cpu_percent(None)
+        self._last_bytes = (time.time(), psutil.net_io_counters().bytes_recv)
+        self._thread = threading.Thread(target=self._run, name='governor', daemon=True)
+        self._thread.start()
+        logging.info(f"资源调度已开启：浏览器 {self.min_browsers}-{self.max_browsers}，下载并发 {self.min_downloads}-{self.max_downloads}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.download_executor.shutdown(wait=True)
+
+    def run_download(self, fn, args, kwargs):
+        try:
+            with self.downloads:
+                return fn(*args, **kwargs)
+        finally:
+            clear_stage()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.adjust(self.sample())
+            except Exception as e:
+                logging.error(f"资源调度采样失败: {e}")
+
+    def sample(self):
+        memory = psutil.virtual_memory()
+        chrome_rss = _chrome_rss(self.process)
+        now, received = time.time(), psutil.net_io_counters().bytes_recv
+        last_time, last_received = self._last_bytes or (now, received)
+        self._last_bytes = (now, received)
+        active_browsers = self.browsers.active
+        self.last_sample = {
+            'available': memory.available,
+            'total': memory.total,
+            'cpu': psutil.cpu_percent(None),
+            'rss': self.process.memory_info().rss,
+            'chrome_rss': chrome_rss,
+            'throughput': (received - last_received) / max(now - last_time, 1e-6),
+            'browser_rss': chrome_rss / active_browsers if active_browsers and chrome_rss else DEFAULT_BROWSER_RSS,
+        }
+        return self.last_sample
+
+    def adjust(self, sample):
+        """一次调度决策：内存不足时先减浏览器再减下载，资源富余且有任务在等待时逐个增加；
+        下载并发按网络吞吐爬坡，增加后吞吐没有提升说明带宽已饱和，回退一步并保持一段时间"""
+        available_ratio = sample['available'] / sample['total']
+        browsers = self.browsers.limit
+        downloads = self.downloads.limit
+
+        if available_ratio < MEMORY_CRITICAL:
+            browsers, downloads = self.min_browsers, self.min_downloads
+            reason = f"可用内存仅剩 {available_ratio:.0%}，降到下限"
+        elif available_ratio < MEMORY_RESERVE:
+            browsers = max(self.min_browsers, min(browsers, self.browsers.active) - 1)
+            downloads = max(self.min_downloads, downloads - 2)
+            reason = f"可用内存 {available_ratio:.0%} 低于预留比例，减少并发"
+        else:
+            reason = None
+            headroom = sample['available'] - sample['total'] * MEMORY_RESERVE
+            if (self.browsers.waiting and browsers < self.max_browsers
+                    and headroom > sample['browser_rss'] and sample['cpu'] < CPU_HIGH):
+                browsers += 1
+                reason = f"内存余量 {headroom / 1024 / 1024:.0f}MB，增加浏览器"
+            if sample['cpu'] >= CPU_HIGH and downloads > self.min_downloads:
+                downloads -= 1
+                reason = f"CPU使用率 {sample['cpu']:.0f}%，减少下载并发"
+            elif self._download_grown and sample['throughput'] < self._last_throughput * (1 + THROUGHPUT_GAIN):
+                downloads = max(self.min_downloads, downloads - 1)
+                self._hold = SATURATED_HOLD
+                reason = f"下载吞吐 {sample['throughput'] / 1024 / 1024:.1f}MB/s 未提升，回退下载并发"
+            elif self._hold:
+                self._hold -= 1
+            elif self.downloads.waiting and downloads < self.max_downloads and sample['cpu'] < CPU_HIGH:
+                downloads += 1
+                reason = reason or "有下载在等待，增加下载并发"
+        self._download_grown = downloads > self.downloads.limit
+        self._last_throughput = sample['throughput']
+
+        if browsers != self.browsers.limit or downloads != self.downloads.limit:
+            logging.info(
+                f"资源调度: 浏览器 {self.browsers.limit}->{browsers}，下载并发 {self.downloads.limit}->{downloads}（{reason}）"
+                f" 可用内存 {sample['available'] / 1024 / 1024:.0f}MB，CPU {sample['cpu']:.0f}%，"
+                f"浏览器内存 {sample['chrome_rss'] / 1024 / 1024:.0f}MB，下载吞吐 {sample['throughput'] / 1024 / 1024:.1f}MB/s"
+            )
+            self.browsers.set_limit(browsers)
+            self.downloads.set_limit(downloads)
+
+    def status(self):
+        return {
+            'browsers': {'limit': self.browsers.limit, 'active': self.browsers.active, 'waiting': self.browsers.waiting},
+            'downloads': {'limit': self.downloads.limit, 'active': self.downloads.active, 'waiting': self.downloads.waiting},
+            'available_mb': round(self.last_sample.get('available', 0) / 1024 / 1024),
+            'cpu': self.last_sample.get('cpu'),
+            'throughput_mb': round(self.last_sample.get('throughput', 0) / 1024 / 1024, 2),
+        }
+
+_governor = None
+
+def start_governor(min_browsers=1, max_browsers=None, min_downloads=2, max_downloads=None):
+    """开启全局资源调度；max_browsers、max_downloads为None时按本机资源推算"""
+    global _governor
+    _governor = Governor(min_browsers, max_browsers, min_downloads, max_downloads)
+    _governor.start()
+    return _governor
+
+def stop_governor():
+    global _governor
+    if _governor is not None:
+        _governor.stop()
+        _governor = None
+
+def get_governor():
+    return _governor
+
+def browser_slot():
+    """占用一个浏览器会话槽，未开启调度时不限制"""
+    return _governor.browsers if _governor is not None else nullcontext()
+
+def submit_download(fn, *args, **kwargs):
+    """把一张图片的下载和保存交给下载线程池，浏览器继续处理下一个详情页；同时进行的下载数由资源调度的下载槽控制。
+    未开启调度时在当前线程执行，返回已完成的Future"""
+    governor = _governor
+    if governor is not None:
+        return governor.download_executor.submit(governor.run_download, fn, args, kwargs)
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def yield_browser(driver, relaunch):
+    """在爬取循环的两个条目之间调用。资源调度降低了浏览器上限且占用数超过上限时，
+    关闭当前浏览器释放内存并让出会话槽，等重新拿到槽后用relaunch启动新的浏览器；未超限时原样返回driver"""
+    governor = _governor
+    if governor is None or not governor.browsers.release_if_over():
+        return driver
+    logging.info(f"浏览器数超过资源调度上限 {governor.browsers.limit}，关闭当前浏览器并暂停")
+    try:
+        driver.quit()
+    except Exception:
+        pass
+    start_time = time.time()
+    governor.browsers.acquire()
+    logging.info(f"重新获得浏览器会话槽，等待 {time.time() - start_time:.1f}秒，重新启动浏览器")
+    return relaunch()
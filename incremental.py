@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+# 增量爬取配置
+DEFAULT_STOP_AFTER_KNOWN = 50    # 连续遇到多少个已知结果后停止翻页
+MAX_SIGNATURES = 20000           # 每个关键词保留的结果签名数
+MAX_HISTORY = 100                # 新鲜度统计保留的运行次数
+
+# 签名和新鲜度文件的读改写锁，常驻服务中同一关键词的任务可能同时结束
+_lock = threading.Lock()
+
+def result_signature(candidate):
+    """结果签名：优先使用原图URL，详情页URL中常带有会话参数"""
+    key = candidate.get('source_url') or candidate.get('detail_url') or ''
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+def _signature_file(engine, keyword):
+    return f"records/{engine}_{keyword}_signatures.json"
+
+def _freshness_file(engine, keyword):
+    return f"records/{engine}_{keyword}_freshness.json"
+
+def load_signatures(engine, keyword):
+    """加载上次运行记录的结果签名，按记录顺序返回列表"""
+    signature_file = _signature_file(engine, keyword)
+    if not os.path.exists(signature_file):
+        return []
+    try:
+        with open(signature_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(f"读取结果签名失败: {e}")
+        return []
+
+def save_signatures(engine, keyword, signatures):
+    os.makedirs('records', exist_ok=True)
+    signature_file = _signature_file(engine, keyword)
+    tmp_file = f"{signature_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(signatures[-MAX_SIGNATURES:], f)
+    os.replace(tmp_file, signature_file)
+
+class ResultTracker:
+    """对比本次抓取到的结果流和上次运行的结果签名，连续遇到足够多已知结果时停止翻页"""
+
+    def __init__(self, engine, keyword, incremental=False, stop_after_known=DEFAULT_STOP_AFTER_KNOWN):
+        self.engine = engine
+        self.keyword = keyword
+        self.incremental = incremental
+        self.stop_after_known = stop_after_known
+        self.previous = load_signatures(engine, keyword)
+        self.known = set(self.previous)
+        self.seen = set()
+        self.evaluated = {}
+        self.new = []
+        self.known_count = 0
+        self.consecutive_known = 0
+        self.scrolls = 0
+
+    def add(self, candidates):
+        """按页面顺序加入新抓取到的候选，返回是否应停止翻页"""
+        for candidate in candidates:
+            signature = result_signature(candidate)
+            if signature in self.seen:
+                continue
+            self.seen.add(signature)
+            if signature in self.known:
+                self.known_count += 1
+                self.consecutive_known += 1
+            else:
+                self.consecutive_known = 0
+                self.new.append(candidate)
+        return self.should_stop()
+
+    def should_stop(self):
+        return self.incremental and bool(self.known) and self.consecutive_known >= self.stop_after_known
+
+    def select(self, candidates):
+        """增量模式下只保留上次运行没有处理过的候选"""
+        if not self.incremental:
+            return candidates
+        return [c for c in candidates if result_signature(c) not in self.known]
+
+    def mark_evaluated(self, candidate):
+        """记录已处理（下载、复用或因内容原因拒绝）的候选，下次运行时视为已知；
+        下载失败、页面出错等临时失败不记录，下次运行会重试"""
+        self.evaluated[result_signature(candidate)] = True
+
+    def save(self, downloaded, seconds):
+        """保存结果签名和本次运行的新鲜度统计；重新读取文件合并，不覆盖并发任务保存的结果"""
+        with _lock:
+            return self._save(downloaded, seconds)
+
+    def _save(self, downloaded, seconds):
+        current = load_signatures(self.engine, self.keyword)
+        signatures = [s for s in current if s not in self.evaluated] + list(self.evaluated)
+        save_signatures(self.engine, self.keyword, signatures)
+
+        harvested = len(self.seen)
+        run = {
+            'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'incremental': self.incremental,
+            'harvested': harvested,
+            'new': len(self.new),
+            'known': self.known_count,
+            'new_ratio': round(len(self.new) / harvested, 4) if harvested else 0,
+            'scrolls': self.scrolls,
+            'stopped_early': self.should_stop(),
+            'evaluated': len(self.evaluated),
+            'downloaded': downloaded,
+            'seconds': round(seconds, 2),
+        }
+        freshness_file = _freshness_file(self.engine, self.keyword)
+        stats = {'engine': self.engine, 'keyword': self.keyword, 'last_new_at': None, 'history': []}
+        if os.path.exists(freshness_file):
+            try:
+                with open(freshness_file, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+            except Exception as e:
+                logging.error(f"读取新鲜度统计失败: {e}")
+        stats['history'] = (stats.get('history', []) + [run])[-MAX_HISTORY:]
+        stats['last_run'] = run
+        if run['new']:
+            stats['last_new_at'] = run['time']
+        ratios = [r['new_ratio'] for r in stats['history']]
+        stats['avg_new_ratio'] = round(sum(ratios) / len(ratios), 4)
+        with open(freshness_file, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+
+        logging.info(
+            f"新鲜度: 抓取 {harvested} 个结果，新结果 {run['new']} 个（{run['new_ratio']:.0%}），"
+            f"已知 {self.known_count} 个，滚动 {self.scrolls} 次" + ("，已提前停止翻页" if run['stopped_early'] else "")
+        )
+        return run
@@ -0,0 +1,217 @@
+import os
+import time
+import uuid
+import atexit
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# 数据集清单配置
+MANIFEST_DIR = 'manifest'        # 清单文件目录
+FLUSH_ROWS = 500                 # 缓冲多少行写一个分片文件
+COMPACT_MIN_PARTS = 16           # 分片数达到多少时才进行合并
+
+SCHEMA = pa.schema([
+    ('engine', pa.string()),
+    ('keyword', pa.string()),
+    ('source_url', pa.string()),
+    ('detail_url', pa.string()),
+    ('content_hash', pa.string()),
+    ('width', pa.int32()),
+    ('height', pa.int32()),
+    ('format', pa.string()),
+    ('byte_size', pa.int64()),
+    ('rejection_reason', pa.string()),
+    ('sharpness', pa.float32()),
+    ('entropy', pa.float32()),
+    ('uniformity', pa.float32()),
+    ('aspect_ratio', pa.float32()),
+    ('placeholder_similarity', pa.float32()),
+    ('filename', pa.string()),
+    ('recorded_at', pa.timestamp('s')),
+])
+
+def content_hash(data):
+    """计算图片内容哈希"""
+    return hashlib.sha1(data).hexdigest()
+
+def _write_table(table, path):
+    """先写临时文件再重命名，保证读取方不会看到写了一半的文件"""
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+def _part_files(manifest_dir, prefix=''):
+    if not os.path.isdir(manifest_dir):
+        return []
+    return sorted(
+        os.path.join(manifest_dir, name) for name in os.listdir(manifest_dir)
+        if name.startswith(prefix) and name.endswith('.parquet')
+    )
+
+class ManifestWriter:
+    """缓冲清单记录，按批追加为不可变的Parquet分片文件"""
+
+    def __init__(self, manifest_dir=MANIFEST_DIR, flush_rows=FLUSH_ROWS):
+        self.manifest_dir = manifest_dir
+        self.flush_rows = flush_rows
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def append(self, row):
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) < self.flush_rows:
+                return
+            rows, self.rows = self.rows, []
+        self._write_part(rows)
+
+    def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if rows:
+            self._write_part(rows)
+
+    def _write_part(self, rows):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        columns = {field.name: [row.get(field.name) for row in rows] for field in SCHEMA}
+        table = pa.table(columns, schema=SCHEMA)
+        part_name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+        try:
+            _write_table(table, os.path.join(self.manifest_dir, part_name))
+            logging.debug(f"写入清单分片 {part_name}，共 {len(rows)} 行")
+        except Exception as e:
+            logging.error(f"写入清单分片失败: {e}")
+
+_writer = ManifestWriter()
+
+def record_candidate(engine, keyword, candidate=None, **fields):
+    """记录一个候选图片；candidate为预过滤阶段的元数据，fields覆盖或补充其中的字段"""
+    row = {
+        'engine': engine,
+        'keyword': keyword,
+        'recorded_at': datetime.now().replace(microsecond=0),
+    }
+    if candidate:
+        row['source_url'] = candidate.get('source_url')
+        row['detail_url'] = candidate.get('detail_url')
+        row['width'] = candidate.get('width')
+        row['height'] = candidate.get('height')
+        row['format'] = candidate.get('format')
+        row['byte_size'] = candidate.get('byte_size')
+        row['rejection_reason'] = candidate.get('reason')
+    row.update(fields)
+    _writer.append(row)
+
+def record_candidates(engine, keyword, candidates):
+    """批量记录候选图片，用于预过滤阶段被跳过的候选。
+    已下载的候选在下载时已有记录，每次运行都会被再次跳过，不重复记录"""
+    for candidate in candidates:
+        if candidate.get('reason') != 'already_downloaded':
+            record_candidate(engine, keyword, candidate)
+
+def flush_manifest():
+    """把缓冲中的记录写入分片文件"""
+    _writer.flush()
+
+def _dedupe(table, compacted):
+    """按 (关键词, 原图URL) 去重：同一图片优先保留已下载的记录，其次保留最新的记录。
+    已合并文件中已有下载记录的图片不再保留新记录；没有原图URL的记录全部保留"""
+    existing = {}
+    if compacted:
+        old = ds.dataset(compacted, format='parquet', schema=SCHEMA).to_table(
+            columns=['keyword', 'source_url', 'content_hash'])
+        for keyword, url, downloaded in zip(old['keyword'].to_pylist(), old['source_url'].to_pylist(),
+                                            pc.is_valid(old['content_hash']).to_pylist()):
+            if url is not None:
+                existing[(keyword, url)] = existing.get((keyword, url), False) or downloaded
+
+    table = table.append_column('_downloaded', pc.is_valid(table['content_hash']))
+    table = table.sort_by([('_downloaded', 'descending'), ('recorded_at', 'descending')])
+    keep = []
+    seen = set()
+    for keyword, url, downloaded in zip(table['keyword'].to_pylist(), table['source_url'].to_pylist(),
+                                        table['_downloaded'].to_pylist()):
+        key = (keyword, url)
+        if url is None:
+            keep.append(True)
+        elif key in seen or existing.get(key) or (key in existing and not downloaded):
+            keep.append(False)
+        else:
+            seen.add(key)
+            keep.append(True)
+    return table.filter(pa.array(keep)).drop_columns(['_downloaded'])
+
+def compact(manifest_dir=MANIFEST_DIR, min_parts=COMPACT_MIN_PARTS):
+    """把新写入的分片合并为一个按引擎和关键词排序的文件，便于按统计信息跳过行组。
+    已合并的文件不再重写，只用于去重"""
+    parts = _part_files(manifest_dir, 'part-')
+    if len(parts) < min_parts:
+        logging.info(f"清单分片数 {len(parts)} 未达到合并阈值 {min_parts}")
+        return None
+    start_time = time.time()
+    table = ds.dataset(parts, format='parquet', schema=SCHEMA).to_table()
+    rows = table.num_rows
+    table = _dedupe(table, _part_files(manifest_dir, 'compacted-'))
+    table = table.sort_by([('engine', 'ascending'), ('keyword', 'ascending')])
+    compacted = os.path.join(manifest_dir, f"compacted-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+    tmp_path = f"{compacted}.tmp"
+    pq.write_table(table, tmp_path, compression='zstd', row_group_size=128 * 1024)
+    os.replace(tmp_path, compacted)
+    for part in parts:
+        os.remove(part)
+    logging.info(f"合并 {len(parts)} 个清单分片为 {compacted}，共 {table.num_rows} 行（去除重复 {rows - table.num_rows} 行），耗时 {time.time() - start_time:.2f}秒")
+    return compacted
+
+def load_manifest(manifest_dir=MANIFEST_DIR, columns=None, filter=None):
+    """读取清单，filter为pyarrow.compute表达式，只读取需要的列和行组"""
+    parts = _part_files(manifest_dir)
+    if not parts:
+        return SCHEMA.empty_table()
+    return ds.dataset(parts, format='parquet', schema=SCHEMA).to_table(columns=columns, filter=filter)
+
+def main():
+    parser = argparse.ArgumentParser(description='数据集清单工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact_parser = subparsers.add_parser('compact', help='合并清单分片')
+    compact_parser.add_argument('--min_parts', type=int, default=2, help='分片数达到多少时才合并')
+
+    query_parser = subparsers.add_parser('query', help='统计满足条件的图片数量')
+    query_parser.add_argument('--keyword', help='关键词')
+    query_parser.add_argument('--engine', help='搜索引擎')
+    query_parser.add_argument('--min_size', type=int, default=0, help='最小边长')
+    query_parser.add_argument('--include_rejected', action='store_true', help='包含被拒绝的候选')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'compact':
+        compact(min_parts=args.min_parts)
+        return
+
+    start_time = time.time()
+    expr = pc.field('width') >= args.min_size
+    expr = expr & (pc.field('height') >= args.min_size)
+    if args.keyword:
+        expr = expr & (pc.field('keyword') == args.keyword)
+    if args.engine:
+        expr = expr & (pc.field('engine') == args.engine)
+    if not args.include_rejected:
+        expr = expr & pc.field('rejection_reason').is_null() & pc.field('content_hash').is_valid()
+    table = load_manifest(columns=['engine', 'keyword', 'content_hash'], filter=expr)
+    unique = len(pc.unique(table['content_hash'])) if table.num_rows else 0
+    print(f"匹配 {table.num_rows} 行，去重后 {unique} 张图片，耗时 {(time.time() - start_time) * 1000:.1f}毫秒")
+    for row in table.group_by(['engine', 'keyword']).aggregate([('content_hash', 'count')]).to_pylist():
+        print(f"  {row['engine']}\t{row['keyword']}\t{row['content_hash_count']}")
+
+atexit.register(flush_manifest)
+
+if __name__ == "__main__":
+    main()
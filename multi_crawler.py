@@ -8,6 +8,11 @@ from concurrent.futures import ThreadPoolExecutor
 import argparse
 from baidu_crawler import download_images_from_baidu
 from bing_crawler import crawl_bing_images
+import proxy_pool
+import drivers
+from incremental import DEFAULT_STOP_AFTER_KNOWN
+from profiler import start_profiling, stop_profiling
+from governor import start_governor, stop_governor, browser_slot, DEFAULT_WORKERS
 
 # 创建必要的目录
 def create_directories():
@@ -44,16 +49,18 @@ def setup_logging():
     )
     print(f"日志文件: {log_filename}")
 
-def crawl_task(keyword, num_images, engine='baidu'):
+def crawl_task(keyword, num_images, engine='baidu', incremental=False, stop_after_known=DEFAULT_STOP_AFTER_KNOWN):
     """单个爬虫任务"""
     try:
-        logging.info(f"开始处理关键词: {keyword}, 搜索引擎: {engine}")
-        if engine.lower() == 'baidu':
-            download_images_from_baidu(keyword, num_images)
-        elif engine.lower() == 'bing':
-            crawl_bing_images(keyword, limit=num_images)
-        else:
-            logging.error(f"不支持的搜索引擎: {engine}")
+        # 资源调度器决定同时运行多少个浏览器会话
+        with browser_slot():
+            logging.info(f"开始处理关键词: {keyword}, 搜索引擎: {engine}")
+            if engine.lower() == 'baidu':
+                download_images_from_baidu(keyword, num_images, incremental=incremental, stop_after_known=stop_after_known)
+            elif engine.lower() == 'bing':
+                crawl_bing_images(keyword, limit=num_images, incremental=incremental, stop_after_known=stop_after_known)
+            else:
+                logging.error(f"不支持的搜索引擎: {engine}")
     except Exception as e:
         logging.error(f"处理关键词 {keyword} 时发生错误: {e}")
 
@@ -61,8 +68,18 @@ def main():
     parser = argparse.ArgumentParser(description='多线程图片爬虫')
     parser.add_argument('--keywords', nargs='+', required=True, help='要搜索的关键词列表')
     parser.add_argument('--num_images', type=int, default=100, help='每个关键词要下载的图片数量')
-    parser.add_argument('--max_workers', type=int, default=3, help='最大线程数')
+    parser.add_argument('--max_workers', type=int, default=None,
+                        help=f'最大线程数（默认{DEFAULT_WORKERS}）；开启资源调度时为可选的浏览器会话数封顶，默认按CPU核数和内存推算')
+    parser.add_argument('--min_workers', type=int, default=1, help='开启资源调度时的浏览器会话数下限')
+    parser.add_argument('--max_downloads', type=int, default=None, help='开启资源调度时可选的下载并发数封顶，默认按CPU核数推算')
+    parser.add_argument('--governor', action='store_true', help='开启资源调度，按内存、CPU和网络吞吐自动调整浏览器会话数和下载并发数')
     parser.add_argument('--engine', choices=['baidu', 'bing'], default='baidu', help='搜索引擎选择')
+    parser.add_argument('--proxies', nargs='*', default=[], help='代理出口列表，如 http://127.0.0.1:8001')
+    parser.add_argument('--proxy_rate', type=int, default=proxy_pool.DEFAULT_RATE_PER_MINUTE, help='每个代理出口每分钟的请求数')
+    parser.add_argument('--incremental', action='store_true', help='增量爬取，遇到上次已处理的结果后停止翻页')
+    parser.add_argument('--stop_after_known', type=int, default=DEFAULT_STOP_AFTER_KNOWN, help='增量爬取时连续遇到多少个已知结果后停止')
+    parser.add_argument('--driver', choices=drivers.BACKENDS, default='selenium', help='浏览器驱动后端：selenium 或 cdp（直接通过DevTools协议控制Chrome）')
+    parser.add_argument('--profile', action='store_true', help='开启采样性能分析，结束时输出火焰图和热点报告')
     
     args = parser.parse_args()
     
@@ -72,30 +89,54 @@ def main():
     # 设置日志
     setup_logging()
     
-    start_time = time.time()
-    logging.info(f"开始多线程爬虫任务")
-    logging.info(f"关键词列表: {args.keywords}")
-    logging.info(f"每个关键词图片数量: {args.num_images}")
-    logging.info(f"最大线程数: {args.max_workers}")
-    logging.info(f"搜索引擎: {args.engine}")
+    if args.profile:
+        start_profiling('multi_crawler')
     
-    # 使用线程池执行任务
-    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-        # 提交所有任务
-        futures = [
-            executor.submit(crawl_task, keyword, args.num_images, args.engine)
-            for keyword in args.keywords
-        ]
-        
-        # 等待所有任务完成
-        for future in futures:
-            try:
-                future.result()
-            except Exception as e:
-                logging.error(f"任务执行失败: {e}")
+    # 中断时也要停止调度线程并写出性能分析结果
+    governor = None
+    try:
+        start_time = time.time()
+        logging.info(f"开始多线程爬虫任务")
+        logging.info(f"关键词列表: {args.keywords}")
+        logging.info(f"每个关键词图片数量: {args.num_images}")
+        logging.info(f"搜索引擎: {args.engine}")
+        if args.incremental:
+            logging.info(f"增量爬取：连续遇到 {args.stop_after_known} 个已知结果后停止翻页")
+    
+        # 配置代理池
+        proxy_pool.configure(args.proxies, args.proxy_rate)
+        drivers.set_backend(args.driver)
     
-    total_time = time.time() - start_time
-    logging.info(f"所有任务完成！总耗时: {total_time:.2f}秒")
+        if args.governor:
+            # 关键词线程数取推算出的浏览器上限，实际同时运行的浏览器由资源调度决定
+            governor = start_governor(args.min_workers, args.max_workers, max_downloads=args.max_downloads)
+            max_workers = governor.max_browsers
+        else:
+            max_workers = args.max_workers or DEFAULT_WORKERS
+        logging.info(f"最大线程数: {max_workers}")
+    
+        # 使用线程池执行任务
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 提交所有任务
+            futures = [
+                executor.submit(crawl_task, keyword, args.num_images, args.engine, args.incremental, args.stop_after_known)
+                for keyword in args.keywords
+            ]
+        
+            # 等待所有任务完成
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"任务执行失败: {e}")
+        
+        total_time = time.time() - start_time
+        logging.info(f"所有任务完成！总耗时: {total_time:.2f}秒")
+    finally:
+        if governor is not None:
+            stop_governor()
+        if args.profile:
+            stop_profiling()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import logging
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs, urljoin
+
+# 默认过滤规则，只依据搜索结果中的元数据判断，不发起任何HTTP请求
+DEFAULT_FILTER_RULES = {
+    'min_size': (512, 512),                                         # 最小宽高
+    'allowed_formats': {'jpg', 'jpeg', 'png', 'webp', 'bmp'},       # 允许的图片格式
+    'max_bytes': 20 * 1024 * 1024,                                  # 最大文件大小
+}
+
+# 已知的坏图URL模式（必应的裂图、占位图等），必应详情页也用它判断是否需要刷新重试
+BROKEN_URL_PATTERNS = [
+    r'https://th\.bing\.com/th/id/.*\?cb=iwp2',
+    r'https://th\.bing\.com/th/id/.*\?rs=1',
+    r'https://th\.bing\.com/th/id/.*\?pid=ImgDetMain',
+]
+
+# 只在预过滤中拒绝的URL模式：内联的data URI不是原图地址；GIF、SVG等格式由allowed_formats检查
+PREFILTER_URL_PATTERNS = BROKEN_URL_PATTERNS + [
+    r'^data:',
+]
+
+# 百度objurl混淆编码的还原表
+BAIDU_STR_TABLE = {'_z2C$q': ':', '_z&e3B': '.', 'AzdH3F': '/'}
+BAIDU_CHAR_TABLE = dict(zip('wkv1ju2it3hs4g5rq6fp7eo8dn9cm0bla', 'abcdefghijklmnopqrstuvw1234567890'))
+
+# 跳过记录文件的读改写锁
+_records_lock = threading.Lock()
+
+def _to_int(value):
+    """把查询参数转换为整数，无法转换时返回None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _first_param(params, name):
+    values = params.get(name)
+    return values[0] if values else None
+
+def guess_format(url):
+    """根据URL路径猜测图片格式"""
+    if not url:
+        return None
+    path = urlparse(url).path.lower()
+    match = re.search(r'\.(jpe?g|png|webp|bmp|gif|svg|tiff?|avif)', path)
+    if not match:
+        return None
+    ext = match.group(1)
+    return 'jpg' if ext == 'jpeg' else ext
+
+def decode_baidu_objurl(objurl):
+    """还原百度混淆过的objurl"""
+    if not objurl or objurl.startswith('http'):
+        return objurl
+    for key, value in BAIDU_STR_TABLE.items():
+        objurl = objurl.replace(key, value)
+    return ''.join(BAIDU_CHAR_TABLE.get(c, c) for c in objurl)
+
+def parse_baidu_detail_link(detail_url):
+    """从百度详情页链接中提取原图元数据"""
+    params = parse_qs(urlparse(detail_url).query)
+    source_url = decode_baidu_objurl(_first_param(params, 'objurl'))
+    return {
+        'detail_url': detail_url,
+        'source_url': source_url if source_url and source_url.startswith('http') else None,
+        'thumb_url': None,
+        'width': _to_int(_first_param(params, 'width')),
+        'height': _to_int(_first_param(params, 'height')),
+        'format': guess_format(source_url),
+        'byte_size': _to_int(_first_param(params, 'filesize')),
+    }
+
+def parse_bing_detail_link(href):
+    """从必应详情页链接中提取原图元数据"""
+    detail_url = urljoin("https://www.bing.com", href)
+    params = parse_qs(urlparse(detail_url).query)
+    source_url = _first_param(params, 'mediaurl')
+    return {
+        'detail_url': detail_url,
+        'source_url': source_url,
+        'thumb_url': _first_param(params, 'cdnurl'),
+        'width': _to_int(_first_param(params, 'expw')),
+        'height': _to_int(_first_param(params, 'exph')),
+        'format': guess_format(source_url),
+        'byte_size': None,
+    }
+
+def check_candidate(candidate, rules=None):
+    """检查单个候选图片，返回跳过原因；元数据缺失时不拒绝，返回None表示通过"""
+    rules = rules or DEFAULT_FILTER_RULES
+    source_url = candidate.get('source_url')
+
+    if source_url and any(re.search(p, source_url) for p in PREFILTER_URL_PATTERNS):
+        return 'bad_url_pattern'
+
+    width, height = candidate.get('width'), candidate.get('height')
+    min_w, min_h = rules.get('min_size', (0, 0))
+    if width is not None and height is not None and (width < min_w or height < min_h):
+        return f'too_small ({width}x{height})'
+
+    fmt = candidate.get('format')
+    allowed = rules.get('allowed_formats')
+    if fmt and allowed and fmt not in allowed:
+        return f'format ({fmt})'
+
+    byte_size = candidate.get('byte_size')
+    max_bytes = rules.get('max_bytes')
+    if byte_size is not None and max_bytes and byte_size > max_bytes:
+        return f'too_large ({byte_size})'
+
+    return None
+
+def downloaded_source_urls(downloaded_urls):
+    """下载记录以详情页的图片地址为键，百度的objurl等原图地址通常是另一个字符串，记录在source_url字段中；
+    两种地址都返回，与候选的source_url比较"""
+    urls = set(downloaded_urls or {})
+    for record in (downloaded_urls or {}).values():
+        if isinstance(record, dict) and record.get('source_url'):
+            urls.add(record['source_url'])
+    return urls
+
+def filter_candidates(candidates, downloaded_urls=None, rules=None):
+    """根据元数据过滤候选图片，返回 (通过列表, 跳过列表)，跳过项带有reason字段"""
+    known = downloaded_source_urls(downloaded_urls)
+    accepted = []
+    skipped = []
+    for candidate in candidates:
+        if candidate.get('source_url') in known:
+            reason = 'already_downloaded'
+        else:
+            reason = check_candidate(candidate, rules)
+        if reason:
+            skipped.append(dict(candidate, reason=reason))
+        else:
+            accepted.append(candidate)
+    return accepted, skipped
+
+def save_skipped_candidates(engine, keyword, skipped):
+    """把被跳过的候选图片及原因写入记录文件；并发任务的读改写需要加锁"""
+    if not skipped:
+        return
+    record_file = f"records/{engine}_{keyword}_skipped.json"
+    with _records_lock:
+        records = {}
+        if os.path.exists(record_file):
+            try:
+                with open(record_file, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            except Exception as e:
+                logging.error(f"读取跳过记录失败: {e}")
+
+        skip_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for candidate in skipped:
+            key = candidate.get('source_url') or candidate['detail_url']
+            records[key] = {
+                'detail_url': candidate['detail_url'],
+                'reason': candidate['reason'],
+                'skip_time': skip_time
+            }
+
+        try:
+            with open(record_file, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logging.error(f"保存跳过记录失败: {e}")
+
+def log_skip_summary(skipped):
+    """按原因汇总输出跳过的候选数量"""
+    summary = {}
+    for candidate in skipped:
+        reason = candidate['reason'].split(' ')[0]
+        summary[reason] = summary.get(reason, 0) + 1
+    for reason, count in summary.items():
+        logging.info(f"预过滤跳过 {count} 个候选，原因: {reason}")
@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+import html
+import logging
+import threading
+from datetime import datetime
+from collections import Counter
+
+# 采样分析配置
+PROFILE_DIR = 'profiles'         # 分析结果目录
+SAMPLE_INTERVAL = 0.01           # 采样间隔（秒）
+MAX_DEPTH = 64                   # 每个调用栈最多保留的帧数
+TOP_N = 30                       # 热点报告中列出的函数数
+
+# 线程ID -> 当前流水线阶段（scroll/extract/navigate/download/validate/write/record）
+_stages = {}
+
+def set_stage(name):
+    """标记当前线程所处的流水线阶段，未开启分析时只是一次字典赋值"""
+    _stages[threading.get_ident()] = name
+
+def clear_stage():
+    """线程池中的任务结束时调用，空闲的工作线程不再归入上一个任务的阶段"""
+    _stages.pop(threading.get_ident(), None)
+
+def _thread_cpu_time(ident):
+    """读取指定线程的CPU时间，平台不支持时返回None"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError, ValueError):
+        return None
+
+# 代码对象 -> 帧标签，每个函数只格式化一次
+_labels = {}
+
+# 线程空闲时停靠的函数：等待锁、条件变量、队列或事件
+_PARKED = {('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('queue.py', 'get'),
+           ('thread.py', '_worker')}
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+def _is_parked(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _PARKED
+
+class SamplingProfiler:
+    """对所有线程周期性采样调用栈，按阶段区分墙钟时间和CPU时间"""
+
+    def __init__(self, name, interval=SAMPLE_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.wall = Counter()
+        self.cpu = Counter()
+        self.stage_wall = Counter()
+        self.stage_cpu = Counter()
+        self.samples = 0
+        self._cpu_times = {}
+        self._stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        logging.info(f"性能分析已开启，采样间隔 {self.interval * 1000:.0f}毫秒")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        names = {}
+        last = time.time()
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            elapsed, last = now - last, now
+            frames = sys._current_frames()
+            if frames.keys() != names.keys():
+                names = {t.ident: t.name for t in threading.enumerate()}
+                self._forget_exited(frames)
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                # 没有标记阶段、停在等待中的线程（空闲的线程池工作线程、后台读线程等）不采样
+                if ident not in _stages and _is_parked(frame):
+                    continue
+                self._sample(ident, frame, names.get(ident, str(ident)), elapsed)
+            self.samples += 1
+
+    def _forget_exited(self, frames):
+        """清理已退出线程的阶段、CPU时间和调用栈缓存"""
+        for table in (_stages, self._cpu_times, self._stacks):
+            for ident in [i for i in table if i not in frames]:
+                table.pop(ident, None)
+
+    def effective_interval(self):
+        """实际采样间隔；GIL竞争激烈时会比配置的间隔长"""
+        if not self.samples or not self.started_at:
+            return self.interval
+        return (time.time() - self.started_at) / self.samples
+
+    def _sample(self, ident, frame, thread_name, elapsed):
+        stage = _stages.get(ident, 'other')
+        # 栈顶帧和执行位置都没变时调用栈不变，直接复用上次的键
+        position = (frame, frame.f_lasti, stage)
+        cached = self._stacks.get(ident)
+        if cached is not None and cached[0] == position:
+            key = cached[1]
+        else:
+            stack = []
+            top = frame
+            while top is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_label(top.f_code))
+                top = top.f_back
+            key = ';'.join([stage, thread_name.split('_')[0]] + stack[::-1])
+            self._stacks[ident] = (position, key)
+        self.wall[key] += 1
+        self.stage_wall[stage] += 1
+
+        # 两次采样之间线程CPU时间增加超过一半间隔，视为该样本在占用CPU
+        cpu_time = _thread_cpu_time(ident)
+        if cpu_time is None:
+            return
+        last = self._cpu_times.get(ident)
+        self._cpu_times[ident] = cpu_time
+        if last is not None and cpu_time - last >= elapsed / 2:
+            self.cpu[key] += 1
+            self.stage_cpu[stage] += 1
+
+    def write_reports(self, profile_dir=PROFILE_DIR):
+        """写出折叠调用栈、火焰图和热点报告，返回报告文件路径"""
+        os.makedirs(profile_dir, exist_ok=True)
+        base = os.path.join(profile_dir, f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        for kind, counter in (('wall', self.wall), ('cpu', self.cpu)):
+            with open(f"{base}_{kind}.folded", 'w', encoding='utf-8') as f:
+                for key, count in counter.most_common():
+                    f.write(f"{key} {count}\n")
+            with open(f"{base}_{kind}.svg", 'w', encoding='utf-8') as f:
+                f.write(render_flamegraph(counter, f"{self.name} - {kind}"))
+        report_file = f"{base}_hotspots.txt"
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write(self.hotspot_report())
+        logging.info(f"性能分析结果已保存: {base}_*.svg, {report_file}")
+        return report_file
+
+    def hotspot_report(self, top_n=TOP_N):
+        duration = time.time() - self.started_at if self.started_at else 0
+        interval = self.effective_interval()
+        lines = [f"性能分析: {self.name}，时长 {duration:.1f}秒，采样 {self.samples} 次，实际间隔 {interval * 1000:.1f}毫秒", ""]
+
+        lines.append("各阶段耗时（线程秒）:")
+        lines.append(f"  {'阶段':<12}{'墙钟':>10}{'CPU':>10}")
+        for stage, count in self.stage_wall.most_common():
+            lines.append(f"  {stage:<12}{count * interval:>10.2f}{self.stage_cpu[stage] * interval:>10.2f}")
+        lines.append("")
+
+        for kind, counter in (('墙钟', self.wall), ('CPU', self.cpu)):
+            self_counts = Counter()
+            total_counts = Counter()
+            for key, count in counter.items():
+                frames = key.split(';')[2:]
+                if not frames:
+                    continue
+                self_counts[frames[-1]] += count
+                for label in set(frames):
+                    total_counts[label] += count
+            lines.append(f"{kind}热点（按自身时间，前{top_n}）:")
+            for label, count in self_counts.most_common(top_n):
+                lines.append(f"  {count * interval:>8.2f}s 自身  {total_counts[label] * interval:>8.2f}s 累计  {label}")
+            lines.append("")
+        return '\n'.join(lines)
+
+def render_flamegraph(counter, title, width=1200, frame_height=16):
+    """把折叠调用栈渲染为SVG火焰图"""
+    root = {'count': 0, 'children': {}}
+    for key, count in counter.items():
+        node = root
+        node['count'] += count
+        for label in key.split(';'):
+            node = node['children'].setdefault(label, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    rects = []
+    max_depth = [0]
+
+    def walk(node, x, depth):
+        max_depth[0] = max(max_depth[0], depth)
+        for label, child in sorted(node['children'].items()):
+            w = child['count'] / root['count'] * width if root['count'] else 0
+            if w >= 0.5:
+                rects.append((x, depth, w, label, child['count']))
+                walk(child, x, depth + 1)
+            x += w
+
+    walk(root, 0, 0)
+    height = (max_depth[0] + 2) * frame_height + 30
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="5" y="18" font-size="14">{html.escape(title)}</text>',
+    ]
+    for x, depth, w, label, count in rects:
+        y = height - (depth + 1) * frame_height
+        hue = 10 + hash(label.split(' ')[0]) % 50
+        text = html.escape(label)
+        parts.append(
+            f'<g><title>{text} ({count} samples)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" fill="hsl({hue},80%,60%)"/>'
+            + (f'<text x="{x + 2:.1f}" y="{y + frame_height - 4}">{html.escape(label[:int(w / 7)])}</text>' if w > 30 else '')
+            + '</g>'
+        )
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+_profiler = None
+
+def start_profiling(name):
+    """开启全局采样分析"""
+    global _profiler
+    _profiler = SamplingProfiler(name)
+    _profiler.start()
+    return _profiler
+
+def stop_profiling():
+    """停止采样并写出报告"""
+    global _profiler
+    if _profiler is None:
+        return None
+    _profiler.stop()
+    report_file = _profiler.write_reports()
+    _profiler = None
+    return report_file
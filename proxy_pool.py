@@ -0,0 +1,233 @@
+import time
+import logging
+import threading
+
+# 代理池配置
+DEFAULT_RATE_PER_MINUTE = 30     # 每个出口每分钟允许的搜索引擎请求数
+BURST = 5                        # 令牌桶容量
+DOWNLOAD_RATE_PER_MINUTE = 600   # 每个出口每分钟允许的图片下载数，图片分散在各个第三方主机上，单独计算预算
+DOWNLOAD_BURST = 20
+BAN_COOLDOWN = 600               # 首次封禁的冷却时间（秒），重复封禁时翻倍
+MAX_BAN_COOLDOWN = 3600
+HEALTH_ALPHA = 0.2               # 健康分的指数平滑系数
+MIN_HEALTH = 0.3                 # 健康分低于该值的出口不再分配给新会话
+
+# 搜索引擎封禁/验证页面的特征
+BAN_URL_MARKERS = ['wappass.baidu.com', '/captcha', 'bing.com/challenge']
+BAN_PAGE_MARKERS = ['百度安全验证', '安全验证', 'unusual traffic', 'captcha']
+
+class TokenBucket:
+    """令牌桶限速"""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """取一个令牌，预算不足时等待"""
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class ProxyExit:
+    """单个代理出口：搜索引擎和图片下载分别限速、健康分和封禁状态"""
+
+    def __init__(self, url, rate_per_minute, download_rate_per_minute=DOWNLOAD_RATE_PER_MINUTE):
+        self.url = url
+        self.buckets = {
+            'search': TokenBucket(rate_per_minute, BURST),
+            'download': TokenBucket(download_rate_per_minute, DOWNLOAD_BURST),
+        }
+        self.health = 1.0
+        self.banned_until = 0
+        self.ban_count = 0
+        self.sessions = 0
+        self.lock = threading.Lock()
+
+    def is_banned(self, now=None):
+        return (now or time.time()) < self.banned_until
+
+    def take(self, kind='search'):
+        """取一个对应类型的令牌，预算不足时等待"""
+        self.buckets[kind].take()
+
+    def __repr__(self):
+        return f"ProxyExit({self.url}, health={self.health:.2f})"
+
+class ProxyPool:
+    """代理出口池，同一浏览器会话固定使用同一出口，封禁后自动换出"""
+
+    def __init__(self, proxy_urls, rate_per_minute=DEFAULT_RATE_PER_MINUTE, download_rate_per_minute=DOWNLOAD_RATE_PER_MINUTE):
+        self.exits = [ProxyExit(url, rate_per_minute, download_rate_per_minute) for url in proxy_urls]
+        self.assignments = {}
+        self.launched = {}
+        self.lock = threading.Lock()
+
+    def _pick(self):
+        now = time.time()
+        usable = [e for e in self.exits if not e.is_banned(now) and e.health >= MIN_HEALTH]
+        if not usable:
+            usable = [e for e in self.exits if not e.is_banned(now)]
+        if not usable:
+            # 全部被封禁时选择最早解封的出口
+            logging.warning("所有代理出口都处于封禁状态，选择最早解封的出口")
+            return min(self.exits, key=lambda e: e.banned_until)
+        return min(usable, key=lambda e: (e.sessions, -e.health))
+
+    def acquire(self, session_key):
+        """为会话分配出口；已分配的出口在被封禁前保持不变"""
+        if not self.exits:
+            return None
+        with self.lock:
+            current = self.assignments.get(session_key)
+            if current is not None and not current.is_banned():
+                return current
+            if current is not None:
+                current.sessions -= 1
+            chosen = self._pick()
+            chosen.sessions += 1
+            self.assignments[session_key] = chosen
+        if current is not None and current is not chosen:
+            logging.info(f"会话 {session_key} 从代理 {current.url} 切换到 {chosen.url}")
+        return chosen
+
+    def mark_launched(self, session_key, proxy):
+        """记录会话的浏览器启动时使用的出口；之后分配变化也不影响已启动的浏览器"""
+        with self.lock:
+            self.launched[session_key] = proxy
+
+    def launched_exit(self, session_key):
+        """会话浏览器实际使用的出口，未记录时按分配返回"""
+        with self.lock:
+            if session_key in self.launched:
+                return self.launched[session_key]
+        return self.acquire(session_key)
+
+    def release(self, session_key):
+        with self.lock:
+            self.launched.pop(session_key, None)
+            current = self.assignments.pop(session_key, None)
+            if current is not None:
+                current.sessions -= 1
+
+    def report(self, proxy, ok):
+        """记录一次请求结果，更新健康分"""
+        if proxy is None:
+            return
+        with proxy.lock:
+            proxy.health = (1 - HEALTH_ALPHA) * proxy.health + HEALTH_ALPHA * (1.0 if ok else 0.0)
+
+    def report_ban(self, proxy):
+        """标记出口被封禁，冷却期内不再分配"""
+        if proxy is None:
+            return
+        with proxy.lock:
+            cooldown = min(BAN_COOLDOWN * 2 ** proxy.ban_count, MAX_BAN_COOLDOWN)
+            proxy.ban_count += 1
+            proxy.banned_until = time.time() + cooldown
+            proxy.health = (1 - HEALTH_ALPHA) * proxy.health
+        logging.warning(f"代理出口 {proxy.url} 被封禁，冷却 {cooldown} 秒")
+
+_pool = ProxyPool([])
+
+def configure(proxy_urls, rate_per_minute=DEFAULT_RATE_PER_MINUTE, download_rate_per_minute=DOWNLOAD_RATE_PER_MINUTE):
+    """配置全局代理池，proxy_urls为空时所有流量直连"""
+    global _pool
+    _pool = ProxyPool(proxy_urls or [], rate_per_minute, download_rate_per_minute)
+    if proxy_urls:
+        logging.info(f"代理池已配置 {len(proxy_urls)} 个出口，每个出口每分钟 {rate_per_minute} 次搜索请求、"
+                     f"{download_rate_per_minute} 次图片下载")
+
+def get_pool():
+    return _pool
+
+def acquire(session_key):
+    return _pool.acquire(session_key)
+
+def release(session_key):
+    _pool.release(session_key)
+
+def launch(launch_driver, session_key):
+    """用会话分配的出口启动浏览器，并记录该出口"""
+    proxy = acquire(session_key)
+    driver = launch_driver(proxy)
+    _pool.mark_launched(session_key, proxy)
+    return driver
+
+def session_exit(session_key):
+    """会话浏览器实际使用的出口，用于搜索引擎请求的限速和封禁标记"""
+    return _pool.launched_exit(session_key)
+
+def throttle(proxy, kind='search'):
+    """按出口的速率预算等待；kind为'search'（搜索引擎页面）或'download'（图片下载）"""
+    if proxy is not None:
+        proxy.take(kind)
+
+def report(proxy, ok):
+    _pool.report(proxy, ok)
+
+def report_ban(proxy):
+    _pool.report_ban(proxy)
+
+def requests_proxies(proxy):
+    """转换为requests的proxies参数"""
+    if proxy is None:
+        return None
+    return {'http': proxy.url, 'https': proxy.url}
+
+def chrome_argument(proxy):
+    """转换为Chrome的启动参数"""
+    if proxy is None:
+        return None
+    return f"--proxy-server={proxy.url}"
+
+def is_ban_page(driver):
+    """检查浏览器当前页面是否是封禁或验证页面"""
+    try:
+        current_url = driver.current_url or ''
+        if any(marker in current_url for marker in BAN_URL_MARKERS):
+            return True
+        title = driver.title or ''
+        return any(marker.lower() in title.lower() for marker in BAN_PAGE_MARKERS)
+    except Exception:
+        return False
+
+def open_with_rotation(launch_driver, session_key, url, max_rotations=3):
+    """用分配的出口启动浏览器并打开url，遇到封禁页面时换出口重启浏览器"""
+    for attempt in range(max_rotations + 1):
+        driver = launch(launch_driver, session_key)
+        proxy = session_exit(session_key)
+        throttle(proxy)
+        driver.get(url)
+        if not is_ban_page(driver):
+            report(proxy, True)
+            return driver
+        if proxy is None:
+            # 未配置代理时没有可切换的出口，保持原有行为继续执行
+            logging.warning(f"检测到封禁或验证页面，但未配置代理: {url}")
+            return driver
+        report_ban(proxy)
+        driver.quit()
+    raise RuntimeError(f"打开页面时持续遇到封禁或验证页面: {url}")
+
+def handle_ban(driver, launch_driver, session_key, url):
+    """标记当前浏览器启动时使用的出口被封禁，换出口重启浏览器并打开url，返回新的driver"""
+    proxy = session_exit(session_key)
+    if proxy is None:
+        logging.warning("检测到封禁或验证页面，但未配置代理")
+        return driver
+    # 共用该出口的其他会话可能已经标记过封禁，不重复延长冷却
+    if not proxy.is_banned():
+        report_ban(proxy)
+    driver.quit()
+    return open_with_rotation(launch_driver, session_key, url)
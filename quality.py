@@ -0,0 +1,340 @@
+import os
+import time
+import struct
+import shutil
+import logging
+import argparse
+import threading
+import cv2
+import numpy as np
+import yaml
+
+# 默认质量规则，指标都在统一尺寸的灰度缩略图上计算，阈值可在config.yaml的quality段覆盖
+DEFAULT_QUALITY_RULES = {
+    'min_sharpness': 15.0,              # 拉普拉斯方差下限，低于视为模糊
+    'min_entropy': 2.0,                 # 灰度熵下限（32个灰度级，最大5比特），低于视为内容过少
+    'max_uniformity': 0.85,             # 占比最高的灰度级的比例上限，高于视为近乎纯色
+    'max_aspect_ratio': 4.0,            # 长边/短边上限，超过视为横幅、长图
+    'max_placeholder_similarity': 0.9,  # 与占位图模板的相关系数上限
+}
+
+THUMB_SIZE = 128                 # 计算清晰度和熵的缩略图边长
+TEMPLATE_SIZE = 32               # 与占位图模板比较的尺寸
+HIST_BINS = 32                   # 熵和均匀度使用的灰度级数
+TEMPLATE_DIR = 'quality_templates'   # 占位图模板目录（如必应的裂图占位图）
+CONFIG_FILE = 'config.yaml'
+BATCH_SIZE = 256
+INLINE_BATCH_WAIT = 0.01         # 下载线程打分时等待其他线程凑批的最长时间（秒）
+
+def load_quality_rules(config_file=CONFIG_FILE):
+    """读取config.yaml中的quality段，覆盖默认规则"""
+    rules = dict(DEFAULT_QUALITY_RULES)
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = yaml.safe_load(f) or {}
+            rules.update({k: v for k, v in (config.get('quality') or {}).items() if k in rules})
+        except Exception as e:
+            logging.error(f"读取质量规则失败，使用默认规则: {e}")
+    return rules
+
+_rules = None
+_templates = None
+
+def get_quality_rules():
+    global _rules
+    if _rules is None:
+        _rules = load_quality_rules()
+    return _rules
+
+def _reduced_flag(byte_size):
+    """按文件大小选择缩小解码的倍数，JPEG可在DCT阶段直接缩小，不需要完整解码"""
+    if byte_size > 1024 * 1024:
+        return cv2.IMREAD_REDUCED_GRAYSCALE_8
+    if byte_size > 128 * 1024:
+        return cv2.IMREAD_REDUCED_GRAYSCALE_4
+    if byte_size > 32 * 1024:
+        return cv2.IMREAD_REDUCED_GRAYSCALE_2
+    return cv2.IMREAD_GRAYSCALE
+
+def _thumbnail(gray):
+    return cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA)
+
+def _aspect_ratio(shape):
+    h, w = shape[:2]
+    return max(w, h) / max(min(w, h), 1)
+
+# JPEG中携带宽高的SOF段标记（排除DHT、JPG、DAC）
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_size(data):
+    """逐个跳过JPEG段，读取SOF段中的宽高"""
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+def _webp_size(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+def image_info(data):
+    """只解析文件头，返回实际的 (宽, 高, 格式)；无法识别时返回 (None, None, None)"""
+    size, fmt = None, None
+    if data[:2] == b'\xff\xd8':
+        size, fmt = _jpeg_size(data), 'jpg'
+    elif data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        size, fmt = struct.unpack('>II', data[16:24]), 'png'
+    elif data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        size, fmt = _webp_size(data), 'webp'
+    elif data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        size, fmt = struct.unpack('<HH', data[6:10]), 'gif'
+    elif data[:2] == b'BM' and len(data) >= 26:
+        width, height = struct.unpack('<ii', data[18:26])
+        size, fmt = (width, abs(height)), 'bmp'
+    if not size:
+        return None, None, None
+    return int(size[0]), int(size[1]), fmt
+
+def decode_thumbnail(data):
+    """低分辨率解码为灰度缩略图，返回 (缩略图, 宽高比)；无法解码时返回 (None, None)"""
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), _reduced_flag(len(data)))
+    if gray is None or gray.size == 0:
+        return None, None
+    return _thumbnail(gray), _aspect_ratio(gray.shape)
+
+def _template_vectors(batch):
+    """把 (N, THUMB_SIZE, THUMB_SIZE) 的缩略图缩小为零均值、单位长度的向量，用于计算相关系数"""
+    n = len(batch)
+    factor = THUMB_SIZE // TEMPLATE_SIZE
+    small = batch.reshape(n, TEMPLATE_SIZE, factor, TEMPLATE_SIZE, factor).mean(axis=(2, 4)).reshape(n, -1)
+    small -= small.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(small, axis=1, keepdims=True)
+    return small / np.maximum(norms, 1e-6)
+
+def load_templates(template_dir=TEMPLATE_DIR):
+    """加载占位图模板，目录不存在时没有模板"""
+    if not os.path.isdir(template_dir):
+        return np.zeros((0, TEMPLATE_SIZE * TEMPLATE_SIZE), np.float32)
+    thumbs = []
+    for name in sorted(os.listdir(template_dir)):
+        with open(os.path.join(template_dir, name), 'rb') as f:
+            thumb, _ = decode_thumbnail(f.read())
+        if thumb is not None:
+            thumbs.append(thumb)
+    logging.info(f"加载 {len(thumbs)} 个占位图模板")
+    if not thumbs:
+        return np.zeros((0, TEMPLATE_SIZE * TEMPLATE_SIZE), np.float32)
+    return _template_vectors(np.stack(thumbs).astype(np.float32))
+
+def get_templates():
+    global _templates
+    if _templates is None:
+        _templates = load_templates()
+    return _templates
+
+def score_thumbnails(thumbs, aspect_ratios, templates=None):
+    """对一批缩略图向量化计算质量指标，返回每张图片的指标字典"""
+    if not thumbs:
+        return []
+    templates = get_templates() if templates is None else templates
+    pixels = np.stack(thumbs)
+    batch = pixels.astype(np.float32)
+    n = len(batch)
+
+    # 清晰度：4邻域拉普拉斯响应的方差
+    lap = (batch[:, :-2, 1:-1] + batch[:, 2:, 1:-1] + batch[:, 1:-1, :-2] + batch[:, 1:-1, 2:]
+           - 4 * batch[:, 1:-1, 1:-1])
+    sharpness = lap.reshape(n, -1).var(axis=1)
+
+    # 熵和均匀度：每张图片的灰度直方图一次bincount算完
+    levels = (pixels >> 3).reshape(n, -1).astype(np.int64) + (np.arange(n) * HIST_BINS)[:, None]
+    hist = np.bincount(levels.ravel(), minlength=n * HIST_BINS).reshape(n, HIST_BINS) / (THUMB_SIZE * THUMB_SIZE)
+    entropy = -(hist * np.log2(np.where(hist > 0, hist, 1))).sum(axis=1)
+    uniformity = hist.max(axis=1)
+
+    # 与占位图模板的最大相关系数
+    if len(templates):
+        similarity = (_template_vectors(batch) @ templates.T).max(axis=1)
+    else:
+        similarity = np.zeros(n)
+
+    return [
+        {
+            'sharpness': round(float(sharpness[i]), 2),
+            'entropy': round(float(entropy[i]), 3),
+            'uniformity': round(float(uniformity[i]), 3),
+            'aspect_ratio': round(float(aspect_ratios[i]), 3),
+            'placeholder_similarity': round(float(similarity[i]), 3),
+        }
+        for i in range(n)
+    ]
+
+def score_images(datas, templates=None):
+    """批量低分辨率解码并打分，无法解码的图片返回None"""
+    decoded = [decode_thumbnail(data) for data in datas]
+    valid = [i for i, (thumb, _) in enumerate(decoded) if thumb is not None]
+    scores = score_thumbnails([decoded[i][0] for i in valid], [decoded[i][1] for i in valid], templates)
+    results = [None] * len(datas)
+    for i, score in zip(valid, scores):
+        results[i] = score
+    return results
+
+class ScoreBatcher:
+    """把多个下载线程的缩略图合并成一批打分。
+    各线程自己做低分辨率解码，第一个到达的线程等待INLINE_BATCH_WAIT收集其他线程的缩略图，再一次向量化计算整批指标"""
+
+    def __init__(self, max_batch=BATCH_SIZE, max_wait=INLINE_BATCH_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.pending = []
+        self.collecting = False
+
+    def score(self, data):
+        """低分辨率解码并打分，无法解码时返回None"""
+        thumb, aspect_ratio = decode_thumbnail(data)
+        if thumb is None:
+            return None
+        item = {'thumb': thumb, 'aspect_ratio': aspect_ratio, 'score': None, 'done': False}
+        with self.cond:
+            self.pending.append(item)
+            if self.collecting:
+                if len(self.pending) >= self.max_batch:
+                    self.cond.notify_all()
+                while not item['done']:
+                    self.cond.wait()
+                return item['score']
+            self.collecting = True
+            deadline = time.time() + self.max_wait
+            while len(self.pending) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch, self.pending = self.pending, []
+            self.collecting = False
+        try:
+            scores = score_thumbnails([i['thumb'] for i in batch], [i['aspect_ratio'] for i in batch])
+        except Exception as e:
+            logging.error(f"批量质量评分失败: {e}")
+            scores = [None] * len(batch)
+        with self.cond:
+            for i, score in zip(batch, scores):
+                i['score'] = score
+                i['done'] = True
+            self.cond.notify_all()
+        return item['score']
+
+_batcher = ScoreBatcher()
+
+def score_image_data(data):
+    """下载流程中为单张图片打分，与同时在下载的其他线程合并成批"""
+    return _batcher.score(data)
+
+def check_quality(score, rules=None):
+    """按规则检查质量指标，返回拒绝原因，通过时返回None"""
+    rules = rules or get_quality_rules()
+    if score is None:
+        return 'undecodable'
+    if score['uniformity'] > rules['max_uniformity']:
+        return f"near_uniform ({score['uniformity']:.2f})"
+    if score['entropy'] < rules['min_entropy']:
+        return f"low_entropy ({score['entropy']:.2f})"
+    if score['sharpness'] < rules['min_sharpness']:
+        return f"blurry ({score['sharpness']:.1f})"
+    if score['aspect_ratio'] > rules['max_aspect_ratio']:
+        return f"aspect_ratio ({score['aspect_ratio']:.1f})"
+    if score['placeholder_similarity'] > rules['max_placeholder_similarity']:
+        return f"placeholder ({score['placeholder_similarity']:.2f})"
+    return None
+
+def check_image(score, width, height, min_size=None, rules=None):
+    """引擎的接收规则：实际尺寸不小于min_size（为None时不检查尺寸）且质量合格；返回拒绝原因，通过时返回None。
+    下载和复用索引中的文件使用同一规则"""
+    if min_size is not None and width is not None and height is not None and (width < min_size[0] or height < min_size[1]):
+        return f"too_small ({width}x{height})"
+    return check_quality(score, rules)
+
+def ledger_fields(score):
+    """转换为数据集清单中的质量列"""
+    if score is None:
+        return {}
+    return {
+        'sharpness': score['sharpness'],
+        'entropy': score['entropy'],
+        'uniformity': score['uniformity'],
+        'aspect_ratio': score['aspect_ratio'],
+        'placeholder_similarity': score['placeholder_similarity'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='批量图片质量评分')
+    parser.add_argument('directories', nargs='+', help='图片目录，如 downloads/bing_泥土')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help='每批处理的图片数')
+    parser.add_argument('--move_rejected', action='store_true', help='把不合格的图片移动到目录下的invalid子目录')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    rules = get_quality_rules()
+    logging.info(f"质量规则: {rules}")
+    for directory in args.directories:
+        paths = [
+            os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if os.path.isfile(os.path.join(directory, name))
+        ]
+        reasons = {}
+        start_time = time.time()
+        for i in range(0, len(paths), args.batch_size):
+            batch_paths = paths[i:i + args.batch_size]
+            datas = []
+            for path in batch_paths:
+                with open(path, 'rb') as f:
+                    datas.append(f.read())
+            for path, score in zip(batch_paths, score_images(datas)):
+                reason = check_quality(score, rules)
+                if reason is None:
+                    continue
+                reasons[path] = reason
+                logging.debug(f"{path}: {reason}")
+        elapsed = time.time() - start_time
+        rate = len(paths) / elapsed if elapsed > 0 else 0
+        logging.info(f"{directory}: 共 {len(paths)} 张，不合格 {len(reasons)} 张，耗时 {elapsed:.2f}秒（{rate:.0f}张/秒）")
+
+        summary = {}
+        for reason in reasons.values():
+            key = reason.split(' ')[0]
+            summary[key] = summary.get(key, 0) + 1
+        for key, count in sorted(summary.items(), key=lambda x: -x[1]):
+            logging.info(f"  {key}: {count} 张")
+
+        if args.move_rejected and reasons:
+            invalid_dir = os.path.join(directory, 'invalid')
+            os.makedirs(invalid_dir, exist_ok=True)
+            for path in reasons:
+                shutil.move(path, os.path.join(invalid_dir, os.path.basename(path)))
+            logging.info(f"已把 {len(reasons)} 张不合格图片移动到 {invalid_dir}")
+
+if __name__ == "__main__":
+    main()
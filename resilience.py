@@ -0,0 +1,255 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+import proxy_pool
+import resumable
+from profiler import set_stage, clear_stage
+
+# 对冲请求与熔断配置
+LATENCY_WINDOW = 200            # 每个主机保留的最近耗时样本数
+MIN_SAMPLES = 10                # 样本数不足时使用默认对冲延迟
+HEDGE_QUANTILE = 0.95           # 超过该分位数的耗时后发起对冲请求
+DEFAULT_HEDGE_DELAY = 3.0       # 默认对冲延迟（秒）
+MIN_HEDGE_DELAY = 0.2           # 最小对冲延迟（秒）
+BREAKER_FAILURES = 5            # 连续失败多少次后熔断
+BREAKER_COOLDOWN = 60           # 熔断后多久允许试探请求（秒）
+
+class CircuitOpenError(Exception):
+    """所有候选主机都处于熔断状态"""
+
+class HostStats:
+    """单个主机的耗时分布和熔断状态"""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+        self.probe_token = None
+
+    def quantile(self, q):
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+_lock = threading.Lock()
+_hosts = {}
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='hedge')
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+def _stats(host):
+    stats = _hosts.get(host)
+    if stats is None:
+        stats = _hosts[host] = HostStats()
+    return stats
+
+def record_success(url, latency):
+    """记录一次成功请求的耗时，并关闭熔断"""
+    with _lock:
+        stats = _stats(host_of(url))
+        stats.latencies.append(latency)
+        stats.failures = 0
+        stats.opened_at = None
+        stats.probe_at = None
+        stats.probe_token = None
+
+def record_failure(url):
+    """记录一次失败，连续失败达到阈值后熔断该主机"""
+    host = host_of(url)
+    with _lock:
+        stats = _stats(host)
+        stats.failures += 1
+        stats.probe_at = None
+        stats.probe_token = None
+        if stats.failures >= BREAKER_FAILURES and stats.opened_at is None:
+            stats.opened_at = time.time()
+            logging.warning(f"主机 {host} 连续失败 {stats.failures} 次，已熔断 {BREAKER_COOLDOWN} 秒")
+        elif stats.opened_at is not None:
+            # 试探失败，重新计时
+            stats.opened_at = time.time()
+
+def _available(stats, now):
+    if stats.opened_at is None:
+        return True
+    if now - stats.opened_at < BREAKER_COOLDOWN:
+        return False
+    return stats.probe_at is None or now - stats.probe_at >= BREAKER_COOLDOWN
+
+def is_available(url):
+    """熔断中的主机不可用；冷却结束后没有进行中的试探请求时可用。只做检查，不占用试探名额"""
+    with _lock:
+        return _available(_stats(host_of(url)), time.time())
+
+def claim_request(url):
+    """真正发出请求前调用：熔断冷却结束的主机每个冷却周期只放行一个试探请求，名额已被占用时返回None。
+    放行时返回一个凭证，归还试探名额时要交回"""
+    now = time.time()
+    token = object()
+    with _lock:
+        stats = _stats(host_of(url))
+        if not _available(stats, now):
+            return None
+        if stats.opened_at is not None:
+            stats.probe_at = now
+            stats.probe_token = token
+        return token
+
+def release_claim(url, token):
+    """请求被取消或失败原因与主机无关时归还试探名额；只有持有试探名额的请求才能归还"""
+    with _lock:
+        stats = _stats(host_of(url))
+        if token is not None and stats.probe_token is token:
+            stats.probe_at = None
+            stats.probe_token = None
+
+def hedge_delay(url):
+    """返回发起对冲请求前的等待时间，即该主机耗时的p95"""
+    with _lock:
+        p95 = _stats(host_of(url)).quantile(HEDGE_QUANTILE)
+    if p95 is None:
+        return DEFAULT_HEDGE_DELAY
+    return max(p95, MIN_HEDGE_DELAY)
+
+def _is_host_failure(error):
+    """4xx（429除外）只说明该URL有问题，不计入主机的熔断统计"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return True
+
+# 返回403说明是出口被封的主机：搜索引擎自己的图片服务器。第三方图床的403多为防盗链，与出口无关
+ENGINE_IMAGE_HOSTS = ('baidu.com', 'bdimg.com', 'bdstatic.com', 'bing.com', 'bing.net')
+
+def _is_exit_ban(error):
+    """下载返回429（限流）或搜索引擎图片服务器返回403时，视为当前出口被封禁"""
+    if not isinstance(error, requests.HTTPError) or error.response is None:
+        return False
+    status = error.response.status_code
+    if status == 429:
+        return True
+    host = host_of(error.response.url or '').split(':')[0]
+    return status == 403 and any(host == h or host.endswith('.' + h) for h in ENGINE_IMAGE_HOSTS)
+
+def _get(url, session, timeout, cancel, proxy=None, started=None):
+    """对冲线程池中的任务，结束后清除阶段标记，空闲的线程不再计入download"""
+    try:
+        return _download(url, session, timeout, cancel, proxy, started)
+    finally:
+        clear_stage()
+
+def _download(url, session, timeout, cancel, proxy=None, started=None):
+    """下载单个URL，cancel被设置时提前放弃；真正发出请求时设置started"""
+    set_stage('download')
+    proxy_pool.throttle(proxy, 'download')
+    claim = claim_request(url)
+    if claim is None:
+        raise CircuitOpenError(f"主机 {host_of(url)} 处于熔断状态")
+    if started is not None:
+        started.set()
+    start_time = time.time()
+    try:
+        content = resumable.download(session, url, timeout, cancel, proxy_pool.requests_proxies(proxy))
+    except Exception as e:
+        if not cancel.is_set() and _is_host_failure(e):
+            record_failure(url)
+            proxy_pool.report(proxy, False)
+        else:
+            release_claim(url, claim)
+        raise
+    if content is None:
+        # 被另一个请求抢先完成而取消，不算作试探结果
+        release_claim(url, claim)
+        return None
+    record_success(url, time.time() - start_time)
+    proxy_pool.report(proxy, True)
+    return content, url
+
+def _hedged_get(primary, hedge, session, timeout, proxy=None):
+    """先请求主URL，超过p95仍未完成时对备用URL发起对冲请求，先成功者胜出"""
+    cancel = threading.Event()
+    started = threading.Event()
+    futures = [_executor.submit(_get, primary, session, timeout, cancel, proxy, started)]
+    # 在线程池中排队和等待限流的时间不算请求耗时，主请求真正发出后才开始计算对冲延迟
+    futures[0].add_done_callback(lambda _: started.set())
+    started.wait()
+    done, _ = wait(futures, timeout=hedge_delay(primary))
+    if not done and hedge and is_available(hedge):
+        logging.debug(f"请求超过p95仍未完成，发起对冲请求: {hedge}")
+        futures.append(_executor.submit(_get, hedge, session, timeout, cancel, proxy))
+
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if result is not None:
+                cancel.set()
+                return result
+    raise error
+
+def fetch(url, alternates=None, session=None, timeout=10, max_attempts=3):
+    """带对冲请求、熔断和退避重试的下载，返回 (内容, 实际使用的URL)"""
+    session = session or requests
+    urls = []
+    for candidate in [url] + list(alternates or []):
+        if candidate and candidate.startswith('http') and candidate not in urls:
+            urls.append(candidate)
+
+    # 一次下载（包括重试）固定使用同一个代理出口，结束后归还，出口的会话计数才能反映实际负载
+    session_key = f"download-{threading.current_thread().name}"
+    proxy = proxy_pool.acquire(session_key)
+    try:
+        return _fetch_with_retries(urls, session, timeout, max_attempts, session_key, proxy)
+    finally:
+        proxy_pool.release(session_key)
+
+def _fetch_with_retries(urls, session, timeout, max_attempts, session_key, proxy):
+    last_error = None
+    primary = None
+    rotation = 0
+    for attempt in range(max_attempts):
+        usable = [u for u in urls if is_available(u)]
+        if not usable:
+            raise CircuitOpenError(f"所有候选主机都处于熔断状态: {[host_of(u) for u in urls]}")
+        # 有未完成下载的URL继续作为主URL续传，续传不下去（临时文件被丢弃或主机熔断）后才切换；
+        # 否则每次重试轮换主URL，避免总是打到同一个慢主机
+        resuming = [u for u in usable if resumable.has_partial(u)]
+        if primary not in resuming:
+            if resuming:
+                primary = resuming[0]
+            else:
+                primary = usable[rotation % len(usable)]
+                rotation += 1
+        # 对冲请求只发往其他URL，同一URL的第二个请求无法使用临时文件
+        hedge = usable[(usable.index(primary) + 1) % len(usable)]
+        if hedge == primary:
+            hedge = None
+        try:
+            return _hedged_get(primary, hedge, session, timeout, proxy)
+        except Exception as e:
+            last_error = e
+            banned = proxy is not None and _is_exit_ban(e)
+            if banned and not proxy.is_banned():
+                proxy_pool.report_ban(proxy)
+            if banned or (proxy is not None and proxy.health < proxy_pool.MIN_HEALTH):
+                # 出口被封禁或健康分过低，换一个出口重试
+                proxy_pool.release(session_key)
+                proxy = proxy_pool.acquire(session_key)
+            if attempt + 1 < max_attempts:
+                backoff = min(0.5 * 2 ** attempt, 4) * random.uniform(0.5, 1.5)
+                logging.warning(f"下载失败，{backoff:.1f}秒后重试 ({attempt + 1}/{max_attempts}): {primary}, 错误: {e}")
+                time.sleep(backoff)
+    raise last_error
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# 断点续传配置
+PARTIAL_DIR = 'downloads/.partial'   # 未完成下载的临时文件目录
+PARTIAL_MAX_AGE = 24 * 3600          # 超过该时间的未完成文件不再续传
+SWEEP_INTERVAL = 3600                # 清理过期未完成文件的间隔（秒）
+CHUNK_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+_active = set()
+_last_sweep = 0
+
+def _partial_paths(url):
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(PARTIAL_DIR, f"{key}.part"), os.path.join(PARTIAL_DIR, f"{key}.json")
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def sweep_partials(max_age=PARTIAL_MAX_AGE):
+    """删除超过max_age未更新的未完成文件：进程被杀死或URL不再请求时留下的临时文件不会再被续传"""
+    if not os.path.isdir(PARTIAL_DIR):
+        return 0
+    now = time.time()
+    removed = 0
+    for name in os.listdir(PARTIAL_DIR):
+        path = os.path.join(PARTIAL_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        logging.info(f"清理 {removed} 个过期的未完成下载文件")
+    return removed
+
+def _maybe_sweep():
+    """进程内第一次下载前以及之后每隔SWEEP_INTERVAL清理一次"""
+    global _last_sweep
+    with _lock:
+        now = time.time()
+        if now - _last_sweep < SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    sweep_partials()
+
+def has_partial(url):
+    """url是否有可续传的未完成下载"""
+    data_path, meta_path = _partial_paths(url)
+    try:
+        return (os.path.getsize(data_path) > 0 and os.path.exists(meta_path)
+                and time.time() - os.path.getmtime(data_path) <= PARTIAL_MAX_AGE)
+    except OSError:
+        return False
+
+def _validator(headers):
+    """返回可用于If-Range的校验值；弱ETag不能用于范围请求"""
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+def _load_partial(url):
+    """读取可续传的未完成下载，返回 (已下载字节数, 校验值)"""
+    data_path, meta_path = _partial_paths(url)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return 0, None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except Exception:
+        _remove(data_path, meta_path)
+        return 0, None
+    if meta.get('url') != url or time.time() - os.path.getmtime(data_path) > PARTIAL_MAX_AGE:
+        _remove(data_path, meta_path)
+        return 0, None
+    return os.path.getsize(data_path), meta.get('validator')
+
+def _parse_content_range(value):
+    """解析Content-Range，返回 (起始字节, 总长度)；无法解析的部分为None"""
+    match = re.match(r'bytes (?:(\d+)-\d+|\*)/(\d+|\*)', value or '')
+    if not match:
+        return None, None
+    start, total = match.groups()
+    return (int(start) if start else None), (int(total) if total != '*' else None)
+
+def _stream_to_memory(response, cancel):
+    chunks = []
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if cancel is not None and cancel.is_set():
+            response.close()
+            return None
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def download(session, url, timeout=10, cancel=None, proxies=None):
+    """下载url的完整内容；中断时保留已下载部分，下次用Range/If-Range续传。cancel被设置时返回None"""
+    _maybe_sweep()
+    with _lock:
+        resumable = url not in _active
+        if resumable:
+            _active.add(url)
+
+    if not resumable:
+        # 同一URL正在被其他线程下载（如对冲请求），这次不使用临时文件
+        response = session.get(url, timeout=timeout, stream=True, proxies=proxies)
+        response.raise_for_status()
+        return _stream_to_memory(response, cancel)
+
+    try:
+        return _download_resumable(session, url, timeout, cancel, proxies)
+    finally:
+        with _lock:
+            _active.discard(url)
+
+def _download_resumable(session, url, timeout, cancel, proxies):
+    data_path, meta_path = _partial_paths(url)
+    offset, validator = _load_partial(url)
+
+    # 范围请求按原始字节计算，不接受压缩传输
+    headers = {'Accept-Encoding': 'identity'}
+    if offset and validator:
+        response = session.get(url, timeout=timeout, stream=True, proxies=proxies,
+                               headers=dict(headers, **{'Range': f"bytes={offset}-", 'If-Range': validator}))
+        start, total = _parse_content_range(response.headers.get('Content-Range'))
+        if response.status_code == 206 and start == offset:
+            logging.info(f"从 {offset/1024:.1f}KB 处续传: {url}")
+            return _write_partial(response, data_path, meta_path, offset, cancel)
+        if response.status_code == 416 and total == offset:
+            # 上次已经下载完整，只是没来得及清理临时文件
+            response.close()
+            with open(data_path, 'rb') as f:
+                content = f.read()
+            _remove(data_path, meta_path)
+            return content
+        if response.status_code in (206, 416):
+            # 返回的范围无法接在已下载部分之后，丢弃已下载部分，不带Range重新请求
+            logging.warning(f"续传响应与已下载部分不匹配（{response.status_code} {response.headers.get('Content-Range')}），从头下载: {url}")
+            response.close()
+            _remove(data_path, meta_path)
+            response = session.get(url, timeout=timeout, stream=True, proxies=proxies, headers=headers)
+    else:
+        response = session.get(url, timeout=timeout, stream=True, proxies=proxies, headers=headers)
+    response.raise_for_status()
+    if response.status_code == 206:
+        # 没有请求范围却收到部分内容，不能当作完整文件
+        response.close()
+        raise IOError(f"服务器在未请求范围时返回了部分内容: {response.headers.get('Content-Range')}")
+
+    # 服务器不支持范围请求或文件已变化，从头下载
+    validator = _validator(response.headers)
+    if validator is None:
+        # 没有校验值无法安全续传，直接在内存中下载
+        _remove(data_path, meta_path)
+        return _stream_to_memory(response, cancel)
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    _remove(data_path)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'validator': validator}, f)
+    return _write_partial(response, data_path, meta_path, 0, cancel)
+
+def _write_partial(response, data_path, meta_path, offset, cancel):
+    """把响应追加到临时文件，完整后读出内容并清理临时文件；不完整时保留以便续传，被取消时删除"""
+    expected = response.headers.get('Content-Length')
+    expected = offset + int(expected) if expected and expected.isdigit() else None
+
+    cancelled = False
+    with open(data_path, 'ab' if offset else 'wb') as f:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            f.write(chunk)
+    if cancelled:
+        # 内容已经由另一个请求拿到，这个URL之后不会再请求，保留临时文件只会一直占用磁盘
+        response.close()
+        _remove(data_path, meta_path)
+        return None
+
+    size = os.path.getsize(data_path)
+    if expected is not None and size < expected:
+        raise IOError(f"下载不完整: {size}/{expected} 字节，保留已下载部分以便续传")
+
+    with open(data_path, 'rb') as f:
+        content = f.read()
+    _remove(data_path, meta_path)
+    return content
@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from queue import Queue
+from datetime import datetime
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+import baidu_crawler
+import bing_crawler
+import proxy_pool
+import drivers
+from debug_capture import flush_debug_captures
+from manifest import flush_manifest
+from governor import start_governor, stop_governor, get_governor, browser_slot
+
+# 爬虫服务配置
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_BROWSERS = 2             # 每个搜索引擎预热的浏览器数
+MAX_FINISHED_JOBS = 200          # 内存中保留的已结束任务数
+EVENT_WAIT = 15                  # 事件流无新事件时发送心跳的间隔（秒）
+
+ENGINES = {
+    'baidu': (baidu_crawler.setup_driver, baidu_crawler.download_images_from_baidu),
+    'bing': (bing_crawler.setup_driver, bing_crawler.crawl_bing_images),
+}
+
+def setup_logging():
+    """配置日志系统，服务内所有任务共用一个日志文件"""
+    os.makedirs('logs', exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_filename = f"logs/crawl_service_{timestamp}.log"
+
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s',
+        handlers=[
+            logging.FileHandler(log_filename, encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+    print(f"日志文件: {log_filename}")
+
+class DriverPool:
+    """预热的浏览器池；每个浏览器固定一个代理会话，任务结束后检查存活并归还"""
+
+    def __init__(self, engine, size):
+        self.engine = engine
+        self.launch_driver = ENGINES[engine][0]
+        self.slots = Queue()
+        self.all_slots = []
+        threads = []
+        for i in range(size):
+            slot = {'key': f"{engine}-warm-{i}", 'driver': None}
+            self.all_slots.append(slot)
+            thread = threading.Thread(target=self._launch, args=(slot,), name=f"warm-{engine}-{i}")
+            thread.start()
+            threads.append(thread)
+        # 并行启动浏览器，启动时间只付一次
+        for thread in threads:
+            thread.join()
+        for slot in self.all_slots:
+            self.slots.put(slot)
+
+    def _launch(self, slot):
+        start_time = time.time()
+        try:
+            slot['driver'] = proxy_pool.launch(self.launch_driver, slot['key'])
+            slot['driver'].get('about:blank')
+            logging.info(f"预热浏览器 {slot['key']} 完成，耗时 {time.time() - start_time:.2f}秒")
+        except Exception as e:
+            slot['driver'] = None
+            logging.error(f"预热浏览器 {slot['key']} 失败: {e}")
+
+    def acquire(self):
+        slot = self.slots.get()
+        if slot['driver'] is None:
+            self._launch(slot)
+        return slot
+
+    def release(self, slot):
+        """回到空白页以释放页面内存；浏览器已失效（如被资源调度关闭）时在上限允许的情况下重新启动"""
+        try:
+            slot['driver'].get('about:blank')
+        except Exception as e:
+            logging.warning(f"浏览器 {slot['key']} 已失效: {e}")
+            try:
+                slot['driver'].quit()
+            except Exception:
+                pass
+            slot['driver'] = None
+        # 资源调度器降低了浏览器上限时，关闭多余的空闲浏览器释放内存，下次取用时再启动
+        governor = get_governor()
+        if slot['driver'] is None:
+            if governor is None or self.live_count() < governor.browsers.limit:
+                self._launch(slot)
+        elif governor is not None and self.live_count() > governor.browsers.limit:
+            logging.info(f"资源调度降低了浏览器上限，关闭空闲浏览器 {slot['key']}")
+            try:
+                slot['driver'].quit()
+            except Exception:
+                pass
+            slot['driver'] = None
+        self.slots.put(slot)
+
+    def live_count(self):
+        return sum(1 for slot in self.all_slots if slot['driver'] is not None)
+
+    def close(self):
+        for slot in self.all_slots:
+            if slot['driver'] is not None:
+                try:
+                    slot['driver'].quit()
+                except Exception:
+                    pass
+            proxy_pool.release(slot['key'])
+
+class Job:
+    """一次爬取任务，记录进度事件供查询和流式订阅"""
+
+    def __init__(self, engine, keywords, num_images, incremental=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.engine = engine
+        self.keywords = keywords
+        self.num_images = num_images
+        self.incremental = incremental
+        self.status = 'queued'
+        self.results = {}
+        self.errors = {}
+        self.remaining = len(keywords)
+        self.events = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cond = threading.Condition()
+
+    def add_event(self, event):
+        with self.cond:
+            self.events.append(dict(event, job_id=self.id, ts=round(time.time(), 3)))
+            self.cond.notify_all()
+
+    def keyword_finished(self, keyword, result=None, error=None):
+        with self.cond:
+            if error is None:
+                self.results[keyword] = result
+            else:
+                self.errors[keyword] = error
+            self.remaining -= 1
+            finished = self.remaining == 0
+            if finished:
+                self.status = 'failed' if len(self.errors) == len(self.keywords) else 'done'
+                self.finished_at = time.time()
+        if finished:
+            self.add_event({'event': 'job_finished', 'status': self.status})
+
+    def mark_running(self):
+        with self.cond:
+            if self.status == 'queued':
+                self.status = 'running'
+
+    def is_finished(self):
+        return self.finished_at is not None
+
+    def wait_events(self, start, timeout):
+        """返回start之后的事件，没有新事件时最多等待timeout秒"""
+        with self.cond:
+            if len(self.events) <= start and not self.is_finished():
+                self.cond.wait(timeout)
+            return self.events[start:], self.is_finished()
+
+    def to_dict(self):
+        with self.cond:
+            return {
+                'job_id': self.id,
+                'engine': self.engine,
+                'keywords': self.keywords,
+                'num_images': self.num_images,
+                'incremental': self.incremental,
+                'status': self.status,
+                'results': dict(self.results),
+                'errors': dict(self.errors),
+                'created_at': datetime.fromtimestamp(self.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+                'seconds': round((self.finished_at or time.time()) - self.created_at, 2),
+            }
+
+class CrawlService:
+    """常驻爬虫服务：浏览器和HTTP连接池保持预热，多个任务并发共享"""
+
+    def __init__(self, engines, browsers=DEFAULT_BROWSERS):
+        start_time = time.time()
+        self.pools = {engine: DriverPool(engine, browsers) for engine in engines}
+        # 每个引擎单独排队，一个引擎的长任务不会占满其他引擎的工作线程
+        self.executors = {
+            engine: ThreadPoolExecutor(max_workers=browsers, thread_name_prefix=f"job-{engine}") for engine in engines
+        }
+        self.jobs = {}
+        self.lock = threading.Lock()
+        logging.info(f"爬虫服务就绪，引擎: {', '.join(engines)}，每个引擎 {browsers} 个浏览器，预热耗时 {time.time() - start_time:.2f}秒")
+
+    def submit(self, engine, keywords, num_images, incremental=False):
+        if engine not in self.pools:
+            raise ValueError(f"不支持的搜索引擎: {engine}")
+        if not keywords:
+            raise ValueError("关键词列表不能为空")
+        job = Job(engine, keywords, num_images, incremental)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._trim_jobs()
+        job.add_event({'event': 'job_queued', 'keywords': keywords})
+        for keyword in keywords:
+            self.executors[engine].submit(self._run_keyword, job, keyword)
+        logging.info(f"接收任务 {job.id}: 引擎 {engine}，关键词 {keywords}，每个关键词 {num_images} 张")
+        return job
+
+    def _trim_jobs(self):
+        finished = [job for job in self.jobs.values() if job.is_finished()]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    def _run_keyword(self, job, keyword):
+        pool = self.pools[job.engine]
+        crawl = ENGINES[job.engine][1]
+        # 先拿到本引擎的浏览器再占用资源调度的会话槽，等待浏览器时不占用全局名额
+        slot = pool.acquire()
+        try:
+            with browser_slot():
+                job.mark_running()
+                job.add_event({'event': 'keyword_started', 'keyword': keyword, 'browser': slot['key']})
+                if slot['driver'] is None:
+                    raise RuntimeError(f"浏览器 {slot['key']} 不可用")
+                result = crawl(keyword, job.num_images, driver=slot['driver'], progress=job.add_event,
+                               session_key=slot['key'], configure_logging=False, incremental=job.incremental)
+            job.keyword_finished(keyword, result=result)
+        except Exception as e:
+            logging.error(f"任务 {job.id} 处理关键词 {keyword} 时发生错误: {e}")
+            job.add_event({'event': 'keyword_failed', 'keyword': keyword, 'error': str(e)})
+            job.keyword_finished(keyword, error=str(e))
+        finally:
+            pool.release(slot)
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in sorted(jobs, key=lambda j: j.created_at)]
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'idle_browsers': {engine: pool.slots.qsize() for engine, pool in self.pools.items()},
+            'jobs': len(self.jobs),
+            'governor': get_governor().status() if get_governor() is not None else None,
+        }
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        for pool in self.pools.values():
+            pool.close()
+        flush_debug_captures()
+        flush_manifest()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """任务提交接口：
+    POST /jobs                 提交任务，请求体 {"engine": "baidu", "keywords": [...], "num_images": 100, "incremental": false}
+    GET  /jobs                 列出任务
+    GET  /jobs/<id>            查询任务状态和结果
+    GET  /jobs/<id>/events     以NDJSON流式输出任务进度，任务结束后关闭连接
+    GET  /health               服务状态
+    """
+
+    service = None
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是JSON对象")
+            keywords = payload.get('keywords') or ([payload['keyword']] if payload.get('keyword') else [])
+            job = self.service.submit(payload.get('engine', 'baidu'), keywords, int(payload.get('num_images', 100)),
+                                      bool(payload.get('incremental', False)))
+        except (ValueError, TypeError, KeyError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(202, job.to_dict())
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['health']:
+            self._send_json(200, self.service.health())
+        elif parts == ['jobs']:
+            self._send_json(200, self.service.list_jobs())
+        elif len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.service.get_job(parts[1])
+            if job is None:
+                self._send_json(404, {'error': f"任务不存在: {parts[1]}"})
+            elif len(parts) == 2:
+                self._send_json(200, job.to_dict())
+            elif parts[2] == 'events':
+                self._stream_events(job)
+            else:
+                self._send_json(404, {'error': 'not found'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def _stream_events(self, job):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                events, finished = job.wait_events(sent, EVENT_WAIT)
+                lines = events or [{'event': 'heartbeat', 'job_id': job.id}]
+                self.wfile.write(''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in lines).encode('utf-8'))
+                self.wfile.flush()
+                sent += len(events)
+                if finished and sent >= len(job.events):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug(f"事件流客户端断开: {job.id}")
+        self.close_connection = True
+
+    def address_string(self):
+        # Unix套接字没有客户端地址
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+    """创建HTTP服务；指定unix_socket时监听Unix套接字"""
+    handler = type('BoundRequestHandler', (RequestHandler,), {'service': service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, handler)
+        logging.info(f"爬虫服务监听 Unix 套接字: {unix_socket}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        logging.info(f"爬虫服务监听 http://{server.server_address[0]}:{server.server_address[1]}")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='常驻爬虫服务')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--unix_socket', help='监听Unix套接字路径，指定后不监听TCP端口')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES), help='预热的搜索引擎')
+    parser.add_argument('--browsers', type=int, default=DEFAULT_BROWSERS, help='每个搜索引擎预热的浏览器数')
+    parser.add_argument('--driver', choices=drivers.BACKENDS, default='selenium', help='浏览器驱动后端')
+    parser.add_argument('--governor', action='store_true', help='开启资源调度，--browsers 作为浏览器会话总数上限')
+    parser.add_argument('--proxies', nargs='*', default=[], help='代理出口列表，如 http://127.0.0.1:8001')
+    parser.add_argument('--proxy_rate', type=int, default=proxy_pool.DEFAULT_RATE_PER_MINUTE, help='每个代理出口每分钟的请求数')
+
+    args = parser.parse_args()
+
+    for directory in ('logs', 'debug_html', 'downloads', 'records'):
+        os.makedirs(directory, exist_ok=True)
+    setup_logging()
+    proxy_pool.configure(args.proxies, args.proxy_rate)
+    drivers.set_backend(args.driver)
+
+    if args.governor:
+        start_governor(1, args.browsers * len(args.engines))
+    service = CrawlService(args.engines, args.browsers)
+    server = make_server(service, args.host, args.port, args.unix_socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("收到中断信号，正在关闭爬虫服务")
+    finally:
+        server.server_close()
+        service.close()
+        stop_governor()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+if __name__ == "__main__":
+    main()
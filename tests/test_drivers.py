@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import queue
+import itertools
+import threading
+import unittest
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import drivers
+
+class StandInConnection:
+    """不启动Chrome的CDP连接替身：命令立即返回预设结果，事件由测试直接发出"""
+
+    def __init__(self):
+        self.listeners = []
+        self.sent = []
+        self.target_ids = itertools.count(1)
+
+    def send(self, method, params=None, session_id=None):
+        self.sent.append((method, params or {}, session_id))
+        future = Future()
+        future.set_result(self._result(method, params or {}))
+        return future
+
+    def call(self, method, params=None, session_id=None, timeout=drivers.COMMAND_TIMEOUT):
+        return self.send(method, params, session_id).result(timeout)
+
+    def _result(self, method, params):
+        if method == 'Target.attachToTarget':
+            return {'sessionId': f"session-{params['targetId']}"}
+        if method == 'Target.createTarget':
+            return {'targetId': f"tab-{next(self.target_ids)}"}
+        if method == 'Runtime.evaluate':
+            return {'result': {'value': 'complete'}}
+        return {}
+
+    def emit(self, method, params, session_id):
+        for listener in list(self.listeners):
+            listener(method, params, session_id)
+
+    def navigations(self):
+        return [params['url'] for method, params, _ in self.sent if method == 'Page.navigate']
+
+def stand_in_driver():
+    driver = drivers.CDPDriver.__new__(drivers.CDPDriver)
+    driver.conn = StandInConnection()
+    driver.tabs = {}
+    driver.prefetched = {}
+    driver.lock = threading.Lock()
+    driver.handles = ['tab-0']
+    driver.current = driver._tab('tab-0')
+    return driver
+
+class NetworkIdleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = StandInConnection()
+        self.tab = drivers.CDPTab(self.conn, 'tab-0')
+
+    def request(self, method, request_id):
+        self.conn.emit(method, {'requestId': request_id}, self.tab.session_id)
+
+    def test_idle_after_quiet_period(self):
+        started = time.time()
+        self.assertTrue(self.tab.wait_for_network_idle(timeout=2, idle_time=0.1))
+        self.assertGreaterEqual(time.time() - started, 0.1)
+
+    def test_requests_in_flight_block_idle(self):
+        for request_id in ['1', '2', '3']:
+            self.request('Network.requestWillBeSent', request_id)
+        self.assertFalse(self.tab.wait_for_network_idle(timeout=0.3, idle_time=0.1))
+        # 剩余请求数不超过NETWORK_IDLE_INFLIGHT即可视为空闲
+        threading.Timer(0.1, self.request, ('Network.loadingFinished', '1')).start()
+        self.assertTrue(self.tab.wait_for_network_idle(timeout=2, idle_time=0.1))
+
+    def test_events_of_other_sessions_are_ignored(self):
+        for request_id in ['1', '2', '3']:
+            self.conn.emit('Network.requestWillBeSent', {'requestId': request_id}, 'other-session')
+        self.assertTrue(self.tab.wait_for_network_idle(timeout=1, idle_time=0.1))
+
+    def test_not_loaded_page_is_not_idle(self):
+        self.tab.navigate_async('https://example.com/')
+        self.assertFalse(self.tab.wait_for_network_idle(timeout=0.2, idle_time=0.05))
+        self.conn.emit('Page.loadEventFired', {}, self.tab.session_id)
+        self.assertTrue(self.tab.wait_for_network_idle(timeout=1, idle_time=0.05))
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = stand_in_driver()
+        self.throttled = []
+
+    def throttle(self):
+        self.throttled.append(len(self.driver.conn.navigations()))
+
+    def load(self, url):
+        self.driver.conn.emit('Page.loadEventFired', {}, self.driver.prefetched[url].session_id)
+
+    def test_every_prefetch_navigation_is_throttled(self):
+        drivers.prefetch(self.driver, ['https://a/1', 'https://a/2', 'https://a/3'], self.throttle)
+        self.assertEqual(self.driver.conn.navigations(), ['https://a/1', 'https://a/2', 'https://a/3'])
+        # 每个导航发出之前都先等待了一次速率预算
+        self.assertEqual(self.throttled, [0, 1, 2])
+
+    def test_prefetched_pages_are_not_throttled_again(self):
+        drivers.prefetch(self.driver, ['https://a/1', 'https://a/2'], self.throttle)
+        self.load('https://a/1')
+        self.driver.get('https://a/1')
+        drivers.prefetch(self.driver, ['https://a/2', 'https://a/3'], self.throttle)
+        self.assertEqual(len(self.throttled), 3)
+        self.assertEqual(self.driver.conn.navigations(), ['https://a/1', 'https://a/2', 'https://a/3'])
+
+    def test_stale_prefetched_tabs_are_closed(self):
+        drivers.prefetch(self.driver, ['https://a/1', 'https://a/2'], self.throttle)
+        stale = self.driver.prefetched['https://a/2'].target_id
+        drivers.prefetch(self.driver, ['https://a/3'], self.throttle)
+        self.assertEqual(list(self.driver.prefetched), ['https://a/3'])
+        closed = [params['targetId'] for method, params, _ in self.driver.conn.sent if method == 'Target.closeTarget']
+        self.assertIn(stale, closed)
+
+    def test_get_switches_to_prefetched_tab(self):
+        drivers.prefetch(self.driver, ['https://a/1'], self.throttle)
+        tab = self.driver.prefetched['https://a/1']
+        self.load('https://a/1')
+        self.driver.get('https://a/1')
+        self.assertIs(self.driver.current, tab)
+        self.assertNotIn('tab-0', self.driver.handles)
+
+    def test_selenium_backend_throttles_current_page_only(self):
+        drivers.prefetch(object(), ['https://a/1', 'https://a/2'], self.throttle)
+        self.assertEqual(len(self.throttled), 1)
+
+class StandInWebSocket:
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def recv(self):
+        message = self.messages.get()
+        if message is None:
+            raise ConnectionError('closed')
+        return message
+
+class ConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ws = StandInWebSocket()
+        self.conn = drivers.CDPConnection.__new__(drivers.CDPConnection)
+        self.conn.ws = self.ws
+        self.conn.ids = itertools.count(1)
+        self.conn.pending = {}
+        self.conn.listeners = []
+        self.conn.lock = threading.Lock()
+        self.conn.closed = False
+        self.conn.reader = threading.Thread(target=self.conn._read, daemon=True)
+        self.conn.reader.start()
+        self.addCleanup(self.ws.messages.put, None)
+
+    def test_results_errors_and_events_are_dispatched(self):
+        events = []
+        self.conn.listeners.append(lambda method, params, session_id: events.append((method, session_id)))
+        ok = self.conn.send('Page.enable')
+        failed = self.conn.send('Page.navigate', {'url': 'x'}, 'session-1')
+        self.ws.messages.put('{"method": "Page.loadEventFired", "params": {}, "sessionId": "session-1"}')
+        self.ws.messages.put('{"id": 2, "error": {"message": "bad url"}}')
+        self.ws.messages.put('{"id": 1, "result": {"frameId": "f"}}')
+        self.assertEqual(ok.result(1), {'frameId': 'f'})
+        with self.assertRaises(drivers.CDPError):
+            failed.result(1)
+        self.assertEqual(events, [('Page.loadEventFired', 'session-1')])
+        self.assertIn('"sessionId": "session-1"', self.ws.sent[1])
+
+    def test_pending_commands_fail_when_connection_closes(self):
+        future = self.conn.send('Page.enable')
+        self.ws.messages.put(None)
+        with self.assertRaises(drivers.CDPError):
+            future.result(1)
+        self.conn.reader.join(1)
+        with self.assertRaises(drivers.CDPError):
+            self.conn.send('Page.enable')
+
+if __name__ == '__main__':
+    unittest.main()
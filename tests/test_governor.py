@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import governor
+
+GB = 1024 * 1024 * 1024
+
+def sample(throughput, available=8 * GB, cpu=20):
+    return {'available': available, 'total': 16 * GB, 'cpu': cpu, 'rss': 0, 'chrome_rss': 0,
+            'browser_rss': governor.DEFAULT_BROWSER_RSS, 'throughput': throughput}
+
+class GovernorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.governor = governor.Governor(1, 4, 2, 8)
+        self.addCleanup(self.governor.download_executor.shutdown)
+
+    def test_bounds_capped_by_host(self):
+        host_browsers, host_downloads = governor.host_limits()
+        g = governor.Governor(1, 1000, 2, 1000)
+        self.addCleanup(g.download_executor.shutdown)
+        self.assertEqual((g.max_browsers, g.max_downloads), (host_browsers, host_downloads))
+
+    def test_downloads_grow_until_throughput_stops_improving(self):
+        self.governor.downloads.waiting = 1
+        self.governor.adjust(sample(10e6))
+        self.assertEqual(self.governor.downloads.limit, 3)
+        self.governor.adjust(sample(15e6))
+        self.assertEqual(self.governor.downloads.limit, 4)
+        # 吞吐没有提升，回退一步并在保持期内不再增加
+        self.governor.adjust(sample(15.1e6))
+        self.assertEqual(self.governor.downloads.limit, 3)
+        self.governor.adjust(sample(15.1e6))
+        self.assertEqual(self.governor.downloads.limit, 3)
+
+    def test_memory_critical_drops_to_minimum(self):
+        self.governor.downloads.set_limit(6)
+        self.governor.browsers.set_limit(3)
+        self.governor.adjust(sample(10e6, available=GB))
+        self.assertEqual((self.governor.browsers.limit, self.governor.downloads.limit), (1, 2))
+
+    def test_submit_download_respects_download_slots(self):
+        governor._governor = self.governor
+        self.addCleanup(setattr, governor, '_governor', None)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def task():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return True
+
+        futures = [governor.submit_download(task) for _ in range(6)]
+        self.assertTrue(all(f.result() for f in futures))
+        self.assertLessEqual(running[1], self.governor.downloads.limit)
+
+    def test_submit_download_runs_inline_without_governor(self):
+        future = governor.submit_download(threading.current_thread)
+        self.assertIs(future.result(), threading.current_thread())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import manifest
+
+def row(keyword, url, content_hash=None, reason=None, minutes=0):
+    return {'engine': 'bing', 'keyword': keyword, 'source_url': url, 'content_hash': content_hash,
+            'rejection_reason': reason, 'width': 800, 'height': 600, 'format': 'jpeg',
+            'recorded_at': datetime(2024, 1, 1) + timedelta(minutes=minutes)}
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.writer = manifest.ManifestWriter(self.dir, flush_rows=2)
+
+    def write(self, *rows):
+        for r in rows:
+            self.writer.append(r)
+        self.writer.flush()
+
+    def compacted(self):
+        return manifest._part_files(self.dir, 'compacted-')
+
+    def test_parts_are_readable_before_compaction(self):
+        self.write(row('泥土', 'http://a/1.jpg', 'h1'), row('泥土', 'http://a/2.jpg', 'h2'), row('土壤', 'http://a/3.jpg'))
+        self.assertEqual(len(manifest._part_files(self.dir, 'part-')), 2)
+        table = manifest.load_manifest(self.dir, filter=manifest.pc.field('keyword') == '泥土')
+        self.assertEqual(sorted(table['source_url'].to_pylist()), ['http://a/1.jpg', 'http://a/2.jpg'])
+
+    def test_compact_dedupes_on_keyword_and_url(self):
+        self.write(row('泥土', 'http://a/1.jpg', reason='download_failed', minutes=0),
+                   row('泥土', 'http://a/1.jpg', 'h1', minutes=1),
+                   row('泥土', 'http://a/1.jpg', reason='download_failed', minutes=2),
+                   row('土壤', 'http://a/1.jpg', 'h1', minutes=3),
+                   row('泥土', None, reason='page_error'), row('泥土', None, reason='page_error'))
+        manifest.compact(self.dir, min_parts=1)
+        self.assertEqual(manifest._part_files(self.dir, 'part-'), [])
+        table = manifest.load_manifest(self.dir)
+        rows = sorted((r['keyword'], r['source_url'] or '', r['content_hash'] or '') for r in table.to_pylist())
+        self.assertEqual(rows, [('土壤', 'http://a/1.jpg', 'h1'), ('泥土', '', ''), ('泥土', '', ''),
+                                ('泥土', 'http://a/1.jpg', 'h1')])
+
+    def test_compact_only_rewrites_new_parts(self):
+        self.write(row('泥土', 'http://a/1.jpg', 'h1'), row('泥土', 'http://a/2.jpg', reason='download_failed'))
+        first = manifest.compact(self.dir, min_parts=1)
+        mtime = os.path.getmtime(first)
+
+        # 已下载的图片再次出现时丢弃；之前下载失败、这次下载成功的保留
+        self.write(row('泥土', 'http://a/1.jpg', 'h1', minutes=5), row('泥土', 'http://a/2.jpg', 'h2', minutes=5),
+                   row('泥土', 'http://a/3.jpg', 'h3', minutes=5))
+        second = manifest.compact(self.dir, min_parts=1)
+        self.assertEqual(sorted(self.compacted()), sorted([first, second]))
+        self.assertEqual(os.path.getmtime(first), mtime)
+        table = manifest.load_manifest(self.dir, filter=manifest.pc.field('content_hash').is_valid())
+        self.assertEqual(sorted(table['source_url'].to_pylist()), ['http://a/1.jpg', 'http://a/2.jpg', 'http://a/3.jpg'])
+
+    def test_compact_waits_for_enough_parts(self):
+        self.write(row('泥土', 'http://a/1.jpg', 'h1'))
+        self.assertIsNone(manifest.compact(self.dir, min_parts=2))
+
+    def test_already_downloaded_skips_are_not_recorded(self):
+        writer, manifest._writer = manifest._writer, self.writer
+        self.addCleanup(setattr, manifest, '_writer', writer)
+        manifest.record_candidates('bing', '泥土', [
+            {'source_url': 'http://a/1.jpg', 'reason': 'already_downloaded'},
+            {'source_url': 'http://a/2.jpg', 'reason': 'too_small (10x10)'},
+        ])
+        self.writer.flush()
+        self.assertEqual(manifest.load_manifest(self.dir)['source_url'].to_pylist(), ['http://a/2.jpg'])
+
+if __name__ == '__main__':
+    unittest.main()
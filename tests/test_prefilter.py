@@ -0,0 +1,79 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prefilter
+
+def candidate(source_url, width=800, height=600, fmt=None, byte_size=None):
+    return {
+        'detail_url': 'https://example.com/detail',
+        'source_url': source_url,
+        'width': width,
+        'height': height,
+        'format': fmt if fmt is not None else prefilter.guess_format(source_url),
+        'byte_size': byte_size,
+    }
+
+class CheckCandidateTest(unittest.TestCase):
+
+    def test_accepts_when_metadata_passes_or_is_missing(self):
+        self.assertIsNone(prefilter.check_candidate(candidate('https://img.example/a.jpg')))
+        self.assertIsNone(prefilter.check_candidate(candidate('https://img.example/a', width=None, height=None)))
+
+    def test_rejects_by_metadata(self):
+        self.assertEqual(prefilter.check_candidate(candidate('https://img.example/a.jpg', 300, 600)), 'too_small (300x600)')
+        self.assertEqual(prefilter.check_candidate(candidate('https://img.example/a.gif?x=1')), 'format (gif)')
+        self.assertEqual(prefilter.check_candidate(candidate('https://img.example/a.svg')), 'format (svg)')
+        self.assertEqual(prefilter.check_candidate(candidate('https://img.example/a.jpg', byte_size=30 * 1024 * 1024)),
+                         f'too_large ({30 * 1024 * 1024})')
+
+    def test_rejects_broken_and_data_urls(self):
+        self.assertEqual(prefilter.check_candidate(candidate('https://th.bing.com/th/id/OIP.abc?rs=1')), 'bad_url_pattern')
+        self.assertEqual(prefilter.check_candidate(candidate('data:image/png;base64,AAAA')), 'bad_url_pattern')
+
+    def test_broken_patterns_only_cover_broken_thumbnails(self):
+        # 必应详情页用BROKEN_URL_PATTERNS判断裂图，GIF、SVG和data URI不应触发刷新重试
+        for url in ['https://img.example/a.gif', 'https://img.example/a.svg', 'data:image/png;base64,AAAA']:
+            self.assertFalse(any(re.search(p, url) for p in prefilter.BROKEN_URL_PATTERNS), url)
+
+class BaiduObjurlTest(unittest.TestCase):
+
+    @staticmethod
+    def obfuscate(url):
+        """decode_baidu_objurl的逆过程"""
+        inverse = {v: k for k, v in prefilter.BAIDU_CHAR_TABLE.items()}
+        tokens = {v: k for k, v in prefilter.BAIDU_STR_TABLE.items()}
+        return ''.join(tokens.get(c) or inverse.get(c, c) for c in url)
+
+    def test_decodes_obfuscated_objurl(self):
+        url = 'https://img0.example.com/pic/2024/0815abc.jpg'
+        self.assertEqual(prefilter.decode_baidu_objurl(self.obfuscate(url)), url)
+        self.assertEqual(prefilter.decode_baidu_objurl(url), url)
+
+    def test_parses_detail_link(self):
+        source = 'http://pic.example.com/a/b1.png'
+        detail = ('https://image.baidu.com/search/detail?ct=503316480&width=1024&height=768&filesize=2048'
+                  f'&objurl={self.obfuscate(source).replace("$", "%24").replace("&", "%26")}')
+        parsed = prefilter.parse_baidu_detail_link(detail)
+        self.assertEqual((parsed['source_url'], parsed['width'], parsed['height'], parsed['format'], parsed['byte_size']),
+                         (source, 1024, 768, 'png', 2048))
+
+class FilterCandidatesTest(unittest.TestCase):
+
+    def test_already_downloaded_matches_recorded_source_url(self):
+        # 下载记录以详情页的图片地址为键，原图地址记录在source_url中
+        downloaded = {'https://img.baidu.example/it/u=1.jpg': {'filename': '1.jpg', 'source_url': 'https://origin.example/a.jpg'}}
+        accepted, skipped = prefilter.filter_candidates(
+            [candidate('https://origin.example/a.jpg'), candidate('https://origin.example/b.jpg')], downloaded)
+        self.assertEqual([c['source_url'] for c in accepted], ['https://origin.example/b.jpg'])
+        self.assertEqual([(c['source_url'], c['reason']) for c in skipped], [('https://origin.example/a.jpg', 'already_downloaded')])
+
+    def test_already_downloaded_matches_record_key(self):
+        downloaded = {'https://origin.example/a.jpg': {'filename': '1.jpg'}}
+        _, skipped = prefilter.filter_candidates([candidate('https://origin.example/a.jpg')], downloaded)
+        self.assertEqual(skipped[0]['reason'], 'already_downloaded')
+
+if __name__ == '__main__':
+    unittest.main()
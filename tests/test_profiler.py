@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import profiler
+
+def busy(stop):
+    profiler.set_stage('extract')
+    while not stop.is_set():
+        sum(range(1000))
+
+class SamplingProfilerTest(unittest.TestCase):
+
+    def run_profiler(self, target, *args):
+        stop = threading.Event()
+        thread = threading.Thread(target=target, args=(stop,) + args, name='worker_1')
+        p = profiler.SamplingProfiler('test', interval=0.005)
+        thread.start()
+        p.start()
+        time.sleep(0.2)
+        stop.set()
+        thread.join()
+        time.sleep(0.05)
+        p.stop()
+        return p, thread
+
+    def test_samples_busy_thread_under_its_stage(self):
+        p, _ = self.run_profiler(busy)
+        self.assertGreater(p.stage_wall['extract'], 0)
+        self.assertTrue(any('busy (test_profiler.py' in key for key in p.wall))
+
+    def test_idle_thread_without_stage_is_skipped(self):
+        p, _ = self.run_profiler(lambda stop: stop.wait())
+        self.assertFalse(any(key.split(';')[1] == 'worker' for key in p.wall))
+
+    def test_exited_threads_are_forgotten(self):
+        _, thread = self.run_profiler(busy)
+        self.assertNotIn(thread.ident, profiler._stages)
+
+    def test_labels_are_cached_per_code_object(self):
+        code = busy.__code__
+        self.assertIs(profiler._frame_label(code), profiler._frame_label(code))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import sys
+import threading
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import proxy_pool
+import resilience
+
+IMAGE = b'\xff\xd8' + b'x' * 4096
+
+class OriginHandler(BaseHTTPRequestHandler):
+    """本地图片主机"""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(IMAGE)))
+        self.end_headers()
+        self.wfile.write(IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+class StandInProxyHandler(BaseHTTPRequestHandler):
+    """本地替身代理：转发普通HTTP请求；banning为True时模拟出口被搜索引擎封禁，返回验证页面；
+    limiting为True时模拟出口被图片主机限流，返回429"""
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        if self.server.limiting:
+            self.send_response(429)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.server.banning:
+            body = '<html><head><title>百度安全验证</title></head></html>'.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        else:
+            opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+            with opener.open(self.path, timeout=5) as upstream:
+                body = upstream.read()
+                self.send_response(upstream.status)
+                self.send_header('Content-Type', upstream.headers.get('Content-Type', 'text/html'))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.hits = []
+    server.banning = False
+    server.limiting = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class FakeDriver:
+    """按浏览器的方式经由出口打开页面，只解析出标题"""
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.current_url = None
+        self.title = ''
+        self.closed = False
+
+    def get(self, url):
+        response = requests.get(url, proxies=proxy_pool.requests_proxies(self.proxy), timeout=5)
+        text = response.content.decode('utf-8', 'ignore')
+        self.current_url = url
+        self.title = text.split('<title>')[1].split('</title>')[0] if '<title>' in text else ''
+
+    def quit(self):
+        self.closed = True
+
+class ProxyPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.origin = start_server(OriginHandler)
+        self.proxies = [start_server(StandInProxyHandler) for _ in range(2)]
+        proxy_pool.configure([f"http://127.0.0.1:{p.server_address[1]}" for p in self.proxies])
+        self.exit_a, self.exit_b = proxy_pool.get_pool().exits
+        self.page_url = f"http://127.0.0.1:{self.origin.server_address[1]}/search"
+
+    def tearDown(self):
+        proxy_pool.configure([])
+        for server in [self.origin] + self.proxies:
+            server.shutdown()
+            server.server_close()
+
+    def test_open_with_rotation_moves_off_banned_exit(self):
+        self.proxies[0].banning = True
+        driver = proxy_pool.open_with_rotation(FakeDriver, 'baidu-a', self.page_url)
+        self.assertIs(driver.proxy, self.exit_b)
+        self.assertTrue(self.exit_a.is_banned())
+        self.assertFalse(self.exit_b.is_banned())
+        self.assertEqual(len(self.proxies[0].hits), 1)
+        self.assertEqual(len(self.proxies[1].hits), 1)
+
+    def test_handle_ban_bans_the_exit_the_driver_was_launched_with(self):
+        # 两个会话都在出口A上
+        self.exit_b.health = 0
+        first = proxy_pool.launch(FakeDriver, 'session-1')
+        second = proxy_pool.launch(FakeDriver, 'session-2')
+        self.exit_b.health = 1.0
+        self.assertIs(first.proxy, self.exit_a)
+        self.assertIs(second.proxy, self.exit_a)
+
+        self.proxies[0].banning = True
+        first.get(self.page_url)
+        self.assertTrue(proxy_pool.is_ban_page(first))
+        first = proxy_pool.handle_ban(first, FakeDriver, 'session-1', self.page_url)
+        # 第二个会话发现封禁时，出口A已经被标记，不能把健康的出口B当作当前出口封掉
+        second = proxy_pool.handle_ban(second, FakeDriver, 'session-2', self.page_url)
+
+        self.assertIs(first.proxy, self.exit_b)
+        self.assertIs(second.proxy, self.exit_b)
+        self.assertTrue(self.exit_a.is_banned())
+        self.assertEqual(self.exit_a.ban_count, 1)
+        self.assertFalse(self.exit_b.is_banned())
+        self.assertIs(proxy_pool.session_exit('session-2'), self.exit_b)
+
+    def test_image_downloads_use_separate_budget(self):
+        search_bucket = self.exit_a.buckets['search']
+        tokens = search_bucket.tokens
+        session_key = f"download-{threading.current_thread().name}"
+        self.addCleanup(proxy_pool.release, session_key)
+        for i in range(proxy_pool.BURST * 2):
+            content, _ = resilience.fetch(f"http://127.0.0.1:{self.origin.server_address[1]}/{i}.jpg")
+            self.assertEqual(content, IMAGE)
+        # 图片下载经由代理出口，但不消耗搜索引擎的请求预算
+        exit_hits = len(self.proxies[0].hits) + len(self.proxies[1].hits)
+        self.assertEqual(exit_hits, proxy_pool.BURST * 2)
+        self.assertGreaterEqual(search_bucket.tokens, tokens)
+
+    def test_download_sessions_are_released(self):
+        for i in range(3):
+            resilience.fetch(f"http://127.0.0.1:{self.origin.server_address[1]}/{i}.jpg")
+        self.assertEqual((self.exit_a.sessions, self.exit_b.sessions), (0, 0))
+
+    def test_rate_limited_download_bans_exit_and_retries_elsewhere(self):
+        self.proxies[0].limiting = True
+        content, _ = resilience.fetch(f"http://127.0.0.1:{self.origin.server_address[1]}/limited.jpg")
+        self.assertEqual(content, IMAGE)
+        self.assertTrue(self.exit_a.is_banned())
+        self.assertFalse(self.exit_b.is_banned())
+        self.assertEqual((len(self.proxies[0].hits), len(self.proxies[1].hits)), (1, 1))
+        self.assertEqual((self.exit_a.sessions, self.exit_b.sessions), (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import struct
+import threading
+import unittest
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import quality
+
+NO_TEMPLATES = np.zeros((0, quality.TEMPLATE_SIZE * quality.TEMPLATE_SIZE), np.float32)
+
+def encode(img, ext='.png', params=()):
+    return cv2.imencode(ext, img, list(params))[1].tobytes()
+
+def blank(width=600, height=600):
+    return np.full((height, width, 3), 255, np.uint8)
+
+def uniform_color(width=600, height=600):
+    img = np.zeros((height, width, 3), np.uint8)
+    img[:] = (40, 90, 200)
+    return img
+
+def sharp(width=600, height=600, seed=0):
+    """随机纹理：清晰度、熵都高，灰度分布均匀"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+def blurred(width=600, height=600):
+    """平滑渐变：灰度级分布广，但几乎没有边缘"""
+    ramp = np.tile(np.linspace(0, 255, width, dtype=np.float32), (height, 1))
+    gray = cv2.GaussianBlur(ramp, (0, 0), 8).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+class ImageInfoTest(unittest.TestCase):
+
+    def test_reads_size_and_format_from_header(self):
+        img = sharp(320, 200)
+        cases = [
+            (encode(img, '.jpg'), 'jpg'),
+            (encode(img, '.jpg', [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]), 'jpg'),
+            (encode(img, '.png'), 'png'),
+            (encode(img, '.webp', [cv2.IMWRITE_WEBP_QUALITY, 80]), 'webp'),
+            (encode(img, '.webp', [cv2.IMWRITE_WEBP_QUALITY, 101]), 'webp'),
+            (encode(img, '.bmp'), 'bmp'),
+            (b'GIF89a' + struct.pack('<HH', 320, 200) + b'\x00' * 16, 'gif'),
+        ]
+        for data, fmt in cases:
+            self.assertEqual(quality.image_info(data), (320, 200, fmt))
+
+    def test_unknown_data_has_no_info(self):
+        self.assertEqual(quality.image_info(b'<html>not an image</html>'), (None, None, None))
+        self.assertEqual(quality.image_info(b'\xff\xd8\xff'), (None, None, None))
+
+class ScoreImagesTest(unittest.TestCase):
+
+    def score(self, img, ext='.png'):
+        return quality.score_images([encode(img, ext)], NO_TEMPLATES)[0]
+
+    def test_synthetic_images(self):
+        rules = quality.DEFAULT_QUALITY_RULES
+        self.assertTrue(quality.check_quality(self.score(blank()), rules).startswith('near_uniform'))
+        self.assertTrue(quality.check_quality(self.score(uniform_color()), rules).startswith('near_uniform'))
+        self.assertTrue(quality.check_quality(self.score(blurred()), rules).startswith('blurry'))
+        self.assertIsNone(quality.check_quality(self.score(sharp(), '.jpg'), rules))
+
+    def test_blurred_image_keeps_content_metrics(self):
+        score = self.score(blurred())
+        self.assertGreater(score['entropy'], quality.DEFAULT_QUALITY_RULES['min_entropy'])
+        self.assertLess(score['uniformity'], quality.DEFAULT_QUALITY_RULES['max_uniformity'])
+        self.assertLess(score['sharpness'], quality.DEFAULT_QUALITY_RULES['min_sharpness'])
+
+    def test_aspect_ratio(self):
+        score = self.score(sharp(1000, 200))
+        self.assertEqual(score['aspect_ratio'], 5.0)
+        self.assertTrue(quality.check_quality(score, quality.DEFAULT_QUALITY_RULES).startswith('aspect_ratio'))
+
+    def test_undecodable_images_score_none(self):
+        scores = quality.score_images([b'broken', encode(sharp())], NO_TEMPLATES)
+        self.assertIsNone(scores[0])
+        self.assertIsNotNone(scores[1])
+        self.assertEqual(quality.check_quality(None, quality.DEFAULT_QUALITY_RULES), 'undecodable')
+
+    def test_placeholder_matches_template(self):
+        placeholder = encode(sharp(seed=1))
+        thumb, _ = quality.decode_thumbnail(placeholder)
+        templates = quality._template_vectors(thumb[None].astype(np.float32))
+        same, other = quality.score_images([placeholder, encode(sharp(seed=2))], templates)
+        self.assertGreater(same['placeholder_similarity'], 0.99)
+        self.assertLess(other['placeholder_similarity'], 0.5)
+        self.assertTrue(quality.check_quality(same, quality.DEFAULT_QUALITY_RULES).startswith('placeholder'))
+        self.assertIsNone(quality.check_quality(other, quality.DEFAULT_QUALITY_RULES))
+
+class ThresholdTest(unittest.TestCase):
+    """阈值本身视为合格，越过阈值才拒绝"""
+
+    PASSING = {'sharpness': 100.0, 'entropy': 4.0, 'uniformity': 0.1, 'aspect_ratio': 1.0, 'placeholder_similarity': 0.0}
+
+    def check(self, **fields):
+        return quality.check_quality(dict(self.PASSING, **fields), quality.DEFAULT_QUALITY_RULES)
+
+    def test_blur_threshold(self):
+        limit = quality.DEFAULT_QUALITY_RULES['min_sharpness']
+        self.assertIsNone(self.check(sharpness=limit))
+        self.assertEqual(self.check(sharpness=limit - 0.1), f"blurry ({limit - 0.1:.1f})")
+
+    def test_placeholder_threshold(self):
+        limit = quality.DEFAULT_QUALITY_RULES['max_placeholder_similarity']
+        self.assertIsNone(self.check(placeholder_similarity=limit))
+        self.assertEqual(self.check(placeholder_similarity=limit + 0.01), f"placeholder ({limit + 0.01:.2f})")
+
+    def test_rules_override_defaults(self):
+        rules = dict(quality.DEFAULT_QUALITY_RULES, min_sharpness=200.0)
+        self.assertTrue(quality.check_quality(self.PASSING, rules).startswith('blurry'))
+
+    def test_check_image_size_rule(self):
+        self.assertEqual(quality.check_image(self.PASSING, 400, 600, (512, 512), quality.DEFAULT_QUALITY_RULES), 'too_small (400x600)')
+        self.assertIsNone(quality.check_image(self.PASSING, 400, 600, None, quality.DEFAULT_QUALITY_RULES))
+
+class ScoreBatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        templates, quality._templates = quality._templates, NO_TEMPLATES
+        self.addCleanup(setattr, quality, '_templates', templates)
+        self.batches = []
+        score_thumbnails = quality.score_thumbnails
+
+        def counting(thumbs, aspect_ratios, templates=None):
+            self.batches.append(len(thumbs))
+            return score_thumbnails(thumbs, aspect_ratios, templates)
+
+        self.addCleanup(setattr, quality, 'score_thumbnails', score_thumbnails)
+        quality.score_thumbnails = counting
+
+    def test_concurrent_scores_are_batched(self):
+        datas = [encode(sharp(400, 300, seed=i), '.jpg') for i in range(8)]
+        expected = quality.score_images(datas, NO_TEMPLATES)
+        self.batches.clear()
+        batcher = quality.ScoreBatcher(max_wait=0.05)
+        threads, per_thread, results = 8, 16, {}
+
+        def worker(t):
+            results[t] = [batcher.score(datas[(t + i) % len(datas)]) for i in range(per_thread)]
+
+        started = time.time()
+        pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.time() - started
+
+        for t in range(threads):
+            self.assertEqual(results[t], [expected[(t + i) % len(datas)] for i in range(per_thread)])
+        self.assertEqual(sum(self.batches), threads * per_thread)
+        # 同时打分的线程合并成批，批次数明显少于图片数
+        self.assertLess(len(self.batches), threads * per_thread / 2)
+        self.assertLess(elapsed, 10)
+
+if __name__ == '__main__':
+    unittest.main()
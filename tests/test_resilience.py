@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import proxy_pool
+import resilience
+
+URL = 'http://broken.example/a.jpg'
+
+class ProbeClaimTest(unittest.TestCase):
+    """熔断冷却结束后只放行一个试探请求，只有持有试探名额的请求能归还"""
+
+    def setUp(self):
+        resilience._hosts.clear()
+        self.addCleanup(resilience._hosts.clear)
+        for _ in range(resilience.BREAKER_FAILURES):
+            resilience.record_failure(URL)
+        resilience._stats(resilience.host_of(URL)).opened_at = time.time() - resilience.BREAKER_COOLDOWN
+
+    def test_only_one_probe_is_admitted(self):
+        self.assertIsNotNone(resilience.claim_request(URL))
+        self.assertIsNone(resilience.claim_request(URL))
+
+    def test_non_probe_claim_does_not_release_probe(self):
+        other = resilience.claim_request('http://healthy.example/b.jpg')
+        probe = resilience.claim_request(URL)
+        resilience.release_claim(URL, other)
+        self.assertIsNone(resilience.claim_request(URL))
+        resilience.release_claim(URL, probe)
+        self.assertIsNotNone(resilience.claim_request(URL))
+
+class HedgeTimerTest(unittest.TestCase):
+
+    def setUp(self):
+        resilience._hosts.clear()
+        self.addCleanup(resilience._hosts.clear)
+        self.throttled = []
+        self.patch(proxy_pool, 'throttle', self.slow_throttle)
+        self.patch(resilience.resumable, 'download', self.download)
+        self.patch(resilience, 'DEFAULT_HEDGE_DELAY', 0.3)
+
+    def patch(self, module, name, value):
+        self.addCleanup(setattr, module, name, getattr(module, name))
+        setattr(module, name, value)
+
+    def slow_throttle(self, proxy, kind):
+        # 模拟在限流上等待，这段时间请求还没有发出
+        self.throttled.append(threading.current_thread().name)
+        time.sleep(0.5)
+
+    @staticmethod
+    def download(session, url, timeout, cancel, proxies):
+        time.sleep(0.1)
+        return b'data'
+
+    def test_hedge_delay_starts_when_primary_is_sent(self):
+        content, url = resilience._hedged_get('http://primary.example/a.jpg', 'http://mirror.example/a.jpg', None, 5)
+        self.assertEqual((content, url), (b'data', 'http://primary.example/a.jpg'))
+        self.assertEqual(len(self.throttled), 1)
+
+if __name__ == '__main__':
+    unittest.main()
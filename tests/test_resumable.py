@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import resumable
+import resilience
+
+BODY = bytes(range(256)) * 400   # 102400字节
+DROP_AFTER = 64 * 1024
+ETAG = '"v1"'
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """支持Range的本地图片主机；drop_next为True时下一个响应发送64KB后断开连接，
+    range_mode控制范围请求的响应：'ok' 正常续传，'wrong' 返回错误的起始位置，'416' 返回范围不可满足"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        self.server.ranges.append(range_header)
+        self.server.paths.append(self.path)
+        if range_header and self.server.range_mode == '416':
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{len(BODY)}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if range_header and self.server.range_mode == 'wrong':
+            self._send(206, BODY[:1000], {'Content-Range': f"bytes 0-999/{len(BODY)}"})
+            return
+        if range_header:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            self._send(206, BODY[start:], {'Content-Range': f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"})
+            return
+        self._send(200, BODY, {})
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.server.drop_next:
+            self.server.drop_next = False
+            self.wfile.write(body[:DROP_AFTER])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class ResumableDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.ranges = []
+        self.server.paths = []
+        self.server.drop_next = False
+        self.server.range_mode = 'ok'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/image.jpg"
+        self.partial_dir = tempfile.mkdtemp()
+        self._old_partial_dir = resumable.PARTIAL_DIR
+        resumable.PARTIAL_DIR = self.partial_dir
+        self.session = requests.Session()
+        self.session.trust_env = False
+
+    def tearDown(self):
+        resumable.PARTIAL_DIR = self._old_partial_dir
+        shutil.rmtree(self.partial_dir, ignore_errors=True)
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _interrupted_download(self):
+        self.server.drop_next = True
+        with self.assertRaises(Exception):
+            resumable.download(self.session, self.url)
+        data_path, _ = resumable._partial_paths(self.url)
+        self.assertEqual(os.path.getsize(data_path), DROP_AFTER)
+
+    def test_resumes_after_connection_dropped_mid_body(self):
+        self._interrupted_download()
+        self.assertEqual(resumable.download(self.session, self.url), BODY)
+        self.assertEqual(self.server.ranges, [None, f"bytes={DROP_AFTER}-"])
+        self.assertEqual(os.listdir(self.partial_dir), [])
+
+    def test_mismatched_206_is_discarded_and_refetched(self):
+        self._interrupted_download()
+        self.server.range_mode = 'wrong'
+        self.assertEqual(resumable.download(self.session, self.url), BODY)
+        # 续传请求返回的范围接不上，重新请求时不再带Range
+        self.assertEqual(self.server.ranges, [None, f"bytes={DROP_AFTER}-", None])
+        self.assertEqual(os.listdir(self.partial_dir), [])
+
+    def test_416_on_full_length_partial_returns_partial(self):
+        data_path, meta_path = resumable._partial_paths(self.url)
+        with open(data_path, 'wb') as f:
+            f.write(BODY)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': self.url, 'validator': ETAG}, f)
+        self.server.range_mode = '416'
+        self.assertEqual(resumable.download(self.session, self.url), BODY)
+        self.assertEqual(self.server.ranges, [f"bytes={len(BODY)}-"])
+        self.assertEqual(os.listdir(self.partial_dir), [])
+
+    def test_416_on_mismatched_partial_refetches(self):
+        self._interrupted_download()
+        self.server.range_mode = '416'
+        self.assertEqual(resumable.download(self.session, self.url), BODY)
+        self.assertEqual(self.server.ranges, [None, f"bytes={DROP_AFTER}-", None])
+
+    def test_cancelled_download_removes_partial(self):
+        # 对冲请求的另一方已经拿到内容，被取消的一方不留下临时文件
+        cancel = threading.Event()
+        cancel.set()
+        self.assertIsNone(resumable.download(self.session, self.url, cancel=cancel))
+        self.assertEqual(os.listdir(self.partial_dir), [])
+
+    def test_sweep_removes_stale_partials(self):
+        self._interrupted_download()
+        data_path, meta_path = resumable._partial_paths(self.url)
+        stale = time.time() - resumable.PARTIAL_MAX_AGE - 60
+        os.utime(data_path, (stale, stale))
+        os.utime(meta_path, (stale, stale))
+        fresh_path = os.path.join(self.partial_dir, 'fresh.part')
+        with open(fresh_path, 'wb') as f:
+            f.write(b'x')
+        self.assertEqual(resumable.sweep_partials(), 2)
+        self.assertEqual(os.listdir(self.partial_dir), ['fresh.part'])
+
+    def test_fetch_retries_resume_same_url(self):
+        # 主URL中断后重试仍然请求同一URL续传，不切换到备用URL从头下载
+        self.server.drop_next = True
+        alternate = self.url + '?alt=1'
+        content, used = resilience.fetch(self.url, alternates=[alternate], session=self.session)
+        self.assertEqual((content, used), (BODY, self.url))
+        self.assertEqual(self.server.paths, ['/image.jpg', '/image.jpg'])
+        self.assertEqual(self.server.ranges, [None, f"bytes={DROP_AFTER}-"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+import unittest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import service
+
+class StandInService:
+    """只接收任务、不启动浏览器的服务替身"""
+
+    def submit(self, engine, keywords, num_images, incremental=False):
+        if not keywords:
+            raise ValueError("关键词列表不能为空")
+        return service.Job(engine, keywords, num_images, incremental)
+
+class PostJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = service.make_server(StandInService(), '127.0.0.1', 0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/jobs"
+
+    def test_non_object_payload_is_rejected(self):
+        for body in ['[]', '"x"', '1', 'null']:
+            response = requests.post(self.url, data=body, timeout=5)
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_object_payload_is_accepted(self):
+        response = requests.post(self.url, json={'engine': 'bing', 'keywords': ['泥土']}, timeout=5)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+
+class JobStatusTest(unittest.TestCase):
+
+    def test_mark_running_does_not_overwrite_finished_status(self):
+        job = service.Job('bing', ['a'], 10)
+        job.mark_running()
+        self.assertEqual(job.status, 'running')
+        job.keyword_finished('a', result={})
+        job.mark_running()
+        self.assertEqual(job.status, 'done')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import url_index
+import bing_crawler
+
+BAIDU_RULES = {'min_size': (512, 512)}
+BING_RULES = {'min_size': None}
+
+def encode(width, height):
+    """生成带纹理的JPEG，能通过默认质量规则"""
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', img)[1].tobytes()
+
+class MaterializeRulesTest(unittest.TestCase):
+    """索引命中时，已存储的文件必须满足目标引擎的接收规则才会被链接"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        url_index.INDEX_FILE = os.path.join(self.tmp, 'url_index.db')
+        url_index._local = threading.local()
+
+    def store(self, url, data, width=None, height=None):
+        path = os.path.join(self.tmp, 'google_kw', os.path.basename(url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        url_index.register([url], path, 'hash', len(data), 'google', 'kw', os.path.basename(path), width, height)
+        return path
+
+    def target(self, name):
+        return os.path.join(self.tmp, 'baidu_kw', name)
+
+    def test_small_image_is_not_linked(self):
+        self.store('http://img.example/small.jpg', encode(200, 200), 200, 200)
+        entry = url_index.materialize('http://img.example/small.jpg', 'baidu', 'kw', self.target('a.jpg'), BAIDU_RULES)
+        self.assertIsNone(entry)
+        self.assertFalse(os.path.exists(self.target('a.jpg')))
+
+    def test_missing_dimensions_are_measured(self):
+        # 旧记录没有尺寸，复用前从已存储的文件中读取并补上
+        self.store('http://img.example/old.jpg', encode(200, 600))
+        self.assertIsNone(url_index.materialize('http://img.example/old.jpg', 'baidu', 'kw', self.target('b.jpg'), BAIDU_RULES))
+        entry = url_index.lookup('http://img.example/old.jpg')
+        self.assertEqual((entry['width'], entry['height']), (200, 600))
+
+    def test_low_quality_image_is_not_linked(self):
+        flat = cv2.imencode('.jpg', np.full((600, 600, 3), 128, np.uint8))[1].tobytes()
+        self.store('http://img.example/flat.jpg', flat, 600, 600)
+        self.assertIsNone(url_index.materialize('http://img.example/flat.jpg', 'baidu', 'kw', self.target('c.jpg'), BAIDU_RULES))
+
+    def test_accepted_image_is_linked(self):
+        self.store('http://img.example/big.jpg', encode(640, 600))
+        entry = url_index.materialize('http://img.example/big.jpg', 'baidu', 'kw', self.target('d.jpg'), BAIDU_RULES)
+        self.assertIsNotNone(entry)
+        self.assertEqual((entry['width'], entry['height'], entry['format']), (640, 600, 'jpg'))
+        self.assertIsNotNone(entry['score'])
+        self.assertTrue(os.path.exists(self.target('d.jpg')))
+
+    def test_rules_follow_target_engine(self):
+        # 必应下载时不检查实际尺寸，复用时也不检查
+        self.store('http://img.example/medium.jpg', encode(400, 400), 400, 400)
+        self.assertIsNone(url_index.materialize('http://img.example/medium.jpg', 'baidu', 'kw', self.target('e.jpg'), BAIDU_RULES))
+        self.assertIsNotNone(url_index.materialize('http://img.example/medium.jpg', 'bing', 'kw', self.target('e.jpg'), BING_RULES))
+
+    def test_existing_target_is_not_overwritten(self):
+        self.store('http://img.example/big2.jpg', encode(640, 600))
+        os.makedirs(os.path.dirname(self.target('f.jpg')), exist_ok=True)
+        with open(self.target('f.jpg'), 'wb') as f:
+            f.write(b'keep')
+        self.assertIsNone(url_index.materialize('http://img.example/big2.jpg', 'baidu', 'kw', self.target('f.jpg'), BAIDU_RULES))
+        with open(self.target('f.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'keep')
+
+class PrefetchSkipTest(unittest.TestCase):
+    """URL索引会复用的候选不打开详情页，也不应该被预取"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        url_index.INDEX_FILE = os.path.join(self.tmp, 'url_index.db')
+        url_index._local = threading.local()
+
+    def test_indexed_candidates_are_not_prefetched(self):
+        path = os.path.join(self.tmp, 'stored.jpg')
+        with open(path, 'wb') as f:
+            f.write(encode(64, 64))
+        url_index.register(['http://img.example/2.jpg'], path, 'hash', 1, 'google', 'kw', 'stored.jpg')
+        candidates = [{'detail_url': f'http://bing.example/detail/{i}', 'source_url': f'http://img.example/{i}.jpg'}
+                      for i in range(6)]
+        self.assertEqual(bing_crawler.upcoming_detail_urls(candidates, 1),
+                         ['http://bing.example/detail/1', 'http://bing.example/detail/3', 'http://bing.example/detail/4'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from quality import image_info, score_images, check_image
+
+# 全局URL索引：跨引擎、跨关键词记录每个图片URL对应的已存储文件
+INDEX_FILE = 'records/url_index.db'
+
+_local = threading.local()
+
+def url_key(url):
+    """URL的64位哈希，作为整数主键存储，比保存完整URL紧凑得多"""
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+def _connection():
+    """每个线程使用独立的连接"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(INDEX_FILE), exist_ok=True)
+        conn = sqlite3.connect(INDEX_FILE, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS objects (
+            url_key INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            content_hash TEXT,
+            byte_size INTEGER,
+            width INTEGER,
+            height INTEGER
+        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS associations (
+            url_key INTEGER NOT NULL,
+            engine TEXT NOT NULL,
+            keyword TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (url_key, engine, keyword)
+        ) WITHOUT ROWID''')
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def lookup(url):
+    """查询URL对应的已存储文件，文件已被删除时视为未命中"""
+    if not url:
+        return None
+    row = _connection().execute(
+        'SELECT path, content_hash, byte_size, width, height FROM objects WHERE url_key = ?', (url_key(url),)
+    ).fetchone()
+    if row is None or not os.path.exists(row[0]):
+        return None
+    return {'path': row[0], 'content_hash': row[1], 'byte_size': row[2], 'width': row[3], 'height': row[4]}
+
+def _associate(conn, key, engine, keyword, filename):
+    conn.execute(
+        'INSERT OR REPLACE INTO associations VALUES (?, ?, ?, ?, ?)',
+        (key, engine, keyword, filename, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+
+def register(urls, path, content_hash, byte_size, engine, keyword, filename, width=None, height=None):
+    """登记新下载的文件；urls可以包含同一图片的多个URL（原图、缩略图等）"""
+    conn = _connection()
+    try:
+        with conn:
+            for url in urls:
+                if not url:
+                    continue
+                key = url_key(url)
+                conn.execute(
+                    'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, path, content_hash, byte_size, width, height)
+                )
+                _associate(conn, key, engine, keyword, filename)
+    except sqlite3.Error as e:
+        logging.error(f"登记URL索引失败: {e}")
+
+def _inspect(entry):
+    """读取已存储的文件，补充格式和质量指标，供接收规则检查和清单记录使用。
+    只读取本地文件；登记时没有尺寸的旧记录顺便补上尺寸"""
+    with open(entry['path'], 'rb') as f:
+        data = f.read()
+    width, height, entry['format'] = image_info(data)
+    entry['score'] = score_images([data])[0]
+    if (entry['width'] is None or entry['height'] is None) and width is not None:
+        entry['width'], entry['height'] = width, height
+        conn = _connection()
+        with conn:
+            conn.execute('UPDATE objects SET width = ?, height = ? WHERE path = ?', (width, height, entry['path']))
+
+def _rejection(entry, accept_rules):
+    """按目标引擎的接收规则检查已存储的文件，返回拒绝原因，满足时返回None"""
+    if entry['width'] is None or entry['height'] is None:
+        return 'unknown_size'
+    return check_image(entry['score'], entry['width'], entry['height'], **accept_rules)
+
+def materialize(url, engine, keyword, target_path, accept_rules=None):
+    """索引命中时把已存储的文件硬链接到target_path并记录关联，不产生网络请求；未命中返回None。
+    返回的记录包含从文件读取的格式（format）和质量评分（score），供清单记录使用。
+    已存储的文件可能来自接收规则不同的引擎，accept_rules为目标引擎下载时使用的check_image参数，
+    给出时先检查，不满足同样返回None，由调用方正常下载；target_path已存在时不覆盖，也返回None"""
+    entry = lookup(url)
+    if entry is None:
+        return None
+    try:
+        _inspect(entry)
+        reason = _rejection(entry, accept_rules) if accept_rules is not None else None
+    except (OSError, sqlite3.Error) as e:
+        reason = f'unreadable ({e})'
+    if reason is not None:
+        logging.info(f"URL索引命中但已存储的图片不满足{engine}的接收规则 ({reason})，重新下载: {url}")
+        return None
+    if os.path.abspath(entry['path']) != os.path.abspath(target_path):
+        if os.path.exists(target_path):
+            logging.warning(f"目标文件已存在，不覆盖: {target_path}")
+            return None
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(entry['path'], target_path)
+        except OSError:
+            # 跨文件系统或不支持硬链接时退回复制
+            shutil.copy2(entry['path'], target_path)
+    conn = _connection()
+    with conn:
+        _associate(conn, url_key(url), engine, keyword, os.path.basename(target_path))
+    logging.info(f"URL索引命中，链接已存储的图片: {entry['path']} -> {target_path}")
+    return entry